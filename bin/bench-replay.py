@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+
+from __future__ import (
+    absolute_import,
+    division,
+    print_function
+)
+
+import argparse
+import cProfile
+import json
+import os
+import sys
+
+import yaml
+
+sys.path.append(
+    os.path.realpath(
+        os.path.join(
+            os.path.dirname(__file__),
+            '..'
+        )
+    )
+)
+
+from pydecider.plan import Plan
+from pydecider.replay import load_histories, replay
+from pydecider.synthetic import SHAPES, generate_history, generate_plan
+
+def synthetic_workflow(shape, size, runs, decision_timeouts):
+    """Synthetic plan of `shape` and `runs` complete histories of it.
+    """
+    plan_data = generate_plan(shape, size)
+    histories = [
+        ('synthetic-%d' % run,
+         generate_history(plan_data, seed=run,
+                          decision_timeouts=decision_timeouts))
+        for run in range(runs)
+    ]
+    return (plan_data, histories)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay recorded or synthetic SWF histories through the state machine, without SWF, and report its performance.')
+    parser.add_argument('histories', nargs='*', help='History files (JSON or YAML) or directories of history files')
+    parser.add_argument('--plan', required=False, help='The Plan file of the recorded histories')
+    parser.add_argument('--synthetic', required=False, choices=SHAPES, help='Replay synthetic histories of a plan of this shape instead')
+    parser.add_argument('--size', required=False, type=int, default=100, help='Size of the synthetic plan (steps of a chain, parallel steps of a fanout, diamonds)')
+    parser.add_argument('--decision_timeouts', required=False, type=int, default=0, help='Number of timed out decisions before each decision of the synthetic histories, to pad them')
+    parser.add_argument('--runs', required=False, type=int, default=1, help='Number of synthetic histories, each with its own seed')
+    parser.add_argument('--state_cache_size', required=False, type=int, default=0, help='Cache the replayed runs, to only apply the new events of each decision')
+    parser.add_argument('--compact_state', action='store_true', help='Use the compact State backend')
+    parser.add_argument('--profile', required=False, help='Write the cProfile stats of the replay to this file')
+    parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+    args = parser.parse_args()
+
+    if args.synthetic:
+        (plan_data, histories) = synthetic_workflow(args.synthetic,
+                                                    args.size,
+                                                    args.runs,
+                                                    args.decision_timeouts)
+    elif args.plan and args.histories:
+        with open(args.plan) as f:
+            plan_data = yaml.load(f)
+        histories = load_histories(args.histories)
+    else:
+        parser.error('Either --plan and histories or --synthetic are '
+                     'required')
+
+    plan = Plan.from_data(plan_data)
+    options = {
+        'state_cache_size': args.state_cache_size,
+        'compact_state': args.compact_state,
+    }
+    if args.profile:
+        profile = cProfile.Profile()
+        stats = profile.runcall(replay, plan, histories, **options)
+        profile.dump_stats(args.profile)
+    else:
+        stats = replay(plan, histories, **options)
+    summary = stats.summary()
+
+    if args.json:
+        print(json.dumps(summary, indent=4, sort_keys=True))
+        return
+
+    print('Histories: %d, decisions: %d, events applied: %d' %
+          (len(histories), summary['decisions'], summary['events']))
+    print('Duration: %.3f s' % summary['duration'])
+    print('Events/sec: %.1f' % summary['events_per_sec'])
+    print('Decisions/sec: %.1f' % summary['decisions_per_sec'])
+    print('Decision latency: p50 %.3f ms, p99 %.3f ms, max %.3f ms' %
+          (summary['latency_p50'] * 1000, summary['latency_p99'] * 1000,
+           summary['latency_max'] * 1000))
+    if summary['allocated_bytes'] is not None:
+        print('Peak allocated: %d bytes' % summary['allocated_bytes'])
+    print('GC tracked objects delta: %d' % summary['objects_delta'])
+    print('Peak RSS: %d KB' % summary['peak_rss_kb'])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+
+from __future__ import (
+    absolute_import,
+    division,
+    print_function
+)
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+_START = time.time()
+
+sys.path.append(
+    os.path.realpath(
+        os.path.join(
+            os.path.dirname(__file__),
+            '..'
+        )
+    )
+)
+
+# Phases of the startup, in order
+PHASES = ('import', 'plan', 'decider', 'first_poll')
+
+
+def startup(plan_path, lazy_plan):
+    """Start a decider up to its first poll, without SWF.
+
+    :returns:
+        The seconds elapsed since the start of the script at the end of each
+        phase.
+    """
+    timings = {}
+
+    from pydecider import cli
+    timings['import'] = time.time() - _START
+
+    parser = argparse.ArgumentParser()
+    cli.add_decider_arguments(parser)
+    argv = ['--domain', 'bench', '--task_list', 'bench', '--plan', plan_path,
+            '--notification_sink', 'null']
+    if lazy_plan:
+        argv.append('--lazy_plan')
+    args = parser.parse_args(argv)
+
+    # Do not register the plan in SWF
+    cli.register = lambda **_kwargs: None
+    plan = cli.load_plan(args)
+    timings['plan'] = time.time() - _START
+
+    decider = cli.decider_factory(args, plan)()
+    timings['decider'] = time.time() - _START
+
+    def poll(**_kwargs):
+        timings['first_poll'] = time.time() - _START
+        return {}
+
+    decider.poll = poll
+    decider.run()
+    decider.close()
+    return timings
+
+
+def synthetic_plan(shape, size):
+    """Write a synthetic plan to a temporary file and return its path.
+    """
+    from pydecider.synthetic import generate_plan
+
+    (fd, path) = tempfile.mkstemp(suffix='.json')
+    with os.fdopen(fd, 'w') as plan_file:
+        json.dump(generate_plan(shape, size), plan_file)
+    return path
+
+
+def median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure how long a decider takes to import its dependencies, load its plan and reach its first poll, each run in a fresh process.')
+    parser.add_argument('--plan', required=False, help='The Plan file to load (defaults to a synthetic plan)')
+    parser.add_argument('--synthetic', required=False, default='chain', help='Shape of the synthetic plan')
+    parser.add_argument('--size', required=False, type=int, default=200, help='Size of the synthetic plan')
+    parser.add_argument('--lazy_plan', action='store_true', help='Compile the plan lazily')
+    parser.add_argument('--runs', required=False, type=int, default=5, help='Number of processes started')
+    parser.add_argument('--json', action='store_true', help='Print the results as JSON')
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    plan_path = args.plan
+    if args.child:
+        print(json.dumps(startup(plan_path, args.lazy_plan)))
+        return
+
+    if plan_path is None:
+        plan_path = synthetic_plan(args.synthetic, args.size)
+
+    env = dict(os.environ)
+    # boto needs credentials to build its connections, nothing is sent
+    env.setdefault('AWS_ACCESS_KEY_ID', 'bench')
+    env.setdefault('AWS_SECRET_ACCESS_KEY', 'bench')
+    env.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+
+    command = [sys.executable, os.path.realpath(__file__), '--child',
+               '--plan', plan_path]
+    if args.lazy_plan:
+        command.append('--lazy_plan')
+
+    runs = []
+    try:
+        for _ in range(args.runs):
+            start = time.time()
+            output = subprocess.check_output(command, env=env)
+            timings = json.loads(output.splitlines()[-1])
+            # Including the interpreter startup
+            timings['process'] = time.time() - start
+            runs.append(timings)
+    finally:
+        if args.plan is None:
+            os.unlink(plan_path)
+
+    summary = dict((phase, median([run[phase] for run in runs]))
+                   for phase in PHASES + ('process',))
+
+    if args.json:
+        print(json.dumps(summary, indent=4, sort_keys=True))
+        return
+
+    print('Median of %d runs, seconds since the script started:' % args.runs)
+    for phase in PHASES:
+        print('  %-12s %.3f s' % (phase, summary[phase]))
+    print('Process start to first poll: %.3f s' % summary['process'])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+
+from __future__ import (
+    absolute_import,
+    division,
+    print_function
+)
+
+import argparse
+import array
+import collections
+import enum
+import numbers
+import os
+import sys
+import timeit
+
+sys.path.append(
+    os.path.realpath(
+        os.path.join(
+            os.path.dirname(__file__),
+            '..'
+        )
+    )
+)
+
+from pydecider.compact_state import CompactState
+from pydecider.plan_graph import DeciderStep, PlanGraph
+from pydecider.state import State
+
+BACKENDS = [
+    ('objects', State),
+    ('compact', CompactState),
+]
+
+
+def deep_sizeof(obj, seen):
+    """Size of `obj` and everything it references, except what is in `seen`.
+    """
+    if id(obj) in seen or isinstance(obj, enum.Enum):
+        return 0
+    seen.add(id(obj))
+
+    if isinstance(obj, (basestring, numbers.Number, array.array)):
+        children = ()
+    elif isinstance(obj, dict):
+        children = list(obj.keys()) + list(obj.values())
+    elif isinstance(obj, (list, tuple, set, frozenset, collections.deque)):
+        children = obj
+    else:
+        children = []
+        for cls in type(obj).__mro__:
+            slots = getattr(cls, '__slots__', ())
+            if isinstance(slots, basestring):
+                slots = (slots,)
+            children.extend(getattr(obj, slot) for slot in slots
+                            if hasattr(obj, slot))
+        if hasattr(obj, '__dict__'):
+            children.append(obj.__dict__)
+
+    return sys.getsizeof(obj) + sum(deep_sizeof(child, seen)
+                                    for child in children)
+
+
+def make_graph(steps, fan_in):
+    """Plan of `steps` steps, each requiring up to `fan_in` previous ones.
+    """
+    names = ['step_%d' % idx for idx in range(steps)]
+    return PlanGraph([
+        DeciderStep(name, requires=names[max(0, idx - fan_in):idx])
+        for (idx, name) in enumerate(names)
+    ])
+
+
+def replay(state_class, graph, completed):
+    """Replay a run of `graph` up to `completed` succeeded steps.
+    """
+    state = state_class(graph)
+    event_id = 1
+    with state(event_id):
+        state.set_input({'run': 'input'})
+    for name in graph.names[1:completed + 1]:
+        event_id += 1
+        with state(event_id):
+            state.step_update(name, 'running')
+        event_id += 1
+        with state(event_id):
+            state.step_update(name, 'succeeded', {'name': name},
+                              rendered=True)
+    return state
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the memory used by the State backends of cached workflow runs.')
+    parser.add_argument('--steps', type=int, default=200, help='Number of steps in the plan')
+    parser.add_argument('--fan_in', type=int, default=2, help='Number of previous steps required by each step')
+    parser.add_argument('--completed', type=int, default=100, help='Number of steps completed in each run')
+    parser.add_argument('--runs', type=int, default=100, help='Number of replayed runs timed per backend')
+    args = parser.parse_args()
+
+    graph = make_graph(args.steps, args.fan_in)
+    completed = min(args.completed, args.steps)
+    print('Plan: %d steps, fan-in %d, %d completed per run' %
+          (args.steps, args.fan_in, completed))
+
+    results = {}
+    for (name, state_class) in BACKENDS:
+        state = replay(state_class, graph, completed)
+        # The graph is shared by all the runs of the plan
+        shared = set()
+        deep_sizeof(graph, shared)
+        size = deep_sizeof(state, shared)
+        duration = timeit.timeit(
+            lambda: replay(state_class, graph, completed),
+            number=args.runs
+        ) / args.runs
+        results[name] = size
+        print('%-8s %10d bytes/run %10.3f ms/replay %10d runs/GiB' %
+              (name, size, duration * 1000, (1 << 30) // size))
+
+    print('compact/objects memory: %.2f' %
+          (results['compact'] / results['objects']))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+
+from __future__ import (
+    absolute_import,
+    division,
+    print_function
+)
+
+import argparse
+import multiprocessing
+import os
+import sys
+
+sys.path.append(
+    os.path.realpath(
+        os.path.join(
+            os.path.dirname(__file__),
+            '..'
+        )
+    )
+)
+
+from pydecider import cli
+from pydecider.supervisor import Supervisor
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the generic SWF Decider in several worker processes sharing a plan compiled once.')
+    cli.add_decider_arguments(parser)
+    parser.add_argument('--processes', required=False, type=int, default=multiprocessing.cpu_count(), help='Number of decider worker processes (defaults to the number of CPUs)')
+    args = parser.parse_args()
+    cli.check_decider_arguments(parser, args)
+
+    cli.setup_logging(args)
+
+    # Compile the plan once, before forking the workers
+    p = cli.load_plan(args)
+    factory = cli.decider_factory(args, p)
+
+    supervisor = Supervisor(lambda: cli.run_decider(args, factory),
+                            processes=args.processes)
+    supervisor.run()
+
+if __name__ == '__main__':
+    main()
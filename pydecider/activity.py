@@ -4,14 +4,21 @@ from __future__ import (
     print_function
 )
 
+import hashlib
+import json
 import logging
+import types
 
+from . import metrics
+from .cache import LRUCache
 from .schema import SchemaValidator
 
-import yaql
-
 _LOGGER = logging.getLogger(__name__)
 
+#: Rendered outputs of activity results, shared by all the activities and
+#: keyed by activity and digest of the result.
+RESULTS_CACHE = LRUCache(maxsize=1024)
+
 
 class Activity(object):
     """Activity abstraction.
@@ -105,6 +112,7 @@ class Activity(object):
                  'schedule_to_start_timeout',
                  'schedule_to_close_timeout',
                  'start_to_close_timeout',
+                 '_input_spec', '_outputs_data',
                  '_input_validator', '_outputs_spec')
 
     def __init__(self, name, version,
@@ -113,7 +121,8 @@ class Activity(object):
                  heartbeat_timeout='60',
                  schedule_to_close_timeout='518400',
                  schedule_to_start_timeout='43200',
-                 start_to_close_timeout='432000'):
+                 start_to_close_timeout='432000',
+                 lazy=False):
 
         self.name = name
         self.version = version
@@ -130,37 +139,92 @@ class Activity(object):
         self.schedule_to_start_timeout = schedule_to_start_timeout
         self.start_to_close_timeout = start_to_close_timeout
 
-        self._input_validator = SchemaValidator(input_spec)
-        if outputs_spec:
+        self._input_spec = input_spec
+        self._outputs_data = outputs_spec
+        # Both set by `_compile()`, when the activity is defined or, if
+        # `lazy`, first used.
+        self._input_validator = None
+        self._outputs_spec = None
+        if not lazy:
+            self._compile()
+
+    def __repr__(self):
+        return 'Activity(name={name!r})'.format(name=self.name)
+
+    def _compile(self):
+        """Build the input validator and parse the `outputs_spec`.
+        """
+        if self._outputs_data:
+            # YAQL is slow to import and only needed by activities with
+            # outputs.
+            import yaql
             try:
-                self._outputs_spec = {key: yaql.parse(expr)
-                                      for key, expr in outputs_spec.items()}
+                outputs_spec = {key: yaql.parse(expr)
+                                for key, expr in self._outputs_data.items()}
 
             except Exception as err:
                 _LOGGER.critical('Invalid YAQL expression in Activity %r: %r',
-                                 name, err)
+                                 self.name, err)
                 raise
         else:
-            self._outputs_spec = {}
+            outputs_spec = {}
 
-    def __repr__(self):
-        return 'Activity(name={name!r})'.format(name=self.name)
+        self._outputs_spec = outputs_spec
+        # Set last, it marks the activity as compiled
+        self._input_validator = SchemaValidator(self._input_spec)
 
     def render_outputs(self, output):
         """Use the `Activity`'s `outputs_spec` to generate all the defined
         representation of this activity's output.
         """
-        return {
-            key: expr.evaluate(output)
-            for key, expr in self._outputs_spec.items()
-        }
+        if self._input_validator is None:
+            self._compile()
+
+        rendered = {}
+        with metrics.timed('yaql_evaluate'):
+            for key, expr in self._outputs_spec.items():
+                value = expr.evaluate(output)
+                # Some YAQL functions (`where`, `select`, ...) return
+                # generators, which could only be consumed once.
+                if isinstance(value, types.GeneratorType):
+                    value = list(value)
+                rendered[key] = value
+        return rendered
+
+    def render_result(self, result):
+        """Parse a JSON activity result and render its outputs.
+
+        Rendered outputs are memoized in `RESULTS_CACHE` so identical results
+        are only parsed and rendered once. The returned dictionary is shared
+        and must not be modified.
+        """
+        if self._input_validator is None:
+            self._compile()
+        if not self._outputs_spec:
+            # Nothing to render, no need to parse the result either
+            return {}
+
+        data = result
+        if isinstance(data, unicode):
+            data = data.encode('utf-8')
+        key = (self, hashlib.sha1(data).hexdigest())
+        rendered = RESULTS_CACHE.get(key)
+        if rendered is None:
+            rendered = self.render_outputs(json.loads(result))
+            RESULTS_CACHE.put(key, rendered)
+        return rendered
 
     def check_input(self, activity_input):
+        if self._input_validator is None:
+            self._compile()
         return self._input_validator.validate(activity_input)
 
     @classmethod
-    def from_data(cls, data):
+    def from_data(cls, data, lazy=False):
         """Define an `Activity` from a dictionary of attributes.
+
+        With `lazy`, the input schema and the YAQL `outputs_spec` are only
+        compiled (and checked) when the activity is first used.
         """
         validator = SchemaValidator(cls._DATA_SCHEMA)
         validator.validate(data)
@@ -170,7 +234,8 @@ class Activity(object):
             'version': data['version'],
             'input_spec': data.get('input_spec', None),
             'outputs_spec': data.get('outputs_spec', None),
-            'task_list': data.get('task_list', None)
+            'task_list': data.get('task_list', None),
+            'lazy': lazy,
         }
 
         # Copy in all SWF activity options.
@@ -0,0 +1,112 @@
+"""Bounded in-memory caches used by the decider.
+"""
+
+from __future__ import (
+    absolute_import,
+    division,
+    print_function
+)
+
+import collections
+import threading
+
+
+class LRUCache(object):
+    """Mapping bounded to `maxsize` entries, evicting the least recently used.
+
+    Hits and misses are counted so callers can report on the cache efficiency.
+    All operations hold a lock, so a cache can be shared between threads.
+
+    A `maxsize` of 0 disables the cache: nothing is ever stored.
+
+    Examples:
+        >>> c = LRUCache(maxsize=2)
+        >>> c.put('a', 1)
+        >>> c.put('b', 2)
+        >>> c.get('a')
+        1
+        >>> c.put('c', 3)
+        >>> 'b' in c
+        False
+        >>> (c.hits, c.misses)
+        (1, 0)
+
+    """
+
+    __slots__ = ('maxsize', 'hits', 'misses', '_data', '_lock')
+
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return ('{ctype}(size={size}/{maxsize},'
+                'hits={hits},misses={misses})').format(
+            ctype=self.__class__.__name__,
+            size=len(self._data),
+            maxsize=self.maxsize,
+            hits=self.hits,
+            misses=self.misses,
+        )
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def get(self, key, default=None):
+        """Return the value stored for `key` and mark it as recently used.
+        """
+        with self._lock:
+            try:
+                value = self._data.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+
+            self._data[key] = value
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        """Store `value` for `key`, evicting the oldest entries if needed.
+        """
+        if self.maxsize <= 0:
+            return
+
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = value
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        """Remove `key` from the cache and return its value.
+        """
+        with self._lock:
+            return self._data.pop(key, default)
+
+    def resize(self, maxsize):
+        """Change the cache bound, evicting entries if it shrinks.
+        """
+        with self._lock:
+            self.maxsize = maxsize
+            while len(self._data) > max(maxsize, 0):
+                self._data.popitem(last=False)
+
+    def clear(self):
+        """Drop all entries and reset the counters.
+        """
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+__all__ = [
+    'LRUCache',
+]
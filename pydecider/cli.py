@@ -0,0 +1,277 @@
+"""Command line helpers shared by the decider scripts.
+"""
+
+from __future__ import (
+    absolute_import,
+    division,
+    print_function
+)
+
+import logging
+import os
+import signal
+import socket
+
+import yaml
+
+from . import activity
+from . import metrics
+from . import step
+from .notifications import (
+    FileSink,
+    NullSink,
+    SQSSink,
+)
+from .plan import Plan
+from .plan_loader import PlanLoader
+from .plan_registry import (
+    PlanRegistry,
+    PlanWatcher,
+)
+from .pool import DeciderPool
+from .profiling import DecisionProfiler
+from .register import register
+from .snapshot import (
+    DirectoryStore,
+    MmapStore,
+)
+from .swf_decider import SWFDecider as Decider
+
+_LOGGER = logging.getLogger(__name__)
+
+
+def add_decider_arguments(parser):
+    """Add the decider options to an `argparse.ArgumentParser`.
+    """
+    parser.add_argument('-d', '--domain', required=True, help='The SWF domain for your workflow')
+    parser.add_argument('-t', '--task_list', required=True, help='The Decision TaskList your decider will listen to')
+    parser.add_argument('--plan', required=False, help='The location of your Plan file')
+    parser.add_argument('--plan_dir', required=False, help='Directory of Plan files, to serve all their workflow types and versions from the same task list (instead of --plan)')
+    parser.add_argument('--output_queue', required=False, help='SQS queue to output updates to')
+    parser.add_argument('--notification_sink', required=False, choices=('sqs', 'file', 'null'), default='sqs', help='Where to send workflow notifications: the SQS output queue (default), a file or nowhere')
+    parser.add_argument('--notification_file', required=False, default='-', help='File or pipe the notifications are written to, as newline-delimited JSON, with --notification_sink=file (default: standard output)')
+    parser.add_argument('--lazy_plan', action='store_true', help='Compile the step templates, activity schemas and YAQL expressions of the plan when first used instead of at startup. Errors in them are then only reported by the decisions using them')
+    parser.add_argument('--plan_reload_interval', required=False, type=float, default=0, help='Check the Plan files every this many seconds and serve their new versions without restarting (0 disables the reload). Invalid plans are rejected and the previous versions are kept for the executions started on them')
+    parser.add_argument('--plan_processes', required=False, type=int, default=1, help='Number of processes compiling the Plan files of --plan_dir at startup (0 for one per CPU). Reloads compile in the decider processes')
+    parser.add_argument('--plan_cache', required=False, help='Directory caching the compiled Plan files, keyed by their content, to speed up the next startups and reloads. Only the decider must be able to write to it')
+    parser.add_argument('--plan_name', required=False, help='If you want to override the plan name in your Plan file')
+    parser.add_argument('--plan_version', required=False, help='If you want to override the plan version in your Plan file')
+    parser.add_argument('--log_file', required=False, help='Location of the log file')
+    parser.add_argument('--state_cache_size', required=False, type=int, default=0, help='Number of workflow runs whose replayed state is kept between decisions (0 disables incremental replay)')
+    parser.add_argument('--incremental_history', action='store_true', help='Only fetch the history events newer than the cached state of a workflow run (requires --state_cache_size)')
+    parser.add_argument('--compact_state', action='store_true', help='Keep the replayed states in compact arrays, to cache more workflow runs in the same memory')
+    parser.add_argument('--snapshot_store', required=False, choices=('directory', 'mmap'), help='Save the replayed workflow runs in a directory or in a memory mapped file, so that they are restored instead of replayed after a restart')
+    parser.add_argument('--snapshot_path', required=False, help='Directory or file of the --snapshot_store')
+    parser.add_argument('--checkpoints', action='store_true', help='Checkpoint the replayed state in the executionContext of the decisions, so that any decider resumes from it instead of replaying the whole history')
+    parser.add_argument('--results_cache_size', required=False, type=int, default=activity.RESULTS_CACHE.maxsize, help='Number of rendered activity results memoized across decisions (0 disables the cache)')
+    parser.add_argument('--inputs_cache_size', required=False, type=int, default=step.INPUTS_CACHE.maxsize, help='Number of rendered step inputs memoized across decisions (0 disables the cache)')
+    parser.add_argument('--metrics_port', required=False, type=int, help='Serve the decision timings and counters as JSON on this local port (they are also logged on SIGUSR1). Worker processes of decider-supervisor cannot share the port: only the first one serves its metrics')
+    parser.add_argument('--profile_path', required=False, help='Directory where the profiled decisions are saved, as cProfile stats and the history they were computed from')
+    parser.add_argument('--profile_every', required=False, type=int, default=0, help='Profile one decision task out of this many (requires --profile_path)')
+    parser.add_argument('--profile_slower_than', required=False, type=float, help='Profile the decisions taking longer than this many seconds (requires --profile_path). All the decisions then run under the profiler')
+    parser.add_argument('--concurrency', required=False, type=int, default=1, help='Number of decision tasks processed concurrently, each by its own decider thread')
+
+
+def check_decider_arguments(parser, args):
+    """Validate the decider options, exiting through `parser` on errors.
+    """
+    if bool(args.plan) == bool(args.plan_dir):
+        parser.error('Either --plan or --plan_dir is required')
+    if args.plan_dir and (args.plan_name or args.plan_version):
+        parser.error('--plan_name and --plan_version require --plan')
+    if (args.incremental_history and args.state_cache_size <= 0 and
+            not args.snapshot_store and not args.checkpoints):
+        parser.error('--incremental_history requires --state_cache_size, '
+                     '--snapshot_store or --checkpoints')
+    if args.snapshot_store and not args.snapshot_path:
+        parser.error('--snapshot_store requires --snapshot_path')
+    if ((args.profile_every or args.profile_slower_than is not None) and
+            not args.profile_path):
+        parser.error('--profile_every and --profile_slower_than require '
+                     '--profile_path')
+
+
+def setup_logging(args):
+    log_file = "/var/tmp/logs/cpe/decider.log"
+    if args.log_file:
+        log_file = args.log_file
+    logging.basicConfig(level=logging.INFO,
+                        filename=log_file)
+
+
+def register_plans(domain, plans):
+    """Make sure the workflow types of `plans` are registered in SWF.
+    """
+    register(domain=domain,
+             workflows=[(p.name, p.version,
+                         p.default_execution_start_to_close_timeout,
+                         p.default_task_start_to_close_timeout)
+                        for p in plans])
+
+
+def load_plan(args):
+    """Load, compile and register in SWF the plan given on the command line.
+
+    :returns:
+        The `Plan` or, with `--plan_dir`, `--plan_reload_interval` or
+        `--plan_cache`, a `PlanRegistry`.
+    """
+    if args.plan_dir or args.plan_reload_interval or args.plan_cache:
+        overrides = {}
+        if args.plan_name:
+            overrides['name'] = args.plan_name
+        if args.plan_version:
+            overrides['version'] = args.plan_version
+        loader = PlanLoader(processes=args.plan_processes or None,
+                            cache_path=args.plan_cache)
+        plans = PlanRegistry.from_paths([args.plan_dir or args.plan],
+                                        lazy=args.lazy_plan,
+                                        overrides=overrides,
+                                        loader=loader)
+        _LOGGER.info('Loaded plans with %r: %r', loader, loader.counters)
+        register_plans(args.domain, plans)
+        return plans
+
+    # Load the main plan data
+    with open(args.plan) as f:
+        plan_data = yaml.load(f)
+
+    if args.plan_name:
+        plan_data['name'] = args.plan_name
+    if args.plan_version:
+        plan_data['version'] = args.plan_version
+
+    # Construct the plan
+    p = Plan.from_data(plan_data, lazy=args.lazy_plan)
+    _LOGGER.info('Loaded plan %r', p)
+
+    # Make sure the plan is registered in SWF
+    register_plans(args.domain, [p])
+    return p
+
+
+def output_queue(args):
+    if 'OUTPUT_QUEUE' in os.environ:
+        return os.environ['OUTPUT_QUEUE']
+    elif (args.output_queue is not None and
+          args.output_queue != ""):
+        return args.output_queue
+    else:
+        raise Exception("No 'OUTPUT_QUEUE' provided!")
+
+
+def sink_factory(args):
+    """Return a callable creating the notification sink of a decider.
+    """
+    if args.notification_sink == 'sqs':
+        queue_url = output_queue(args)
+        return lambda: SQSSink(queue_url)
+    elif args.notification_sink == 'file':
+        return lambda: FileSink(args.notification_file)
+    else:
+        return NullSink
+
+
+def snapshot_store(args):
+    """Return the snapshot store of the deciders, if any.
+    """
+    if args.snapshot_store == 'directory':
+        return DirectoryStore(args.snapshot_path)
+    elif args.snapshot_store == 'mmap':
+        return MmapStore(args.snapshot_path)
+    else:
+        return None
+
+
+def decider_factory(args, plan):
+    """Return a callable creating deciders for the given compiled `plan`,
+    or for all the plans of a `PlanRegistry`.
+    """
+    watcher = None
+    if isinstance(plan, PlanRegistry):
+        plan_options = {'plans': plan}
+        if args.plan_reload_interval:
+            watcher = PlanWatcher(
+                plan, interval=args.plan_reload_interval,
+                on_reload=lambda plans: register_plans(args.domain, plans)
+            )
+    else:
+        plan_options = {'plan': plan}
+
+    make_sink = sink_factory(args)
+    # Shared by all the deciders of the process
+    store = snapshot_store(args)
+    activity.RESULTS_CACHE.resize(args.results_cache_size)
+    step.INPUTS_CACHE.resize(args.inputs_cache_size)
+    profiler = None
+    if args.profile_every or args.profile_slower_than is not None:
+        profiler = DecisionProfiler(args.profile_path,
+                                    every=args.profile_every,
+                                    slower_than=args.profile_slower_than)
+
+    def factory():
+        if watcher is not None:
+            # Started here, in the worker processes: threads do not survive
+            # the supervisor's fork()
+            watcher.start()
+        return Decider(
+            domain=args.domain, task_list=args.task_list,
+            sink=make_sink(),
+            state_cache_size=args.state_cache_size,
+            incremental_history=args.incremental_history,
+            compact_state=args.compact_state,
+            snapshot_store=store,
+            checkpoints=args.checkpoints,
+            profiler=profiler,
+            **plan_options
+        )
+
+    return factory
+
+
+def start_metrics(args):
+    """Log the metrics on SIGUSR1 and serve them on `--metrics_port`.
+
+    :returns:
+        The started `MetricsServer`, if any.
+    """
+    metrics.install_dump_handler()
+    if not args.metrics_port:
+        return None
+
+    try:
+        server = metrics.MetricsServer(args.metrics_port)
+    except socket.error as err:
+        _LOGGER.warning('Cannot serve the metrics on port %d: %s',
+                        args.metrics_port, err)
+        return None
+    server.start()
+    return server
+
+
+def run_decider(args, factory):
+    """Run deciders until they stop or a SIGTERM is received.
+
+    With `--concurrency` above 1, the deciders are run in a `DeciderPool`.
+    """
+    start_metrics(args)
+    if args.concurrency > 1:
+        # All the deciders share the compiled plan
+        pool = DeciderPool(lambda _idx: factory(),
+                           concurrency=args.concurrency)
+        signal.signal(signal.SIGTERM, lambda _signum, _frame: pool.stop())
+        pool.run()
+        return
+
+    stopping = []
+    signal.signal(signal.SIGTERM, lambda _signum, _frame: stopping.append(1))
+    # Let the current long poll finish rather than interrupting it
+    signal.siginterrupt(signal.SIGTERM, False)
+
+    d = factory()
+
+    try:
+        while not stopping and d.run():
+            pass
+    finally:
+        d.close()
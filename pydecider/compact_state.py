@@ -0,0 +1,326 @@
+"""Array-backed state of a workflow run.
+
+:class:`CompactState` has the same API as :class:`~pydecider.state.State` but
+does not create an object per step: statuses are kept in a byte array, outputs
+in a list indexed by step id and the history of all the steps in a single
+packed array. It is meant for deciders keeping many runs in their state cache.
+"""
+
+from __future__ import (
+    absolute_import,
+    division,
+    print_function
+)
+
+import array
+import logging
+
+from .plan_graph import (
+    END_STEP,
+    INIT_STEP,
+)
+from .state_status import (
+    StateStatus,
+    StepStateStatus,
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+_PENDING = StepStateStatus.pending.value
+_READY = StepStateStatus.ready.value
+_RUNNING = StepStateStatus.running.value
+_COMPLETED = StepStateStatus.completed.value
+_ABORTED = StepStateStatus.aborted.value
+
+# Input of a ready step that was not prepared yet
+_UNPREPARED = object()
+
+
+class CompactState(object):
+    """Per-run status of the steps of a plan, in arrays indexed by step id.
+
+    Contexts given to :meth:`__call__` must be integers (the SWF eventIds).
+
+    :param graph:
+        The plan's :class:`~pydecider.plan_graph.PlanGraph`, shared by all the
+        runs of the plan.
+    """
+
+    __slots__ = (
+        'status',
+        'graph',
+        '_statuses',
+        '_outputs',
+        '_inputs',
+        '_ready',
+        '_history',
+        '_context',
+    )
+
+    def __init__(self, graph):
+        self.status = StateStatus.init
+        self.graph = graph
+        self._context = None
+        #: Status value of each step
+        self._statuses = array.array('B', [_PENDING]) * len(graph)
+        self._statuses[graph.init_id] = _RUNNING
+        #: Rendered output of each step
+        self._outputs = [None] * len(graph)
+        #: Prepared inputs of the ready steps
+        self._inputs = {}
+        #: Ids of the ready steps
+        self._ready = set()
+        #: `(step id, status value, context)` of all the status updates
+        self._history = array.array('l')
+
+    def __repr__(self):
+        return '{ctype}(status={status},steps={steps})'.format(
+            ctype=self.__class__.__name__,
+            status=self.status.name,
+            steps=len(self._statuses)
+        )
+
+    def dump(self):
+        """Return the status value and the `(status value, output)` of all
+        the steps, indexed by step id.
+        """
+        return (self.status.value, zip(self._statuses, self._outputs))
+
+    @classmethod
+    def load(cls, graph, status, steps, context):
+        """Restore a state from the result of :meth:`dump`.
+
+        The restored statuses are recorded in the history with `context`.
+        """
+        state = cls(graph)
+        state.status = StateStatus(status)
+        for (step_id, (step_status, output)) in enumerate(steps):
+            state._statuses[step_id] = step_status
+            state._outputs[step_id] = output
+            if step_status != _PENDING:
+                state._history.extend((step_id, step_status, context))
+            if step_status == _READY:
+                state._ready.add(step_id)
+        return state
+
+    #################################################
+    def is_in_state(self, state_name):
+        desired_state = getattr(StateStatus, state_name)
+        return self.status.means(desired_state)
+
+    def step_state(self, step_name):
+        """Return a view of the status of a step.
+        """
+        return CompactStepState(self, self.graph.ids[step_name])
+
+    #################################################
+    # Context management
+    def __call__(self, context):
+        self._context = context
+        return self
+
+    def __enter__(self):
+        assert self._context is not None
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        assert self._context is not None
+        # Only clear the context is we didn't encounter an exception. Otherwise
+        # keep it for debug purposes
+        if exc_type is None:
+            self._context = None
+
+    #################################################
+    # State manipulations
+    def set_abort(self):
+        """Abort the state machine.
+        """
+        assert self._context is not None
+        self.step_update(END_STEP, 'aborted')
+
+    def set_input(self, input_data):
+        """Set the input of the state machine.
+        """
+        assert self._context is not None
+        assert self.status is StateStatus.init
+
+        self.step_update(INIT_STEP, 'completed', new_data=input_data)
+        self.status = StateStatus.running
+
+    def step_update(self, step_name, new_status, new_data=None,
+                    rendered=False):
+        """Update a Step with new status and, optionally, output data.
+
+        If `rendered` is `True`, `new_data` was already rendered by the step.
+        """
+        assert self._context is not None
+        if not isinstance(new_status, StepStateStatus):
+            new_status = getattr(StepStateStatus, new_status)
+        self._update(self.graph.ids[step_name], new_status.value,
+                     new_data, rendered)
+
+        end_status = self._statuses[self.graph.end_id]
+        if end_status == _READY:
+            self.status = StateStatus.succeeded
+        elif end_status == _ABORTED:
+            self.status = StateStatus.failed
+
+    #################################################
+    def step_next(self, hint=None):
+        """Search for steps ready to be ran.
+
+        :param str hint:
+            Place to start searching steps that are now ready to be scheduled
+            (usually, the last `completed` step).
+        """
+        if hint:
+            hint_id = self.graph.ids[hint]
+            if self._statuses[hint_id] & _COMPLETED != _COMPLETED:
+                # FIXME: This should be an error
+                return set()
+            step_ids = [child_id for child_id in self.graph.children[hint_id]
+                        if self._statuses[child_id] == _READY]
+        else:
+            step_ids = self._ready
+
+        return set(CompactStepState(self, step_id) for step_id in step_ids)
+
+    def history(self, step_name):
+        """List the `(status, context)` updates of a step.
+        """
+        step_id = self.graph.ids[step_name]
+        history = self._history
+        return [
+            (StepStateStatus(history[idx + 1]), history[idx + 2])
+            for idx in range(0, len(history), 3)
+            if history[idx] == step_id
+        ]
+
+    #################################################
+    def _update(self, step_id, status, new_output=None, rendered=False):
+        _LOGGER.info('Updating step %r status: %s -> %s',
+                     self.graph.names[step_id],
+                     StepStateStatus(self._statuses[step_id]).name,
+                     StepStateStatus(status).name)
+        self._statuses[step_id] = status
+        # Prepared inputs are only kept while the step is ready
+        self._inputs.pop(step_id, None)
+        if status == _READY:
+            self._ready.add(step_id)
+        else:
+            self._ready.discard(step_id)
+
+        if status in (_READY, _RUNNING, _ABORTED):
+            pass
+        elif status & _COMPLETED == _COMPLETED:
+            step = self.graph.steps[step_id]
+            self._outputs[step_id] = (new_output if rendered
+                                      else step.render(new_output))
+            for child_id in self.graph.children[step_id]:
+                self._check_requirements(child_id)
+        else:
+            # FIXME: cleanup
+            raise Exception('Invalid update')
+
+        # Record change in history
+        self._history.extend((step_id, status, self._context))
+
+    def _check_requirements(self, step_id):
+        # You cannot be ready if you are already ready/completed/aborted
+        if self._statuses[step_id] != _PENDING:
+            return
+
+        statuses = self._statuses
+        ready = True
+        for (parent_id, req_mask) in self.graph.requirements[step_id]:
+            parent_status = statuses[parent_id]
+            if parent_status & _COMPLETED != _COMPLETED:
+                ready = False
+                continue
+
+            if parent_status & req_mask != req_mask:
+                self._update(step_id, StepStateStatus.skipped.value)
+                break
+
+        else:
+            if ready:
+                self._update(step_id, _READY)
+
+    def _run(self, step_id):
+        step = self.graph.steps[step_id]
+        step_input = self._inputs.get(step_id, _UNPREPARED)
+        if step_input is _UNPREPARED:
+            assert self._statuses[step_id] == _READY
+            step_input = step.prepare(self._build_context(step_id))
+            self._inputs[step_id] = step_input
+        return step.run(step_input)
+
+    def _build_context(self, step_id):
+        context = {}
+        for parent_id in self.graph.parents[step_id]:
+            if parent_id == self.graph.init_id:
+                context['__input__'] = self._outputs[parent_id]
+            else:
+                context[self.graph.names[parent_id]] = self._outputs[parent_id]
+        return context
+
+
+class CompactStepState(object):
+    """View of a step in a :class:`CompactState`, with the `StepState` API.
+    """
+
+    __slots__ = ('_state', '_step_id')
+
+    def __init__(self, state, step_id):
+        self._state = state
+        self._step_id = step_id
+
+    def __repr__(self):
+        return 'StepState({name}:{status})'.format(
+            name=self.name, status=self.status.name
+        )
+
+    def __eq__(self, other):
+        return (isinstance(other, CompactStepState) and
+                self._state is other._state and
+                self._step_id == other._step_id)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((id(self._state), self._step_id))
+
+    @property
+    def name(self):
+        return self._state.graph.names[self._step_id]
+
+    @property
+    def step(self):
+        return self._state.graph.steps[self._step_id]
+
+    @property
+    def status(self):
+        return StepStateStatus(self._state._statuses[self._step_id])
+
+    @property
+    def output(self):
+        return self._state._outputs[self._step_id]
+
+    @property
+    def history(self):
+        return self._state.history(self.name)
+
+    @property
+    def is_completed(self):
+        """`True` if the status is either `succeeded`, `failed` or `skipped`.
+        """
+        return self.status.means(StepStateStatus.completed)
+
+    def run(self):
+        return self._state._run(self._step_id)
+
+
+__all__ = [
+    'CompactState',
+    'CompactStepState',
+]
@@ -0,0 +1,285 @@
+"""Compile JSON input templates to direct object builders.
+
+Activity inputs are Jinja2 templates of JSON documents, where every variable is
+JSON dumped. Templates that are a plain JSON structure with `{{var.path}}`
+substitutions as values, e.g.::
+
+    {"who": {{__input__.who}}, "files": [{{fetch.file}}]}
+
+can be compiled into a builder assembling the activity input directly from the
+context, without rendering and parsing JSON text. Other templates (control
+flow, filters, substitutions inside strings, ...) are left to Jinja2.
+"""
+
+from __future__ import (
+    absolute_import,
+    division,
+    print_function
+)
+
+import json
+import logging
+import numbers
+
+import jinja2
+import jinja2.nodes
+
+_LOGGER = logging.getLogger(__name__)
+
+# Marks substitutions in the JSON text, cannot be produced by a JSON literal
+# without an explicit `\u0000` escape.
+_MARK = u'\x00'
+
+_JSON_TYPES = (dict, list, basestring, numbers.Number, type(None))
+
+
+class UndefinedValue(StandardError):
+    """Raised when a substitution does not resolve to a JSON value.
+
+    The template should then be rendered with Jinja2 to get its usual error.
+    """
+    pass
+
+
+class _NotCompilable(StandardError):
+    pass
+
+
+class CompiledTemplate(object):
+    """JSON template compiled into a builder.
+
+    Use :func:`compile_template` to create one.
+    """
+
+    __slots__ = ('variables', '_build')
+
+    def __init__(self, variables, build):
+        self.variables = variables
+        self._build = build
+
+    def __repr__(self):
+        return '{ctype}(variables={variables!r})'.format(
+            ctype=self.__class__.__name__,
+            variables=self.variables,
+        )
+
+    def render(self, context):
+        """Build the template's JSON structure from the `context`.
+
+        Substituted values are not copied from the `context`.
+
+        :raises UndefinedValue:
+            If a substitution is undefined or not a JSON value.
+        """
+        return self._build(context)
+
+
+def compile_template(env, source):
+    """Compile a JSON template source, if possible.
+
+    :param env:
+        Jinja2 environment used for the attribute and item lookups.
+    :param str source:
+        Template source.
+    :returns:
+        A :class:`CompiledTemplate`, or `None` if the template has to be
+        rendered by Jinja2.
+    """
+    spec = analyze_template(env.parse(source))
+    if spec is None:
+        return None
+    return build_template(env, spec)
+
+
+def analyze_template(template):
+    """Analyze a parsed JSON template.
+
+    :param template:
+        The `jinja2.nodes.Template` of the template source.
+    :returns:
+        The picklable specification of the template's builder, to pass to
+        :func:`build_template`, or `None` if the template has to be rendered
+        by Jinja2.
+    """
+    try:
+        return _analyze(template)
+    except _NotCompilable as err:
+        _LOGGER.debug('Template not compilable (%s)', err)
+        return None
+
+
+def build_template(env, spec):
+    """Build the :class:`CompiledTemplate` of a specification returned by
+    :func:`analyze_template`.
+
+    :param env:
+        Jinja2 environment used for the attribute and item lookups.
+    """
+    (structure, lookups) = spec
+    getters = dict((mark, _compile_lookup(env, name, path))
+                   for (mark, (name, path)) in lookups.items())
+    variables = set(name for (name, _) in lookups.values())
+    return CompiledTemplate(tuple(sorted(variables)),
+                            _compile_value(structure, getters))
+
+
+def template_lookups(template):
+    """Return the lookups of the variables read by a parsed template.
+
+    Every `name(.attr|[const])*` expression is a lookup, any other use of a
+    variable reads all of it.
+
+    :param template:
+        The `jinja2.nodes.Template` of the template source.
+    :returns:
+        The sorted `(name, path)` of the lookups, `path` being a tuple of
+        `('attr', name)` and `('item', key)`, without the lookups of a value
+        read as a whole.
+    """
+    lookups = set()
+    _collect_lookups(template, lookups)
+
+    collected = []
+    for (name, path) in sorted(lookups):
+        # Sorted, a path comes right after its prefixes
+        if any(name == other_name and path[:len(other_path)] == other_path
+               for (other_name, other_path) in collected):
+            continue
+        collected.append((name, path))
+    return tuple(collected)
+
+
+def resolve_lookup(env, context, lookup):
+    """Resolve a lookup of :func:`template_lookups` in `context`.
+
+    :returns:
+        The value, or `None` with `found` false, as a `(found, value)` tuple.
+    """
+    (name, path) = lookup
+    if name not in context:
+        return (False, None)
+    value = context[name]
+    for (kind, arg) in path:
+        if kind == 'attr':
+            value = env.getattr(value, arg)
+        else:
+            value = env.getitem(value, arg)
+        if isinstance(value, jinja2.Undefined):
+            return (False, None)
+    return (True, value)
+
+
+def _collect_lookups(node, lookups):
+    if isinstance(node, (jinja2.nodes.Name, jinja2.nodes.Getattr,
+                         jinja2.nodes.Getitem)):
+        try:
+            lookups.add(_analyze_lookup(node))
+            return
+        except _NotCompilable:
+            pass
+
+    for child in node.iter_child_nodes():
+        _collect_lookups(child, lookups)
+
+
+def _analyze(template):
+    chunks = []
+    lookups = {}
+    for node in template.body:
+        if not isinstance(node, jinja2.nodes.Output):
+            raise _NotCompilable('control structure')
+
+        for child in node.nodes:
+            if isinstance(child, jinja2.nodes.TemplateData):
+                chunks.append(child.data)
+            else:
+                mark = u'{mark}{idx}{mark}'.format(mark=_MARK,
+                                                   idx=len(lookups))
+                lookups[mark] = _analyze_lookup(child)
+                chunks.append(json.dumps(mark))
+
+    try:
+        structure = json.loads(u''.join(chunks))
+    except ValueError:
+        raise _NotCompilable('not a JSON structure')
+
+    # Fail now rather than when building the template
+    _compile_value(structure, lookups)
+    return (structure, lookups)
+
+
+def _analyze_lookup(node):
+    """Analyze a `name(.attr|[const])*` expression.
+
+    :returns:
+        The `(name, path)` of the lookup, `path` being a tuple of
+        `('attr', name)` and `('item', key)`.
+    """
+    path = []
+    while not isinstance(node, jinja2.nodes.Name):
+        if isinstance(node, jinja2.nodes.Getattr):
+            path.append(('attr', node.attr))
+        elif (isinstance(node, jinja2.nodes.Getitem) and
+              isinstance(node.arg, jinja2.nodes.Const)):
+            path.append(('item', node.arg.value))
+        else:
+            raise _NotCompilable('expression %r' % node)
+        node = node.node
+
+    path.reverse()
+    return (node.name, tuple(path))
+
+
+def _compile_lookup(env, name, path):
+    """Compile a lookup returned by :func:`_analyze_lookup` into a getter.
+    """
+    lookups = [(env.getattr if kind == 'attr' else env.getitem, arg)
+               for (kind, arg) in path]
+
+    def getter(context):
+        if name not in context:
+            raise UndefinedValue(name)
+        value = context[name]
+        try:
+            for lookup, arg in lookups:
+                value = lookup(value, arg)
+        except jinja2.UndefinedError:
+            raise UndefinedValue(name)
+        if not isinstance(value, _JSON_TYPES):
+            raise UndefinedValue(name)
+        return value
+
+    return getter
+
+
+def _compile_value(value, getters):
+    if isinstance(value, dict):
+        if any(_MARK in key for key in value):
+            raise _NotCompilable('substitution in a key')
+        items = [(key, _compile_value(item, getters))
+                 for key, item in value.items()]
+        return lambda context: dict((key, build(context))
+                                    for key, build in items)
+
+    elif isinstance(value, list):
+        builds = [_compile_value(item, getters) for item in value]
+        return lambda context: [build(context) for build in builds]
+
+    elif isinstance(value, basestring) and _MARK in value:
+        if value not in getters:
+            raise _NotCompilable('substitution in a string')
+        return getters[value]
+
+    else:
+        return lambda _context: value
+
+
+__all__ = [
+    'CompiledTemplate',
+    'UndefinedValue',
+    'analyze_template',
+    'build_template',
+    'compile_template',
+    'resolve_lookup',
+    'template_lookups',
+]
@@ -0,0 +1,178 @@
+"""Timings and counters of the decision pipeline.
+
+The phases of a decision (polling, replay, templating, validation, YAQL,
+publication, ...) report to a process wide `yunomi` registry, :data:`REGISTRY`.
+Its metrics can be logged on a signal (:func:`install_dump_handler`) or served
+as JSON from a local HTTP endpoint (:class:`MetricsServer`).
+
+Timers are in seconds.
+"""
+
+from __future__ import (
+    absolute_import,
+    division,
+    print_function
+)
+
+import BaseHTTPServer
+import contextlib
+import json
+import logging
+import signal
+import threading
+import timeit
+
+import yunomi
+
+_LOGGER = logging.getLogger(__name__)
+
+#: Metrics of the deciders of this process.
+REGISTRY = yunomi.MetricsRegistry()
+
+# yunomi metrics are not thread safe and deciders may run in a pool
+_LOCK = threading.Lock()
+
+# Set by the signal handler of `install_dump_handler`, see `_dump_loop`
+_DUMP_REQUESTED = threading.Event()
+_DUMPER = []
+
+
+def record_time(name, duration):
+    """Add a duration, in seconds, to the timer `name`.
+    """
+    with _LOCK:
+        REGISTRY.timer(name).update(duration)
+
+
+def record_value(name, value):
+    """Add a value to the histogram `name`.
+    """
+    with _LOCK:
+        REGISTRY.histogram(name).update(value)
+
+
+def increment(name, count=1):
+    """Increment the counter `name`.
+    """
+    with _LOCK:
+        REGISTRY.counter(name).inc(count)
+
+
+@contextlib.contextmanager
+def timed(name):
+    """Context manager recording the time spent in its block in the timer
+    `name`, whether it raised or not.
+    """
+    start = timeit.default_timer()
+    try:
+        yield
+    finally:
+        record_time(name, timeit.default_timer() - start)
+
+
+def dump_metrics():
+    """Return the current value of all the metrics, keyed by name.
+    """
+    with _LOCK:
+        metrics = REGISTRY.dump_metrics()
+    return dict((metric['name'], metric['value']) for metric in metrics)
+
+
+def log_metrics():
+    """Log the current value of all the metrics.
+    """
+    _LOGGER.info('Metrics: %s', json.dumps(dump_metrics(), sort_keys=True))
+
+
+def install_dump_handler(signum=signal.SIGUSR1):
+    """Log the metrics whenever the process receives `signum`.
+
+    The metrics are logged by a background thread: the signal may interrupt
+    the main thread while it holds `_LOCK`.
+    """
+    if not _DUMPER:
+        dumper = threading.Thread(target=_dump_loop, name='metrics-dumper')
+        dumper.daemon = True
+        dumper.start()
+        _DUMPER.append(dumper)
+    signal.signal(signum, lambda _signum, _frame: _DUMP_REQUESTED.set())
+    # Do not interrupt the SWF long poll
+    signal.siginterrupt(signum, False)
+
+
+def _dump_loop():
+    while True:
+        _DUMP_REQUESTED.wait()
+        _DUMP_REQUESTED.clear()
+        try:
+            log_metrics()
+        except Exception:
+            _LOGGER.exception('Failed to log the metrics')
+
+
+class _MetricsHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        body = json.dumps(dump_metrics(), indent=4, sort_keys=True)
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, fmt, *args):
+        _LOGGER.debug('Metrics request: ' + fmt, *args)
+
+
+class MetricsServer(object):
+    """Serve the metrics as JSON over HTTP, from a background thread.
+
+    :param int port:
+        Port to listen on, 0 picks a free port.
+    :param str host:
+        Address to listen on, the loopback interface by default.
+    """
+
+    __slots__ = ('_server', '_thread')
+
+    def __init__(self, port, host='127.0.0.1'):
+        self._server = BaseHTTPServer.HTTPServer((host, port), _MetricsHandler)
+        self._thread = None
+
+    def __repr__(self):
+        return '{ctype}(address={address!r})'.format(
+            ctype=self.__class__.__name__,
+            address=self.address,
+        )
+
+    @property
+    def address(self):
+        """The `(host, port)` the server listens on.
+        """
+        return self._server.server_address
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        name='metrics-server')
+        self._thread.daemon = True
+        self._thread.start()
+        _LOGGER.info('Started %r', self)
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+
+__all__ = [
+    'MetricsServer',
+    'REGISTRY',
+    'dump_metrics',
+    'increment',
+    'install_dump_handler',
+    'log_metrics',
+    'record_time',
+    'record_value',
+    'timed',
+]
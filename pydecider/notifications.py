@@ -0,0 +1,174 @@
+"""Destinations for the notifications emitted by the decider.
+
+Each decision can emit `ACTIVITY_SCHEDULED`, `WORKFLOW_COMPLETED` and
+`WORKFLOW_FAILED` notifications (JSON-able dictionaries). They are handed to a
+:class:`NotificationSink` once the decisions have been sent to SWF.
+"""
+
+from __future__ import (
+    absolute_import,
+    division,
+    print_function
+)
+
+import abc
+import json
+import logging
+import os
+import sys
+import threading
+
+from .publisher import BatchPublisher
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class NotificationSink(object):
+    """Base notification sink.
+    """
+
+    __slots__ = ()
+    __metaclass__ = abc.ABCMeta
+
+    @abc.abstractmethod
+    def publish(self, notifications):
+        """Emit a list of notifications.
+
+        Implementations should not block the decider for long.
+        """
+        pass
+
+    def close(self):
+        """Emit any pending notification and release the sink resources.
+        """
+        pass
+
+    def __repr__(self):
+        return '{ctype}()'.format(ctype=self.__class__.__name__)
+
+
+class SQSSink(NotificationSink):
+    """Send notifications to an SQS queue, in batches from a background thread.
+
+    :param str queue_url:
+        URL of the SQS queue.
+    :param publisher_options:
+        Extra options for the :class:`~pydecider.publisher.BatchPublisher`.
+    """
+
+    __slots__ = ('queue', 'publisher')
+
+    def __init__(self, queue_url, **publisher_options):
+        # boto is slow to import, only load it when SQS is used
+        import boto.sqs.connection as sqs
+        import boto.sqs.queue as sqs_queue
+
+        self.queue = sqs_queue.Queue(sqs.SQSConnection(), queue_url)
+        self.publisher = BatchPublisher(self.queue, **publisher_options)
+
+    def __repr__(self):
+        return '{ctype}({queue!r})'.format(ctype=self.__class__.__name__,
+                                           queue=self.queue.url)
+
+    def publish(self, notifications):
+        self.publisher.publish(notifications)
+
+    def close(self):
+        self.publisher.close()
+
+
+class FileSink(NotificationSink):
+    """Write notifications as newline-delimited JSON to a file or a pipe.
+
+    The sinks of a path share its stream and lock, so that the lines of all
+    the deciders of the process do not mix.
+
+    :param str path:
+        File to append to, or '-' for the standard output.
+    """
+
+    __slots__ = ('path', '_key', '_stream', '_lock', '_closed')
+
+    def __init__(self, path):
+        self.path = path
+        self._key = path if path == '-' else os.path.abspath(path)
+        with _FILE_STREAMS_LOCK:
+            shared = _FILE_STREAMS.get(self._key)
+            if shared is None:
+                if path == '-':
+                    stream = sys.stdout
+                else:
+                    stream = open(path, 'a')
+                shared = [stream, threading.Lock(), 0]
+                _FILE_STREAMS[self._key] = shared
+            shared[2] += 1
+        (self._stream, self._lock, _) = shared
+        self._closed = False
+
+    def __repr__(self):
+        return '{ctype}({path!r})'.format(ctype=self.__class__.__name__,
+                                          path=self.path)
+
+    def publish(self, notifications):
+        if not notifications:
+            return
+        # A single write so that lines of concurrent deciders do not mix
+        lines = ''.join(json.dumps(notification) + '\n'
+                        for notification in notifications)
+        with self._lock:
+            self._stream.write(lines)
+            self._stream.flush()
+
+    def close(self):
+        """Close the stream, once all the sinks of the path are closed.
+        """
+        with _FILE_STREAMS_LOCK:
+            if self._closed:
+                return
+            self._closed = True
+            shared = _FILE_STREAMS[self._key]
+            shared[2] -= 1
+            if shared[2]:
+                return
+            del _FILE_STREAMS[self._key]
+        if self._stream is not sys.stdout:
+            self._stream.close()
+
+
+# `[stream, lock, number of open sinks]` of the `FileSink` paths
+_FILE_STREAMS = {}
+_FILE_STREAMS_LOCK = threading.Lock()
+
+
+class MemorySink(NotificationSink):
+    """Keep the notifications in memory, in the `notifications` list.
+    """
+
+    __slots__ = ('notifications', '_lock')
+
+    def __init__(self):
+        self.notifications = []
+        self._lock = threading.Lock()
+
+    def publish(self, notifications):
+        with self._lock:
+            self.notifications.extend(notifications)
+
+
+class NullSink(NotificationSink):
+    """Discard all notifications.
+    """
+
+    __slots__ = ()
+
+    def publish(self, notifications):
+        pass
+
+
+__all__ = [
+    'FileSink',
+    'MemorySink',
+    'NotificationSink',
+    'NullSink',
+    'SQSSink',
+]
@@ -4,10 +4,14 @@ from __future__ import (
     print_function
 )
 
+import hashlib
+import json
 import logging
+import zlib
 
 from .step import Step
 from .activity import Activity
+from .plan_graph import PlanGraph
 from .schema import SchemaValidator
 
 _LOGGER = logging.getLogger(__name__)
@@ -67,41 +71,54 @@ class Plan(object):
                  'default_execution_start_to_close_timeout',
                  'default_task_start_to_close_timeout',
                  'steps',
+                 'graph',
                  'activities',
+                 'fingerprint',
                  '_input_validator',
                  '__weakref__')
 
     def __init__(self, name, version,
                  default_execution_start_to_close_timeout,
                  default_task_start_to_close_timeout,
-                 input_spec=None, steps=(), activities=()):
+                 input_spec=None, steps=(), activities=(), digest=None):
         
         self.name = name
         self.version = version
         self.default_execution_start_to_close_timeout = default_execution_start_to_close_timeout
         self.default_task_start_to_close_timeout = default_task_start_to_close_timeout
         self.steps = list(steps)
+        # Compiled once, shared by the states of all the runs of the plan
+        self.graph = PlanGraph(self.steps)
         self.activities = dict(activities)
+        #: Checksum of the plan's name, version, graph and, if given, `digest`
+        #: of its definition, identifying states saved by a compatible plan.
+        self.fingerprint = zlib.crc32(
+            repr((name, version, self.graph.fingerprint, digest))
+        ) & 0xffffffff
         self._input_validator = SchemaValidator(input_spec=input_spec)
 
     def check_input(self, plan_input):
         return self._input_validator.validate(plan_input)
 
     @classmethod
-    def from_data(cls, plan_data):
+    def from_data(cls, plan_data, lazy=False):
         """Define a plan from a dictionary of attributes.
+
+        With `lazy`, the step templates, activity schemas and YAQL
+        expressions are compiled when first used rather than up front, so
+        errors in them are only reported then.
         """
         validator = SchemaValidator(cls._DATA_SCHEMA)
         validator.validate(plan_data)
         
         activities = {
-            activity_data['name']: Activity.from_data(activity_data)
+            activity_data['name']: Activity.from_data(activity_data, lazy=lazy)
             for activity_data in plan_data['activities']
         }
 
         steps = []
         for step_data in plan_data['steps']:
-            step = Step.from_data(step_data, activities)
+            step = Step.from_data(step_data, activities, lazy=lazy)
             steps.append(step)
 
         plan = cls(
@@ -112,6 +129,7 @@ class Plan(object):
             input_spec=plan_data.get('input_spec', None),
             steps=steps,
             activities=activities,
+            digest=cls._digest(plan_data),
         )
 
         _LOGGER.info('Loaded plan %s(steps:%d activities:%d)',
@@ -119,5 +137,14 @@ class Plan(object):
 
         return plan
 
+    @staticmethod
+    def _digest(plan_data):
+        """Digest of a plan definition: its templates, activities, output
+        specifications, ...
+        """
+        canonical = json.dumps(plan_data, sort_keys=True,
+                               separators=(',', ':'), default=repr)
+        return hashlib.sha1(canonical.encode('utf-8')).hexdigest()
+
     def __repr__(self):
         return 'Plan(name={name})'.format(name=self.name)
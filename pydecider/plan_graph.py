@@ -0,0 +1,177 @@
+"""Immutable graph of the steps of a plan.
+
+The graph is compiled once per :class:`~pydecider.plan.Plan`: every replayed
+:class:`~pydecider.state.State` shares it and only keeps the per-run status of
+the steps.
+"""
+
+from __future__ import (
+    absolute_import,
+    division,
+    print_function
+)
+
+import heapq
+import logging
+import zlib
+
+from .step import (
+    Step,
+    StepDefinitionError,
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+INIT_STEP = '$init'
+END_STEP = '$end'
+
+
+class DeciderStepResult(object):
+    pass
+
+
+class DeciderStep(Step):
+    def run(self, _step_input):
+        return DeciderStepResult()
+
+    def prepare(self, _context):
+        return None
+
+    def render(self, output):
+        # The out of the INIT step is the input to the workflow
+        return output
+
+
+class PlanGraph(object):
+    """Steps of a plan in topological order, identified by integer ids.
+
+    The `INIT_STEP` and `END_STEP` pseudo steps come first and last: every
+    step is a child of `INIT_STEP` and a parent of `END_STEP`.
+
+    :param steps:
+        The plan's :class:`~pydecider.step.Step` objects.
+    :raises StepDefinitionError:
+        If step names are not unique, steps require unknown steps or the
+        requirements have a cycle.
+    """
+
+    __slots__ = ('steps',
+                 'names',
+                 'ids',
+                 'parents',
+                 'children',
+                 'requirements',
+                 'init_id',
+                 'end_id',
+                 'fingerprint')
+
+    def __init__(self, steps):
+        steps = self._sort(list(steps))
+        init_step = DeciderStep(INIT_STEP)
+        end_step = DeciderStep(END_STEP,
+                               requires=[INIT_STEP] +
+                               [step.name for step in steps])
+
+        #: Step objects, indexed by step id
+        self.steps = tuple([init_step] + steps + [end_step])
+        #: Step names, indexed by step id
+        self.names = tuple(step.name for step in self.steps)
+        #: Step ids, keyed by step name
+        self.ids = dict((name, step_id)
+                        for (step_id, name) in enumerate(self.names))
+        self.init_id = 0
+        self.end_id = len(self.steps) - 1
+
+        parents = [()]
+        for step in self.steps[1:]:
+            parent_ids = set(self.ids[name] for name in step.requires)
+            parent_ids.add(self.init_id)
+            parents.append(tuple(sorted(parent_ids)))
+        #: Parent step ids, indexed by step id
+        self.parents = tuple(parents)
+
+        children = [[] for _ in self.steps]
+        for (step_id, parent_ids) in enumerate(self.parents):
+            for parent_id in parent_ids:
+                children[parent_id].append(step_id)
+        #: Children step ids, indexed by step id
+        self.children = tuple(tuple(child_ids) for child_ids in children)
+
+        #: `(parent id, required status mask)` pairs, indexed by step id.
+        #: `INIT_STEP` is not a requirement.
+        self.requirements = tuple(
+            tuple((parent_id, step.requires[self.names[parent_id]].value)
+                  for parent_id in parent_ids
+                  if parent_id != self.init_id)
+            for (step, parent_ids) in zip(self.steps, self.parents)
+        )
+
+        #: Checksum of the step names and requirements, identifying states
+        #: saved with a compatible graph.
+        self.fingerprint = zlib.crc32(
+            repr((self.names, self.requirements))
+        ) & 0xffffffff
+
+    def __repr__(self):
+        return '{ctype}(steps={steps})'.format(
+            ctype=self.__class__.__name__,
+            steps=len(self.steps) - 2,
+        )
+
+    def __len__(self):
+        return len(self.steps)
+
+    @staticmethod
+    def _sort(steps):
+        """Sort steps in topological order, keeping the plan order of
+        independent steps.
+        """
+        positions = {}
+        for (position, step) in enumerate(steps):
+            if step.name in positions or step.name in (INIT_STEP, END_STEP):
+                raise StepDefinitionError('Duplicate step name %r' %
+                                          step.name)
+            positions[step.name] = position
+
+        waiting_on = []
+        dependents = [[] for _ in steps]
+        for (position, step) in enumerate(steps):
+            required = set(step.requires)
+            required.discard(INIT_STEP)
+            for name in required:
+                if name not in positions:
+                    raise StepDefinitionError(
+                        'Invalid step %r: Required step %r is not defined' %
+                        (step.name, name)
+                    )
+                dependents[positions[name]].append(position)
+            waiting_on.append(len(required))
+
+        ready = [position for (position, count) in enumerate(waiting_on)
+                 if not count]
+        heapq.heapify(ready)
+        ordered = []
+        while ready:
+            position = heapq.heappop(ready)
+            ordered.append(steps[position])
+            for dependent in dependents[position]:
+                waiting_on[dependent] -= 1
+                if not waiting_on[dependent]:
+                    heapq.heappush(ready, dependent)
+
+        if len(ordered) != len(steps):
+            raise StepDefinitionError(
+                'Invalid steps: Requirements cycle among %r' %
+                sorted(step.name for (step, count) in zip(steps, waiting_on)
+                       if count)
+            )
+
+        return ordered
+
+
+__all__ = [
+    'DeciderStep',
+    'END_STEP',
+    'INIT_STEP',
+    'PlanGraph',
+]
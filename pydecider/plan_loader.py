@@ -0,0 +1,247 @@
+"""Bulk loading of plan files.
+
+Most of the time spent loading a plan goes to parsing its YAML and compiling
+the Jinja2 input templates of its steps. A :class:`PlanLoader` does both in a
+pool of processes and, optionally, caches the result on disk keyed by a
+digest of the plan file, so that unchanged plans are loaded without parsing
+anything at the next startup or reload.
+
+Precompiled templates are primed in `pydecider.step.TEMPLATES_CACHE` before
+building each plan: the `Plan` objects themselves (validators, YAQL
+expressions, Jinja2 environments) cannot cross process boundaries and are
+built in the loading process.
+"""
+
+from __future__ import (
+    absolute_import,
+    division,
+    print_function
+)
+
+import collections
+import cPickle as pickle
+import hashlib
+import logging
+import multiprocessing
+import os
+import sys
+import tempfile
+
+import jinja2
+import yaml
+
+from .plan import Plan
+from .step import (
+    TEMPLATES_CACHE,
+    precompile_template,
+    template_key,
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+#: Version of the format of the cache files, part of their key.
+CACHE_FORMAT = 2
+
+# Marshalled code is specific to the Python version, and the generated code
+# to the Jinja2 version.
+_CACHE_SALT = 'pydecider-plan-{format}\n{python}\n{jinja2}\n'.format(
+    format=CACHE_FORMAT,
+    python=sys.version,
+    jinja2=jinja2.__version__,
+)
+
+_YAML_LOADER = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+
+
+class PlanLoader(object):
+    """Load plan files in parallel, through an on-disk cache.
+
+    :param int processes:
+        Number of processes compiling the plan files, `None` for one per
+        CPU. With 1, or a single plan to compile, everything runs in the
+        calling process.
+    :param str cache_path:
+        Directory of the precompiled plans, created if missing. The cache
+        files are unpickled: the directory must only be writable by the
+        decider. `None` disables the cache.
+    """
+
+    __slots__ = ('processes', 'cache_path', 'counters')
+
+    def __init__(self, processes=1, cache_path=None):
+        self.processes = processes
+        self.cache_path = cache_path
+        self.counters = collections.Counter()
+        if cache_path is not None and not os.path.isdir(cache_path):
+            os.makedirs(cache_path)
+
+    def __repr__(self):
+        return '{ctype}(processes={processes},cache_path={path!r})'.format(
+            ctype=self.__class__.__name__,
+            processes=self.processes,
+            path=self.cache_path,
+        )
+
+    def precompile(self, paths, parallel=True):
+        """Parse the plan files and compile their templates.
+
+        Files that cannot be read or compiled are left out, loading them with
+        :func:`build_plan` or :func:`~pydecider.plan_registry.load_plan_file`
+        reports their errors.
+
+        :param bool parallel:
+            Compile in a pool of processes. Forking the pool from a process
+            running other threads may deadlock the pool processes on a lock
+            held by these threads (`TEMPLATES_CACHE`, logging, ...): only
+            use it before the deciders start.
+
+        :returns:
+            The precompiled plans to pass to :func:`build_plan`, keyed by path.
+        """
+        precompiled = {}
+        misses = []
+        for path in paths:
+            try:
+                with open(path, 'rb') as plan_file:
+                    source = plan_file.read()
+            except IOError:
+                continue
+
+            digest = hashlib.sha1(_CACHE_SALT + source).hexdigest()
+            cached = self._read_cache(digest)
+            if cached is not None:
+                precompiled[path] = cached
+            else:
+                misses.append((path, digest, source))
+
+        sources = [miss[2] for miss in misses]
+        processes = min(self.processes or multiprocessing.cpu_count(),
+                        len(sources))
+        if parallel and processes > 1:
+            pool = multiprocessing.Pool(processes)
+            try:
+                results = pool.map(_precompile_source, sources, chunksize=1)
+            finally:
+                pool.terminate()
+                pool.join()
+        else:
+            results = [_precompile_source(src) for src in sources]
+
+        for ((path, digest, _), result) in zip(misses, results):
+            if result is None:
+                self.counters['failed'] += 1
+                continue
+            self.counters['compiled'] += 1
+            precompiled[path] = result
+            self._write_cache(digest, result)
+
+        return precompiled
+
+    def load(self, paths, lazy=False, overrides=None):
+        """Load and compile plan files.
+
+        :returns:
+            The `Plan` of each path, in order.
+        """
+        precompiled = self.precompile(paths)
+        plans = []
+        for path in paths:
+            if path in precompiled:
+                plan = build_plan(precompiled[path], lazy=lazy,
+                                  overrides=overrides)
+            else:
+                # Let the serial load report the error
+                with open(path) as plan_file:
+                    plan_data = parse_plan(plan_file)
+                plan = build_plan((plan_data, ()), lazy=lazy,
+                                  overrides=overrides)
+            plans.append(plan)
+        return plans
+
+    def _read_cache(self, digest):
+        if self.cache_path is None:
+            return None
+
+        path = os.path.join(self.cache_path, digest + '.pickle')
+        try:
+            with open(path, 'rb') as cache_file:
+                cached = pickle.load(cache_file)
+        except (IOError, OSError):
+            self.counters['cache_misses'] += 1
+            return None
+        except Exception:
+            _LOGGER.exception('Ignored invalid plan cache file %r', path)
+            self.counters['cache_errors'] += 1
+            return None
+
+        self.counters['cache_hits'] += 1
+        return cached
+
+    def _write_cache(self, digest, precompiled):
+        if self.cache_path is None:
+            return
+
+        path = os.path.join(self.cache_path, digest + '.pickle')
+        try:
+            (fd, tmp_path) = tempfile.mkstemp(dir=self.cache_path,
+                                              suffix='.tmp')
+            with os.fdopen(fd, 'wb') as cache_file:
+                pickle.dump(precompiled, cache_file, pickle.HIGHEST_PROTOCOL)
+            # Atomic, concurrent deciders never read a partial file
+            os.rename(tmp_path, path)
+        except (IOError, OSError):
+            _LOGGER.exception('Failed to write the plan cache file %r', path)
+            self.counters['cache_errors'] += 1
+
+
+def parse_plan(stream):
+    """Parse the YAML (or JSON) of a plan file, with LibYAML if available.
+    """
+    return yaml.load(stream, Loader=_YAML_LOADER)
+
+
+def build_plan(precompiled, lazy=False, overrides=None):
+    """Build the `Plan` of a precompiled plan file.
+
+    :param precompiled:
+        A value returned by :meth:`PlanLoader.precompile`.
+    :param dict overrides:
+        Values replacing those of the plan file.
+    """
+    (plan_data, templates) = precompiled
+    for (key, template) in templates:
+        TEMPLATES_CACHE.put(key, template)
+    if overrides:
+        plan_data = dict(plan_data, **overrides)
+    return Plan.from_data(plan_data, lazy=lazy)
+
+
+def _precompile_source(source):
+    """Parse a plan file and compile its input templates.
+
+    Run in the pool processes, errors are reported by the serial load.
+
+    :returns:
+        The `(plan data, templates)` of the plan, or `None`.
+    """
+    try:
+        plan_data = parse_plan(source)
+        templates = []
+        for step_data in plan_data.get('steps', ()):
+            template = step_data.get('input')
+            if 'activity' in step_data and template is not None:
+                templates.append((template_key(template),
+                                  precompile_template(template)))
+    except Exception as err:
+        _LOGGER.debug('Failed to precompile the plan: %r', err)
+        return None
+
+    return (plan_data, templates)
+
+
+__all__ = [
+    'CACHE_FORMAT',
+    'PlanLoader',
+    'build_plan',
+    'parse_plan',
+]
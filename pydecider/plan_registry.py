@@ -0,0 +1,296 @@
+"""Compiled plans of several workflow types, served by a single decider.
+
+A registry loaded from plan files can reload them while the deciders run:
+new and changed files are compiled, then swapped in for the next decision
+tasks. Plans are never removed, so that executions started on a previous
+version of a plan keep being decided with it.
+"""
+
+from __future__ import (
+    absolute_import,
+    division,
+    print_function
+)
+
+import collections
+import logging
+import os
+import threading
+
+from .plan_loader import (
+    build_plan,
+    parse_plan,
+)
+
+_LOGGER = logging.getLogger(__name__)
+
+PLAN_EXTENSIONS = ('.yml', '.yaml', '.json')
+
+
+class PlanRegistryError(StandardError):
+    """The plans cannot be registered."""
+    pass
+
+
+class PlanRegistry(object):
+    """Plans keyed by their workflow type `(name, version)`.
+
+    :param plans:
+        The initial :class:`~pydecider.plan.Plan` objects.
+    :param paths:
+        Plan files and directories of plan files, loaded by :meth:`reload`.
+    :param bool lazy:
+        Compile the loaded plans lazily, see :meth:`Plan.from_data`.
+    :param dict overrides:
+        Values replacing those of the loaded plan files (`name`, `version`).
+    :param loader:
+        The :class:`~pydecider.plan_loader.PlanLoader` compiling the plan
+        files, in parallel and through its cache. By default, they are
+        compiled one at a time.
+    :raises PlanRegistryError:
+        If several plans have the same name and version.
+    """
+
+    __slots__ = ('paths', 'lazy', 'overrides', 'loader', 'counters', '_plans',
+                 '_files', '_lock')
+
+    def __init__(self, plans=(), paths=(), lazy=False, overrides=None,
+                 loader=None):
+        self.paths = list(paths)
+        self.lazy = lazy
+        self.overrides = overrides or {}
+        self.loader = loader
+        self.counters = collections.Counter()
+        self._plans = {}
+        #: `((mtime, size), plan key)` of the loaded files, keyed by path
+        self._files = {}
+        self._lock = threading.Lock()
+        for plan in plans:
+            self.add(plan)
+
+    def __repr__(self):
+        return '{ctype}(plans={plans})'.format(
+            ctype=self.__class__.__name__,
+            plans=len(self._plans),
+        )
+
+    def __len__(self):
+        return len(self._plans)
+
+    def __iter__(self):
+        """Iterate over the plans, sorted by name and version.
+        """
+        with self._lock:
+            plans = sorted(self._plans.items())
+        return iter([plan for (_, plan) in plans])
+
+    def add(self, plan):
+        """Register a plan.
+
+        :raises PlanRegistryError:
+            If a plan of the same name and version is registered.
+        """
+        key = (plan.name, plan.version)
+        with self._lock:
+            if key in self._plans:
+                raise PlanRegistryError('Duplicate plan %r, version %r' % key)
+            self._plans[key] = plan
+
+    def get(self, name, version):
+        """Return the plan of a workflow type, or `None`.
+        """
+        return self._plans.get((name, version))
+
+    def reload(self, raise_errors=False, parallel=False):
+        """Load the new and changed plan files of :attr:`paths`.
+
+        A plan replaces the registered plan of the same name and version, if
+        any. Files that cannot be loaded are skipped until they change again,
+        leaving the registered plans untouched.
+
+        :param bool raise_errors:
+            Raise the errors of the plan files instead of logging them.
+        :param bool parallel:
+            Let the :attr:`loader` compile in a pool of processes, which is
+            only safe before the deciders start their threads (see
+            :meth:`~pydecider.plan_loader.PlanLoader.precompile`).
+        :returns:
+            The list of loaded plans.
+        """
+        paths = list(self._plan_files())
+        for path in set(self._files).difference(paths):
+            # Removed or renamed: its plans are kept, but no longer owned by
+            # the file
+            del self._files[path]
+
+        changed = []
+        for path in paths:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                # Removed, its plans are kept
+                self._files.pop(path, None)
+                continue
+
+            signature = (stat.st_mtime, stat.st_size)
+            (previous_signature, key) = self._files.get(path, (None, None))
+            if signature != previous_signature:
+                changed.append((path, signature, key))
+
+        precompiled = {}
+        if self.loader is not None and changed:
+            precompiled = self.loader.precompile(
+                [path for (path, _, _) in changed], parallel=parallel
+            )
+
+        loaded = []
+        for (path, signature, key) in changed:
+            try:
+                if path in precompiled:
+                    plan = build_plan(precompiled[path], lazy=self.lazy,
+                                      overrides=self.overrides)
+                else:
+                    plan = load_plan_file(path, lazy=self.lazy,
+                                          overrides=self.overrides)
+                key = self._put(plan, path)
+            except Exception:
+                if raise_errors:
+                    raise
+                _LOGGER.exception('Rejected plan file %r, keeping the '
+                                  'registered plans', path)
+                self.counters['rejected'] += 1
+            else:
+                _LOGGER.info('Loaded plan %r, version %r from %r',
+                             plan.name, plan.version, path)
+                self.counters['loaded'] += 1
+                loaded.append(plan)
+
+            self._files[path] = (signature, key)
+
+        return loaded
+
+    def _plan_files(self):
+        for path in self.paths:
+            if os.path.isdir(path):
+                for filename in sorted(os.listdir(path)):
+                    if filename.endswith(PLAN_EXTENSIONS):
+                        yield os.path.join(path, filename)
+            else:
+                yield path
+
+    def _put(self, plan, path):
+        """Register or replace the plan loaded from `path`.
+
+        :raises PlanRegistryError:
+            If another file defines the same name and version.
+        """
+        key = (plan.name, plan.version)
+        with self._lock:
+            for (other_path, (_, other_key)) in self._files.items():
+                if other_key == key and other_path != path:
+                    raise PlanRegistryError(
+                        'Duplicate plan %r, version %r, already loaded from '
+                        '%r' % (key + (other_path,))
+                    )
+            self._plans[key] = plan
+        return key
+
+    @classmethod
+    def from_paths(cls, paths, lazy=False, overrides=None, loader=None):
+        """Load and compile plan files.
+
+        :param paths:
+            Plan files or directories of plan files, with the `.yml`, `.yaml`
+            or `.json` extension.
+        :raises PlanRegistryError:
+            If several plans have the same name and version.
+        """
+        registry = cls(paths=paths, lazy=lazy, overrides=overrides,
+                       loader=loader)
+        # Before any decider thread, the pool can be forked safely
+        registry.reload(raise_errors=True, parallel=True)
+        _LOGGER.info('Loaded %r from %r', registry, paths)
+        return registry
+
+    @classmethod
+    def from_directory(cls, path, lazy=False):
+        """Load and compile the plan files of a directory.
+        """
+        return cls.from_paths([path], lazy=lazy)
+
+
+class PlanWatcher(object):
+    """Reload the plan files of a registry periodically, from a background
+    thread.
+
+    :param registry:
+        The :class:`PlanRegistry`.
+    :param float interval:
+        Seconds between the checks of the plan files.
+    :param callable on_reload:
+        Called with the list of reloaded plans, for instance to register
+        their workflow types in SWF.
+    """
+
+    __slots__ = ('registry', 'interval', 'on_reload', '_stopping', '_thread',
+                 '_lock')
+
+    def __init__(self, registry, interval=5.0, on_reload=None):
+        self.registry = registry
+        self.interval = interval
+        self.on_reload = on_reload
+        self._stopping = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return '{ctype}({registry!r},interval={interval})'.format(
+            ctype=self.__class__.__name__,
+            registry=self.registry,
+            interval=self.interval,
+        )
+
+    def start(self):
+        """Start watching, if not started already.
+        """
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._watch,
+                                            name='plan-watcher')
+            self._thread.daemon = True
+            self._thread.start()
+
+    def stop(self):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _watch(self):
+        while not self._stopping.wait(self.interval):
+            try:
+                plans = self.registry.reload()
+                if plans and self.on_reload is not None:
+                    self.on_reload(plans)
+            except Exception:
+                _LOGGER.exception('Failed to reload the plans')
+
+
+def load_plan_file(path, lazy=False, overrides=None):
+    """Load and compile a plan file.
+
+    :param dict overrides:
+        Values replacing those of the plan file.
+    """
+    with open(path) as plan_file:
+        plan_data = parse_plan(plan_file)
+    return build_plan((plan_data, ()), lazy=lazy, overrides=overrides)
+
+
+__all__ = [
+    'PLAN_EXTENSIONS',
+    'PlanRegistry',
+    'PlanRegistryError',
+    'PlanWatcher',
+    'load_plan_file',
+]
@@ -0,0 +1,113 @@
+"""Run several deciders concurrently in one process.
+"""
+
+from __future__ import (
+    absolute_import,
+    division,
+    print_function
+)
+
+import logging
+import threading
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class DeciderPool(object):
+    """Pool of decider threads.
+
+    Each worker thread builds its own decider with `decider_factory` and runs
+    its poll/decide/complete loop. The deciders should all share the same
+    (immutable) `Plan`, while keeping their own SWF connections and
+    `StateMachine`.
+
+    :param callable decider_factory:
+        Called once per worker thread (with the worker index) to create its
+        decider. The decider's `run()` method is called in a loop until it
+        returns `False` or the pool is stopped, then its `close()` method, if
+        any.
+    :param int concurrency:
+        Number of worker threads.
+    """
+
+    __slots__ = ('decider_factory', 'concurrency', '_threads', '_stopping')
+
+    def __init__(self, decider_factory, concurrency):
+        self.decider_factory = decider_factory
+        self.concurrency = concurrency
+        self._threads = []
+        self._stopping = threading.Event()
+
+    def __repr__(self):
+        return '{ctype}(concurrency={concurrency},alive={alive})'.format(
+            ctype=self.__class__.__name__,
+            concurrency=self.concurrency,
+            alive=len(self.alive_workers),
+        )
+
+    @property
+    def alive_workers(self):
+        return [thread for thread in self._threads if thread.is_alive()]
+
+    def start(self):
+        """Start all the worker threads.
+        """
+        for idx in range(self.concurrency):
+            thread = threading.Thread(target=self._worker,
+                                      args=(idx,),
+                                      name='decider-%d' % idx)
+            # Do not let a worker blocked in a long poll hold the process
+            thread.daemon = True
+            thread.start()
+            self._threads.append(thread)
+        _LOGGER.info('Started %r', self)
+
+    def stop(self):
+        """Ask the workers to exit once their current decision task is done.
+        """
+        _LOGGER.info('Stopping %r', self)
+        self._stopping.set()
+
+    def join(self, timeout=None):
+        """Wait for all the workers to exit.
+        """
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def run(self):
+        """Start the workers and wait until they all exit.
+
+        Stops the pool on `KeyboardInterrupt`.
+        """
+        self.start()
+        try:
+            while self.alive_workers:
+                # Join with a timeout so the main thread still gets signals
+                self.join(timeout=1)
+
+        except KeyboardInterrupt:
+            self.stop()
+
+    def _worker(self, idx):
+        decider = self.decider_factory(idx)
+        _LOGGER.info('Worker %d running %r', idx, decider)
+        while not self._stopping.is_set():
+            try:
+                if not decider.run():
+                    break
+
+            except Exception:
+                # The decision task will time out and be rescheduled by SWF,
+                # keep this worker going.
+                _LOGGER.exception('Worker %d failed to process a decision '
+                                  'task', idx)
+
+        _LOGGER.info('Worker %d exiting', idx)
+        close = getattr(decider, 'close', None)
+        if close is not None:
+            close()
+
+
+__all__ = [
+    'DeciderPool',
+]
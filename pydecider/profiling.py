@@ -0,0 +1,123 @@
+"""Opt-in profiling of individual decisions.
+
+A :class:`DecisionProfiler` runs sampled decisions under `cProfile` and
+saves, for each of them, the profile stats and the history it was computed
+from. Captured histories can be replayed locally with `bin/bench-replay.py`
+(and its `--profile` option) to reproduce a slow decision. With
+`--incremental_history`, only the events fetched for the decision are
+captured.
+"""
+
+from __future__ import (
+    absolute_import,
+    division,
+    print_function
+)
+
+import collections
+import cProfile
+import json
+import logging
+import os
+import re
+import threading
+import time
+import timeit
+
+_LOGGER = logging.getLogger(__name__)
+
+# Characters kept in the file names, workflowIds are free text
+_UNSAFE_CHARS = re.compile(r'[^\w.-]')
+
+
+class DecisionProfiler(object):
+    """Profile every `every`-th decision and the decisions slower than
+    `slower_than`.
+
+    Profiling a decision slows it down, so with `slower_than` all the
+    decisions run under the profiler and only the slow ones are saved.
+
+    :param str path:
+        Directory of the captured profiles, created if missing.
+    :param int every:
+        Profile one decision out of `every` (0 disables the sampling).
+    :param float slower_than:
+        Save the profile of any decision taking longer, in seconds.
+    """
+
+    __slots__ = ('path', 'every', 'slower_than', 'counters', '_decisions',
+                 '_lock')
+
+    def __init__(self, path, every=0, slower_than=None):
+        self.path = path
+        self.every = every
+        self.slower_than = slower_than
+        self.counters = collections.Counter()
+        self._decisions = 0
+        self._lock = threading.Lock()
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+    def __repr__(self):
+        return '{ctype}({path!r},every={every},slower_than={slower})'.format(
+            ctype=self.__class__.__name__,
+            path=self.path,
+            every=self.every,
+            slower=self.slower_than,
+        )
+
+    def run(self, decide, events, workflow_execution):
+        """Call `decide(events, workflow_execution)`, profiling it if it is
+        sampled or could be slow.
+
+        The profile is saved even if `decide` raises.
+        """
+        with self._lock:
+            self._decisions += 1
+            sampled = bool(self.every) and self._decisions % self.every == 0
+
+        if not sampled and self.slower_than is None:
+            return decide(events, workflow_execution)
+
+        profile = cProfile.Profile()
+        start = timeit.default_timer()
+        try:
+            return profile.runcall(decide, events, workflow_execution)
+        finally:
+            duration = timeit.default_timer() - start
+            if sampled or duration >= self.slower_than:
+                self._save(profile, events, workflow_execution, duration)
+
+    def _save(self, profile, events, workflow_execution, duration):
+        """Write the profile stats and the history of a decision.
+
+        :returns:
+            The path of the stats file, without its extension.
+        """
+        name = '{time}-{workflow}-{run}-{events}'.format(
+            time=time.strftime('%Y%m%dT%H%M%S'),
+            workflow=workflow_execution.get('workflowId', ''),
+            run=workflow_execution.get('runId', ''),
+            events=len(events),
+        )
+        prefix = os.path.join(self.path, _UNSAFE_CHARS.sub('_', name))
+        try:
+            profile.dump_stats(prefix + '.prof')
+            with open(prefix + '.json', 'w') as history_file:
+                json.dump({'workflowExecution': workflow_execution,
+                           'events': events}, history_file)
+        except (IOError, OSError, TypeError, ValueError):
+            _LOGGER.exception('Failed to save the profile of %r',
+                              workflow_execution)
+            self.counters['failed'] += 1
+            return None
+
+        _LOGGER.info('Profiled decision of %r (%d events, %.3f s): %s.prof',
+                     workflow_execution, len(events), duration, prefix)
+        self.counters['saved'] += 1
+        return prefix
+
+
+__all__ = [
+    'DecisionProfiler',
+]
@@ -0,0 +1,174 @@
+"""Batched, asynchronous publication of decider notifications to SQS.
+"""
+
+from __future__ import (
+    absolute_import,
+    division,
+    print_function
+)
+
+import collections
+import json
+import logging
+import threading
+import time
+
+from . import metrics
+
+try:
+    from queue import Empty, Full, Queue
+except ImportError:
+    from Queue import Empty, Full, Queue
+
+_LOGGER = logging.getLogger(__name__)
+
+#: Maximum number of messages in a single `SendMessageBatch` call.
+SQS_MAX_BATCH = 10
+
+
+class BatchPublisher(object):
+    """Send notifications to an SQS queue from a background thread.
+
+    Notifications are buffered in a bounded queue and sent in batches of up
+    to 10 messages. Messages failing to be sent (for reasons other than their
+    own content) are retried with an exponential backoff.
+
+    :param queue:
+        Destination queue. Anything with the `write_batch` interface of
+        :class:`boto.sqs.queue.Queue` will do.
+    :param int max_pending:
+        Maximum number of notifications waiting to be sent.
+    :param float put_timeout:
+        Seconds :meth:`publish` waits for room in a full buffer before
+        dropping a notification.
+    :param int max_retries:
+        Number of times a failed message is retried before being dropped.
+    :param float retry_delay:
+        Seconds to wait before the first retry, doubled on each attempt.
+    """
+
+    __slots__ = ('queue', 'put_timeout', 'max_retries', 'retry_delay',
+                 'counters', '_pending', '_thread', '_next_id')
+
+    def __init__(self, queue, max_pending=1000, put_timeout=1.0,
+                 max_retries=3, retry_delay=0.2):
+        self.queue = queue
+        self.put_timeout = put_timeout
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.counters = collections.Counter()
+        self._pending = Queue(maxsize=max_pending)
+        self._next_id = 0
+        self._thread = threading.Thread(target=self._sender,
+                                        name='sqs-publisher')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def __repr__(self):
+        return '{ctype}(queue={queue!r},pending={pending})'.format(
+            ctype=self.__class__.__name__,
+            queue=self.queue,
+            pending=self._pending.qsize(),
+        )
+
+    def publish(self, notifications):
+        """Queue notifications to be sent as JSON messages.
+
+        Returns immediately unless the buffer is full, in which case it waits
+        up to `put_timeout` before dropping the notification.
+        """
+        for notification in notifications:
+            try:
+                self._pending.put(json.dumps(notification),
+                                  timeout=self.put_timeout)
+            except Full:
+                _LOGGER.error('Notification buffer full, dropping %r',
+                              notification)
+                self.counters['dropped'] += 1
+
+    def flush(self):
+        """Wait until all the queued notifications have been processed.
+        """
+        self._pending.join()
+
+    def close(self, timeout=None):
+        """Send the queued notifications and stop the sender thread.
+        """
+        self._pending.put(None)
+        self._thread.join(timeout)
+
+    def _sender(self):
+        while True:
+            # Wait for a notification, then grab whatever else is ready
+            bodies = [self._pending.get()]
+            while len(bodies) < SQS_MAX_BATCH:
+                try:
+                    bodies.append(self._pending.get_nowait())
+                except Empty:
+                    break
+
+            stop = None in bodies
+            bodies = [body for body in bodies if body is not None]
+            try:
+                if bodies:
+                    self._send(bodies)
+            except Exception:
+                _LOGGER.exception('Failed to publish %d notifications',
+                                  len(bodies))
+                self.counters['failed'] += len(bodies)
+
+            finally:
+                for _ in range(len(bodies) + stop):
+                    self._pending.task_done()
+
+            if stop:
+                return
+
+    def _send(self, bodies):
+        """Send one batch, retrying the messages that failed.
+        """
+        messages = []
+        for body in bodies:
+            self._next_id += 1
+            messages.append((str(self._next_id), body, 0))
+
+        delay = self.retry_delay
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                self.counters['retries'] += len(messages)
+                time.sleep(delay)
+                delay *= 2
+
+            try:
+                with metrics.timed('sqs_publish'):
+                    result = self.queue.write_batch(messages)
+            except Exception:
+                _LOGGER.warning('Failed to send a batch of %d messages',
+                                len(messages), exc_info=True)
+                continue
+
+            self.counters['batches'] += 1
+            self.counters['published'] += len(result.results)
+            failed_ids = set()
+            for error in result.errors:
+                if str(error.get('sender_fault')).lower() == 'true':
+                    # Retrying will not help with a bad message
+                    _LOGGER.error('Notification rejected by SQS: %r', error)
+                    self.counters['failed'] += 1
+                else:
+                    failed_ids.add(error['id'])
+
+            messages = [message for message in messages
+                        if message[0] in failed_ids]
+            if not messages:
+                return
+
+        _LOGGER.error('Giving up on %d notifications after %d retries',
+                      len(messages), self.max_retries)
+        self.counters['failed'] += len(messages)
+
+
+__all__ = [
+    'BatchPublisher',
+    'SQS_MAX_BATCH',
+]
@@ -0,0 +1,187 @@
+"""Offline replay of recorded SWF histories, for benchmarks.
+
+Histories are JSON or YAML files holding either a list of events or a
+dictionary with an `events` list (the format of `GetWorkflowExecutionHistory`
+and of the test fixtures). Each history is replayed through a
+:class:`~pydecider.state_machine.StateMachine` one decision at a time: for
+every `DecisionTaskStarted` event, the events up to it are evaluated, as SWF
+would have handed them to the decider.
+"""
+
+from __future__ import (
+    absolute_import,
+    division,
+    print_function
+)
+
+import gc
+import json
+import logging
+import os
+import resource
+import timeit
+
+import yaml
+
+from .state_machine import StateMachine
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+_LOGGER = logging.getLogger(__name__)
+
+HISTORY_EXTENSIONS = ('.json', '.yml', '.yaml')
+
+
+def load_history(path):
+    """Load the events of a recorded history.
+    """
+    with open(path) as history_file:
+        if path.endswith('.json'):
+            data = json.load(history_file)
+        else:
+            data = yaml.safe_load(history_file)
+
+    if isinstance(data, dict):
+        data = data['events']
+    return sorted(data, key=lambda event: event['eventId'])
+
+
+def load_histories(paths):
+    """Load recorded histories from files and directories.
+
+    :returns:
+        A list of `(name, events)`, sorted by name.
+    """
+    histories = []
+    for path in paths:
+        if os.path.isdir(path):
+            filenames = [os.path.join(path, filename)
+                         for filename in os.listdir(path)
+                         if filename.endswith(HISTORY_EXTENSIONS)]
+        else:
+            filenames = [path]
+        for filename in filenames:
+            histories.append((os.path.basename(filename),
+                              load_history(filename)))
+
+    return sorted(histories)
+
+
+def decision_points(events):
+    """Return the number of events handed to each decision of a history.
+    """
+    return [idx + 1 for (idx, event) in enumerate(events)
+            if event['eventType'] == 'DecisionTaskStarted']
+
+
+class ReplayStats(object):
+    """Measures of a replay.
+    """
+
+    __slots__ = ('latencies', 'events', 'duration', 'counters',
+                 'allocated_bytes', 'objects_delta', 'peak_rss_kb')
+
+    def __init__(self):
+        #: Seconds spent in each decision
+        self.latencies = []
+        #: Number of events applied by the state machines
+        self.events = 0
+        self.duration = 0.0
+        self.counters = {}
+        #: Peak of the memory allocated during the replay, if measurable
+        self.allocated_bytes = None
+        #: Growth of the number of objects tracked by the garbage collector
+        self.objects_delta = 0
+        self.peak_rss_kb = 0
+
+    def __repr__(self):
+        return '{ctype}(decisions={decisions},events={events})'.format(
+            ctype=self.__class__.__name__,
+            decisions=len(self.latencies),
+            events=self.events,
+        )
+
+    @property
+    def decisions(self):
+        return len(self.latencies)
+
+    def percentile(self, percent):
+        """Return the per-decision latency at `percent` (nearest rank).
+        """
+        if not self.latencies:
+            return 0.0
+        latencies = sorted(self.latencies)
+        rank = int(round(percent / 100 * (len(latencies) - 1)))
+        return latencies[rank]
+
+    def summary(self):
+        """Return the measures as a dictionary.
+        """
+        duration = self.duration or float('inf')
+        return {
+            'decisions': self.decisions,
+            'events': self.events,
+            'duration': self.duration,
+            'events_per_sec': self.events / duration,
+            'decisions_per_sec': self.decisions / duration,
+            'latency_p50': self.percentile(50),
+            'latency_p99': self.percentile(99),
+            'latency_max': max(self.latencies) if self.latencies else 0.0,
+            'allocated_bytes': self.allocated_bytes,
+            'objects_delta': self.objects_delta,
+            'peak_rss_kb': self.peak_rss_kb,
+            'counters': self.counters,
+        }
+
+
+def replay(plan, histories, **statemachine_options):
+    """Replay histories decision by decision.
+
+    :param plan:
+        The compiled :class:`~pydecider.plan.Plan` of the histories.
+    :param histories:
+        A list of `(name, events)`, the names are used as runIds.
+    :param statemachine_options:
+        Options of the :class:`~pydecider.state_machine.StateMachine`, for
+        instance `state_cache_size` to replay only the new events of each
+        decision.
+    :returns:
+        The :class:`ReplayStats`.
+    """
+    stats = ReplayStats()
+    statemachine = StateMachine(plan, **statemachine_options)
+    timer = timeit.default_timer
+
+    gc.collect()
+    objects_before = len(gc.get_objects())
+    if tracemalloc is not None:
+        tracemalloc.start()
+
+    start = timer()
+    for (name, events) in histories:
+        for count in decision_points(events):
+            decision_start = timer()
+            statemachine.eval(events[:count], run_id=name)
+            stats.latencies.append(timer() - decision_start)
+    stats.duration = timer() - start
+
+    if tracemalloc is not None:
+        (_, stats.allocated_bytes) = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    stats.objects_delta = len(gc.get_objects()) - objects_before
+    stats.peak_rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    stats.events = statemachine.counters['events_applied']
+    stats.counters = dict(statemachine.counters)
+    return stats
+
+
+__all__ = [
+    'ReplayStats',
+    'decision_points',
+    'load_histories',
+    'load_history',
+    'replay',
+]
@@ -1,4 +1,10 @@
 """Schema implementation based on JSONSchema v4 draft
+
+Validators are compiled once per distinct schema and shared through
+`VALIDATORS_CACHE`. Schemas using only simple keywords also get a fast-path
+validator generated as Python code: it accepts valid inputs without walking
+the schema, and defers to `jsonschema` for everything else so that errors are
+still reported as :class:`ValidationError`.
 """
 
 from __future__ import (
@@ -7,7 +13,11 @@ from __future__ import (
     print_function
 )
 
+import hashlib
+import json
 import logging
+import numbers
+import re
 
 import jsonschema
 from jsonschema import (
@@ -15,40 +25,299 @@ from jsonschema import (
     ValidationError
 )
 
+from . import metrics
+from .cache import LRUCache
+
 _LOGGER = logging.getLogger(__name__)
 
+#: Compiled `(validator, fast validator)` of the schemas, keyed by digest of
+#: their canonical JSON.
+VALIDATORS_CACHE = LRUCache(maxsize=1024)
+
 
 class SchemaValidator(object):
 
-    __slots__ = ('_input_validator')
+    __slots__ = ('_input_validator', '_fast_validator')
 
-    def __init__(self, input_spec):
+    def __init__(self, input_spec, fast=True):
         if input_spec:
-            try:
-                self._input_validator = jsonschema.Draft4Validator(input_spec)
-
-            except jsonschema.SchemaError:
-                raise
+            (self._input_validator, self._fast_validator) = \
+                compile_schema(input_spec)
+            if not fast:
+                self._fast_validator = None
 
         else:
             self._input_validator = None
+            self._fast_validator = None
 
     def validate(self, some_input):
         if self._input_validator is not None:
-            try:
-                self._input_validator.validate(some_input)
-                return True
-
-            except jsonschema.ValidationError:
-                raise
+            with metrics.timed('schema_validation'):
+                if (self._fast_validator is None or
+                        not self._fast_validator(some_input)):
+                    # Invalid (or not checked by the fast path)
+                    self._input_validator.validate(some_input)
+            return True
 
         else:
             # No input schema meams we accept everything
             return True
 
 
+def compile_schema(spec):
+    """Return the `(validator, fast validator)` of a schema.
+
+    The schema itself is checked against the Draft 4 meta-schema when it is
+    first compiled. The fast validator is `None` if the schema uses keywords
+    it does not support.
+
+    :raises SchemaError:
+        If the schema is invalid.
+    """
+    try:
+        canonical = json.dumps(spec, sort_keys=True, separators=(',', ':'))
+    except (TypeError, ValueError):
+        return _compile_schema(spec)
+
+    key = hashlib.sha1(canonical).hexdigest()
+    compiled = VALIDATORS_CACHE.get(key)
+    if compiled is None:
+        compiled = _compile_schema(spec)
+        VALIDATORS_CACHE.put(key, compiled)
+    return compiled
+
+
+def _compile_schema(spec):
+    jsonschema.Draft4Validator.check_schema(spec)
+    return (jsonschema.Draft4Validator(spec),
+            _FastValidatorBuilder(spec).build())
+
+
+class _NotCompilable(Exception):
+    """The schema uses a keyword the fast validators do not support."""
+    pass
+
+
+class _FastValidatorBuilder(object):
+    """Generate the source of a function returning `True` for the inputs
+    valid against a schema.
+
+    The generated function may reject valid inputs (for instance unicode and
+    byte strings never compare equal in `enum`) but never accepts invalid
+    ones.
+    """
+
+    __slots__ = ('spec', '_lines', '_constants', '_names')
+
+    # Keywords without effect on validation
+    _ANNOTATIONS = frozenset(('$schema', 'id', 'title', 'description',
+                              'default', 'format', 'definitions'))
+
+    _TYPE_CHECKS = {
+        'array': 'isinstance({0}, list)',
+        'boolean': 'isinstance({0}, bool)',
+        'integer': '(isinstance({0}, (int, long)) and '
+                   'not isinstance({0}, bool))',
+        'null': '{0} is None',
+        'number': '(isinstance({0}, (int, long, float)) and '
+                  'not isinstance({0}, bool))',
+        'object': 'isinstance({0}, dict)',
+        'string': 'isinstance({0}, basestring)',
+    }
+
+    def __init__(self, spec):
+        self.spec = spec
+        self._lines = []
+        self._constants = {}
+        self._names = 0
+
+    def build(self):
+        """Return the fast validator, or `None`.
+        """
+        try:
+            self._emit(self.spec, 'data', 1)
+        except _NotCompilable as err:
+            _LOGGER.debug('No fast validator for %r: %s', self.spec, err)
+            return None
+
+        source = '\n'.join(['def validate(data):'] + self._lines +
+                           ['    return True'])
+        namespace = dict(self._constants)
+        namespace['_enum'] = _enum
+        namespace['_Number'] = numbers.Number
+        exec(compile(source, '<schema>', 'exec'), namespace)
+        return namespace['validate']
+
+    def _line(self, depth, line):
+        self._lines.append('    ' * depth + line)
+
+    def _name(self, prefix):
+        self._names += 1
+        return '{0}_{1}'.format(prefix, self._names)
+
+    def _constant(self, value):
+        name = self._name('const')
+        self._constants[name] = value
+        return name
+
+    def _check(self, depth, condition):
+        self._line(depth, 'if not ({0}):'.format(condition))
+        self._line(depth + 1, 'return False')
+
+    def _emit(self, spec, var, depth):
+        if not isinstance(spec, dict):
+            raise _NotCompilable('schema is not an object')
+        unsupported = set(spec) - self._ANNOTATIONS - self._KEYWORDS
+        if unsupported:
+            raise _NotCompilable('unsupported keywords %r' %
+                                 sorted(unsupported))
+
+        for emit in self._EMITTERS:
+            emit(self, spec, var, depth)
+
+    def _emit_type(self, spec, var, depth):
+        if 'type' not in spec:
+            return
+        types = spec['type']
+        if not isinstance(types, list):
+            types = [types]
+        try:
+            checks = [self._TYPE_CHECKS[name].format(var) for name in types]
+        except (KeyError, TypeError):
+            raise _NotCompilable('unknown type %r' % spec['type'])
+        self._check(depth, ' or '.join(checks))
+
+    def _emit_enum(self, spec, var, depth):
+        if 'enum' not in spec:
+            return
+        self._check(depth, '_enum({0}, {1})'.format(
+            var, self._constant(spec['enum'])
+        ))
+
+    def _emit_string(self, spec, var, depth):
+        if not set(spec) & set(('minLength', 'maxLength', 'pattern')):
+            return
+        self._line(depth, 'if isinstance({0}, basestring):'.format(var))
+        if 'minLength' in spec:
+            self._check(depth + 1, 'len({0}) >= {1!r}'.format(
+                var, spec['minLength']
+            ))
+        if 'maxLength' in spec:
+            self._check(depth + 1, 'len({0}) <= {1!r}'.format(
+                var, spec['maxLength']
+            ))
+        if 'pattern' in spec:
+            try:
+                pattern = re.compile(spec['pattern'])
+            except (re.error, TypeError):
+                raise _NotCompilable('invalid pattern %r' % spec['pattern'])
+            self._check(depth + 1, '{0}.search({1})'.format(
+                self._constant(pattern), var
+            ))
+
+    def _emit_number(self, spec, var, depth):
+        if not set(spec) & set(('minimum', 'maximum')):
+            return
+        # Bounds apply to any number, like in `jsonschema`
+        self._line(depth, 'if isinstance({0}, _Number) and '
+                          'not isinstance({0}, bool):'.format(var))
+        if 'minimum' in spec:
+            operator = '>' if spec.get('exclusiveMinimum') else '>='
+            self._check(depth + 1, '{0} {1} {2!r}'.format(
+                var, operator, spec['minimum']
+            ))
+        if 'maximum' in spec:
+            operator = '<' if spec.get('exclusiveMaximum') else '<='
+            self._check(depth + 1, '{0} {1} {2!r}'.format(
+                var, operator, spec['maximum']
+            ))
+
+    def _emit_object(self, spec, var, depth):
+        keywords = ('properties', 'required', 'additionalProperties',
+                    'minProperties', 'maxProperties')
+        if not set(spec) & set(keywords):
+            return
+        self._line(depth, 'if isinstance({0}, dict):'.format(var))
+        depth += 1
+
+        properties = spec.get('properties', {})
+        for (name, property_spec) in sorted(properties.items()):
+            key = self._constant(name)
+            value = self._name('value')
+            self._line(depth, 'if {0} in {1}:'.format(key, var))
+            self._line(depth + 1, '{0} = {1}[{2}]'.format(value, var, key))
+            length = len(self._lines)
+            self._emit(property_spec, value, depth + 1)
+            if len(self._lines) == length:
+                self._line(depth + 1, 'pass')
+
+        for name in spec.get('required', ()):
+            self._check(depth, '{0} in {1}'.format(self._constant(name), var))
+
+        additional = spec.get('additionalProperties', True)
+        if additional is False:
+            self._check(depth, 'not set({0}).difference({1})'.format(
+                var, self._constant(frozenset(properties))
+            ))
+        elif additional is not True:
+            raise _NotCompilable('additionalProperties schema')
+
+        if 'minProperties' in spec:
+            self._check(depth, 'len({0}) >= {1!r}'.format(
+                var, spec['minProperties']
+            ))
+        if 'maxProperties' in spec:
+            self._check(depth, 'len({0}) <= {1!r}'.format(
+                var, spec['maxProperties']
+            ))
+
+    def _emit_array(self, spec, var, depth):
+        if not set(spec) & set(('items', 'minItems', 'maxItems')):
+            return
+        self._line(depth, 'if isinstance({0}, list):'.format(var))
+        depth += 1
+
+        if 'items' in spec:
+            if not isinstance(spec['items'], dict):
+                raise _NotCompilable('items array')
+            item = self._name('item')
+            self._line(depth, 'for {0} in {1}:'.format(item, var))
+            length = len(self._lines)
+            self._emit(spec['items'], item, depth + 1)
+            if len(self._lines) == length:
+                self._line(depth + 1, 'pass')
+
+        if 'minItems' in spec:
+            self._check(depth, 'len({0}) >= {1!r}'.format(
+                var, spec['minItems']
+            ))
+        if 'maxItems' in spec:
+            self._check(depth, 'len({0}) <= {1!r}'.format(
+                var, spec['maxItems']
+            ))
+
+    _KEYWORDS = frozenset((
+        'type', 'enum',
+        'minLength', 'maxLength', 'pattern',
+        'minimum', 'maximum', 'exclusiveMinimum', 'exclusiveMaximum',
+        'properties', 'required', 'additionalProperties', 'minProperties',
+        'maxProperties',
+        'items', 'minItems', 'maxItems',
+    ))
+
+    _EMITTERS = (_emit_type, _emit_enum, _emit_string, _emit_number,
+                 _emit_object, _emit_array)
+
+
+def _enum(value, enums):
+    """Strict `enum` check: `True` only matches `True`, not `1`.
+    """
+    return any(value == each and type(value) is type(each) for each in enums)
+
+
 __all__ = [
     'SchemaError',
     'SchemaValidator',
     'ValidationError',
+    'compile_schema',
 ]
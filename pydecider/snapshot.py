@@ -0,0 +1,390 @@
+"""Serialized snapshots of replayed workflow runs and their stores.
+
+A snapshot holds the step statuses and rendered outputs of a run's `State`,
+the eventIds of its scheduled activities and the last eventId it was replayed
+from. A decider without the run in memory can restore it and only apply the
+newer events.
+
+Snapshots are a fixed binary header followed by zlib compressed JSON::
+
+    magic (4s) | version (B) | plan fingerprint (I) | last eventId (q) | body
+
+The plan fingerprint covers the whole plan definition, not only its graph:
+outputs rendered by another version of the templates or output
+specifications must not be reused.
+"""
+
+from __future__ import (
+    absolute_import,
+    division,
+    print_function
+)
+
+import abc
+import base64
+import binascii
+import fcntl
+import hashlib
+import json
+import logging
+import mmap
+import os
+import struct
+import tempfile
+import threading
+import zlib
+
+_LOGGER = logging.getLogger(__name__)
+
+SNAPSHOT_MAGIC = b'CPEs'
+SNAPSHOT_VERSION = 2
+
+_HEADER = struct.Struct('>4sBIq')
+
+#: Maximum size of the `executionContext` of an SWF decision.
+EXECUTION_CONTEXT_MAX_SIZE = 32768
+#: Marks the execution contexts holding a checkpoint.
+CHECKPOINT_PREFIX = 'cpe-checkpoint:'
+
+
+class SnapshotError(StandardError):
+    """The snapshot cannot be created or restored."""
+    pass
+
+
+def dump_snapshot(plan, state, event_ids, last_event_id):
+    """Serialize a replayed run.
+
+    :param plan:
+        The :class:`~pydecider.plan.Plan` of the run.
+    :param state:
+        `State` (or `CompactState`) of the run.
+    :param dict event_ids:
+        Step names of the scheduled activities, keyed by eventId.
+    :param int last_event_id:
+        Last eventId applied to `state`.
+    :returns:
+        The snapshot, as a byte string.
+    :raises SnapshotError:
+        If the step outputs cannot be serialized.
+    """
+    (status, steps) = state.dump()
+    body = {
+        'status': status,
+        'steps': steps,
+        'event_ids': sorted(event_ids.items()),
+    }
+    try:
+        body_json = json.dumps(body, separators=(',', ':'))
+    except (TypeError, ValueError) as err:
+        raise SnapshotError('Cannot serialize state: %s' % err)
+
+    return _HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, plan.fingerprint,
+                        last_event_id) + zlib.compress(body_json)
+
+
+def load_snapshot(plan, data, state_class):
+    """Restore a run serialized by :func:`dump_snapshot`.
+
+    :param plan:
+        The :class:`~pydecider.plan.Plan` of the run.
+    :param bytes data:
+        The snapshot.
+    :param state_class:
+        `State` class to restore the run into.
+    :returns:
+        A `(state, event_ids, last_event_id)` tuple.
+    :raises SnapshotError:
+        If the snapshot is invalid or was made from another plan, or another
+        definition of the same plan.
+    """
+    try:
+        (magic, version, fingerprint, last_event_id) = \
+            _HEADER.unpack_from(data)
+        body = json.loads(zlib.decompress(data[_HEADER.size:]))
+    except (struct.error, zlib.error, ValueError) as err:
+        raise SnapshotError('Corrupted snapshot: %s' % err)
+
+    if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+        raise SnapshotError('Unsupported snapshot format %r, version %r' %
+                            (magic, version))
+    if fingerprint != plan.fingerprint:
+        raise SnapshotError('Snapshot made from another plan')
+
+    state = state_class.load(plan.graph, body['status'], body['steps'],
+                             context=last_event_id)
+    event_ids = dict(
+        (event_id, step_name) for (event_id, step_name) in body['event_ids']
+    )
+    return (state, event_ids, last_event_id)
+
+
+def snapshot_event_id(data):
+    """Return the last eventId of a snapshot, without restoring it.
+
+    :raises SnapshotError:
+        If the snapshot is invalid.
+    """
+    try:
+        (magic, version, _, last_event_id) = _HEADER.unpack_from(data)
+    except struct.error as err:
+        raise SnapshotError('Corrupted snapshot: %s' % err)
+    if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+        raise SnapshotError('Unsupported snapshot format %r, version %r' %
+                            (magic, version))
+    return last_event_id
+
+
+def encode_checkpoint(data):
+    """Encode a snapshot as an SWF decision `executionContext`.
+
+    :returns:
+        The execution context, or `None` if it would be too big.
+    """
+    context = CHECKPOINT_PREFIX + base64.b64encode(data)
+    if len(context) > EXECUTION_CONTEXT_MAX_SIZE:
+        return None
+    return context
+
+
+def decode_checkpoint(context):
+    """Return the snapshot held in an `executionContext`, or `None`.
+    """
+    if not context or not context.startswith(CHECKPOINT_PREFIX):
+        return None
+    try:
+        return base64.b64decode(context[len(CHECKPOINT_PREFIX):])
+    except (TypeError, binascii.Error):
+        return None
+
+
+class SnapshotStore(object):
+    """Base snapshot store, keyed by workflow runId.
+    """
+
+    __slots__ = ()
+    __metaclass__ = abc.ABCMeta
+
+    @abc.abstractmethod
+    def get(self, key):
+        """Return the snapshot saved for `key`, or `None`.
+        """
+        pass
+
+    @abc.abstractmethod
+    def put(self, key, data):
+        """Save the snapshot of `key`.
+        """
+        pass
+
+    @abc.abstractmethod
+    def delete(self, key):
+        """Forget the snapshot of `key`, if any.
+        """
+        pass
+
+    def close(self):
+        """Release the store resources.
+        """
+        pass
+
+    def __repr__(self):
+        return '{ctype}()'.format(ctype=self.__class__.__name__)
+
+
+class MemoryStore(SnapshotStore):
+    """Keep snapshots in a dictionary, a stand-in for a key-value store.
+    """
+
+    __slots__ = ('snapshots', '_lock')
+
+    def __init__(self):
+        self.snapshots = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            return self.snapshots.get(key)
+
+    def put(self, key, data):
+        with self._lock:
+            self.snapshots[key] = data
+
+    def delete(self, key):
+        with self._lock:
+            self.snapshots.pop(key, None)
+
+
+class DirectoryStore(SnapshotStore):
+    """Keep snapshots in a local directory, one file per run.
+
+    :param str path:
+        Directory of the snapshot files, created if missing.
+    """
+
+    __slots__ = ('path',)
+
+    def __init__(self, path):
+        self.path = path
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+    def __repr__(self):
+        return '{ctype}({path!r})'.format(ctype=self.__class__.__name__,
+                                          path=self.path)
+
+    def _filename(self, key):
+        # runIds are not safe file names
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.path, digest + '.snapshot')
+
+    def get(self, key):
+        try:
+            with open(self._filename(key), 'rb') as snapshot_file:
+                return snapshot_file.read()
+        except IOError:
+            return None
+
+    def put(self, key, data):
+        # Write and rename, so that readers never see a partial snapshot
+        (fd, tmp_name) = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as tmp_file:
+                tmp_file.write(data)
+            os.rename(tmp_name, self._filename(key))
+        except Exception:
+            os.unlink(tmp_name)
+            raise
+
+    def delete(self, key):
+        try:
+            os.unlink(self._filename(key))
+        except OSError:
+            pass
+
+
+class MmapStore(SnapshotStore):
+    """Keep snapshots in fixed size slots of a memory mapped file.
+
+    The slot of a run is picked from a hash of its runId and runs sharing a
+    slot evict each other. Slots are locked with `fcntl` so that the file can
+    be shared by several decider processes.
+
+    :param str path:
+        The slots file, created if missing.
+    :param int slots:
+        Number of slots.
+    :param int slot_size:
+        Size of a slot in bytes. Bigger snapshots are not saved.
+    """
+
+    __slots__ = ('path', 'slots', 'slot_size', '_file', '_map', '_lock')
+
+    # key size, data size, data crc32
+    _SLOT_HEADER = struct.Struct('>HII')
+
+    def __init__(self, path, slots=1024, slot_size=32768):
+        self.path = path
+        self.slots = slots
+        self.slot_size = slot_size
+        self._file = open(path, 'a+b')
+        size = slots * slot_size
+        if os.fstat(self._file.fileno()).st_size < size:
+            self._file.truncate(size)
+        self._map = mmap.mmap(self._file.fileno(), size)
+        self._lock = threading.Lock()
+
+    def __repr__(self):
+        return '{ctype}({path!r},slots={slots})'.format(
+            ctype=self.__class__.__name__,
+            path=self.path,
+            slots=self.slots,
+        )
+
+    @staticmethod
+    def _key(key):
+        if isinstance(key, unicode):
+            key = key.encode('utf-8')
+        return key
+
+    def _slot(self, key):
+        return (zlib.crc32(key) & 0xffffffff) % self.slots * self.slot_size
+
+    def _locked(self, offset, operation):
+        fcntl.lockf(self._file.fileno(), operation, self.slot_size, offset)
+
+    def get(self, key):
+        key = self._key(key)
+        offset = self._slot(key)
+        with self._lock:
+            self._locked(offset, fcntl.LOCK_SH)
+            try:
+                (key_size, data_size, crc) = \
+                    self._SLOT_HEADER.unpack_from(self._map, offset)
+                start = offset + self._SLOT_HEADER.size
+                if (key_size + data_size > self.slot_size or
+                        self._map[start:start + key_size] != key):
+                    return None
+                data = self._map[start + key_size:
+                                 start + key_size + data_size]
+            finally:
+                self._locked(offset, fcntl.LOCK_UN)
+
+        if zlib.crc32(data) & 0xffffffff != crc:
+            _LOGGER.warning('Corrupted snapshot slot for %r', key)
+            return None
+        return data
+
+    def put(self, key, data):
+        key = self._key(key)
+        size = self._SLOT_HEADER.size + len(key) + len(data)
+        if size > self.slot_size:
+            _LOGGER.warning('Snapshot of %r too big for a slot: %d bytes',
+                            key, size)
+            return
+
+        offset = self._slot(key)
+        slot = (self._SLOT_HEADER.pack(len(key), len(data),
+                                       zlib.crc32(data) & 0xffffffff) +
+                key + data)
+        with self._lock:
+            self._locked(offset, fcntl.LOCK_EX)
+            try:
+                self._map[offset:offset + len(slot)] = slot
+            finally:
+                self._locked(offset, fcntl.LOCK_UN)
+
+    def delete(self, key):
+        key = self._key(key)
+        offset = self._slot(key)
+        with self._lock:
+            self._locked(offset, fcntl.LOCK_EX)
+            try:
+                (key_size, _, _) = self._SLOT_HEADER.unpack_from(self._map,
+                                                                 offset)
+                start = offset + self._SLOT_HEADER.size
+                if self._map[start:start + key_size] == key:
+                    self._map[offset:start] = self._SLOT_HEADER.pack(0, 0, 0)
+            finally:
+                self._locked(offset, fcntl.LOCK_UN)
+
+    def close(self):
+        self._map.close()
+        self._file.close()
+
+
+__all__ = [
+    'CHECKPOINT_PREFIX',
+    'DirectoryStore',
+    'EXECUTION_CONTEXT_MAX_SIZE',
+    'MemoryStore',
+    'MmapStore',
+    'SNAPSHOT_VERSION',
+    'SnapshotError',
+    'SnapshotStore',
+    'decode_checkpoint',
+    'dump_snapshot',
+    'encode_checkpoint',
+    'load_snapshot',
+    'snapshot_event_id',
+]
@@ -4,79 +4,104 @@ from __future__ import (
     print_function
 )
 
-import weakref
 import logging
 import collections
 
+from .plan_graph import (
+    END_STEP,
+    INIT_STEP,
+    DeciderStep,
+    DeciderStepResult,
+)
 from .state_status import (
     StateStatus,
     StepStateStatus,
 )
-from .step import Step
 
 _LOGGER = logging.getLogger(__name__)
-INIT_STEP = '$init'
-END_STEP = '$end'
-
-
-class DeciderStepResult(object):
-    pass
 
+# Input of a ready step that was not prepared yet
+_UNPREPARED = object()
 
-class DeciderStep(Step):
-    def run(self, _step_input):
-        return DeciderStepResult()
 
-    def prepare(self, _context):
-        return None
-
-    def render(self, output):
-        # The out of the INIT step is the input to the workflow
-        return output
+class State(object):
+    """Per-run status of the steps of a plan.
 
+    :param graph:
+        The plan's :class:`~pydecider.plan_graph.PlanGraph`, shared by all the
+        runs of the plan.
+    """
 
-class State(object):
     __slots__ = (
         'status',
-        'step_states',
+        'graph',
+        '_step_states',
         '_context',
-        '_orphaned_steps',
         '_init_step',
         '_end_step',
+        '_ready_steps',
     )
 
-    def __init__(self):
+    def __init__(self, graph):
         """Init state"""
         self.status = StateStatus.init
-        self.step_states = {}
+        self.graph = graph
         self._context = None
-        self._orphaned_steps = {}
-        # Add an INIT/END fake steps
-        self._init_step = StepState(
-            step=DeciderStep(INIT_STEP),
-            status='running',
-            context='__init__'
-        )
-        self._end_step = StepState(
-            step=DeciderStep(END_STEP,
-                             requires=[(INIT_STEP, 'completed')]),
-            context='__init__'
-        )
-        self._stepstate_insert(self._init_step)
-        self._stepstate_insert(self._end_step)
+        # Frontier of the `ready` steps, maintained by the StepStates
+        self._ready_steps = set()
+        self._step_states = [
+            StepState(self, step_id, context='__init__')
+            for step_id in range(len(graph))
+        ]
+        # INIT/END fake steps
+        self._init_step = self._step_states[graph.init_id]
+        self._end_step = self._step_states[graph.end_id]
 
     def __repr__(self):
         return '{ctype}(status={status},steps={steps})'.format(
             ctype=self.__class__.__name__,
             status=self.status.name,
-            steps=len(self.step_states)
+            steps=len(self._step_states)
         )
 
+    def dump(self):
+        """Return the status value and the `(status value, output)` of all
+        the steps, indexed by step id.
+        """
+        return (self.status.value,
+                [(step_state.status.value, step_state.output)
+                 for step_state in self._step_states])
+
+    @classmethod
+    def load(cls, graph, status, steps, context):
+        """Restore a state from the result of :meth:`dump`.
+
+        The history of each step starts with its restored status, recorded
+        with `context`.
+        """
+        state = cls(graph)
+        state.status = StateStatus(status)
+        for (step_state, (step_status, output)) in zip(state._step_states,
+                                                        steps):
+            step_status = StepStateStatus(step_status)
+            step_state.status = step_status
+            step_state.output = output
+            step_state.history = collections.deque([(step_status, context)])
+            if step_status is StepStateStatus.ready:
+                step_state.input = _UNPREPARED
+                state._ready_steps.add(step_state)
+        return state
+
     #################################################
     def is_in_state(self, state_name):
         desired_state = getattr(StateStatus, state_name)
         return self.status.means(desired_state)
 
+    def step_state(self, step_name):
+        """Return the StepState of a step.
+        """
+        return self._step_states[self.graph.ids[step_name]]
+
     #################################################
     # Context management
     def __call__(self, context):
@@ -110,46 +135,24 @@ class State(object):
         self.step_update(INIT_STEP, 'completed', new_data=input_data)
         self.status = StateStatus.running
 
-    def step_update(self, step_name, new_status, new_data=None):
+    def step_update(self, step_name, new_status, new_data=None,
+                    rendered=False):
         """Update a Step with new status and, optionally, output data.
+
+        If `rendered` is `True`, `new_data` was already rendered by the step.
         """
         assert self._context is not None
-        step_state = self.step_states[step_name]
+        step_state = self.step_state(step_name)
         step_state.update(new_status,
                           context=self._context,
-                          new_output=new_data)
+                          new_output=new_data,
+                          rendered=rendered)
 
         if self._end_step.status is StepStateStatus.ready:
             self.status = StateStatus.succeeded
         elif self._end_step.status is StepStateStatus.aborted:
             self.status = StateStatus.failed
 
-    def step_insert(self, step):
-        """Add a step definition to the state.
-        """
-        assert self._context is not None
-        step_state = StepState(step, self._context)
-        _LOGGER.info('Defining new step %r in state', step_state)
-
-        # All steps are children of the root INIT_STEP step
-        self._init_step.children.add(step_state)
-        step_state.parents.add(self._init_step)
-
-        if self._stepstate_insert(step_state):
-            # All steps are a parent of END_STEP
-            # FIXME: Could be optimized so that only steps without children are
-            #        parented to END_STEP
-            self._end_step.parents.add(step_state)
-            self._end_step.step.requires[step_state.step.name] = \
-                StepStateStatus.completed
-
-            step_state.children.add(self._end_step)
-            # See if we can re-parents some previously orphaned Step with the
-            # one we have just added.
-            orphans = self._orphaned_steps.pop(step.name, [])
-            for orphan in orphans:
-                self._stepstate_insert(orphan)
-
     #################################################
     def step_next(self, hint=None):
         """Search for steps ready to be ran.
@@ -158,81 +161,61 @@ class State(object):
             Place to start searching steps that are now ready to be scheduled
             (usually, the last `completed` step).
         """
-        ready_steps = set()
         # Were we given a place to start looking?
         if hint:
-            hint_step = self.step_states[hint]
+            hint_step = self.step_state(hint)
 
             # Check that this is completed
             if not hint_step.is_completed:
                 # FIXME: This should be an error
                 return set()
 
-            for child in hint_step.children:
-                if child.status is StepStateStatus.ready:
-                    ready_steps.add(child)
+            return set(child for child in hint_step.children
+                       if child.status is StepStateStatus.ready)
 
         else:
-            # Walk the whole tree collecting ready StepState
-            for child in self._init_step.children:
-                if child.status is StepStateStatus.ready:
-                    ready_steps.add(child)
-                else:
-                    child_name = child.step.name
-                    ready_steps |= self.step_next(child_name)
-
-        return ready_steps
-
-    def _stepstate_insert(self, step_state):
-        if not step_state.step.requires:
-            self.step_states[step_state.name] = step_state
-            return True
-
-        elif all([required in self.step_states
-                  for required in step_state.step.requires.keys()]):
-            # All the required steps are defined, update their children set and
-            # record them in this step_state's parents set
-            for required in step_state.step.requires.keys():
-                self.step_states[required].children.add(step_state)
-                step_state.parents.add(self.step_states[required])
-
-            self.step_states[step_state.name] = step_state
-            return True
-
-        else:
-            # We failed to insert this step_state
-            # Parent steps are missing, set it as orphaned
-            for required in step_state.step.requires.keys():
-                if required not in self.step_states:
-                    self._orphaned_steps.setdefault(
-                        required, set()
-                    ).add(step_state)
-            return False
+            # All the steps are children of INIT_STEP: the ready steps are the
+            # whole frontier.
+            return set(self._ready_steps)
 
 
 class StepState(object):
+    """Status, input and output of a step in a `State`.
+
+    Parents and children are looked up in the state's graph.
+    """
 
     __slots__ = ('status',
                  'step',
                  'input',
                  'output',
-                 'children',
-                 'parents',
                  'history',
-                 '__weakref__')
-
-    def __init__(self, step, context,
-                 status=StepStateStatus.pending):
+                 '_state',
+                 '_step_id')
 
-        if not isinstance(status, StepStateStatus):
+    def __init__(self, state, step_id, context, status=None):
+        """
+        :param state:
+            The `State` this step belongs to.
+        :param int step_id:
+            Id of the step in the state's graph.
+        """
+        if status is None:
+            # INIT_STEP is running from the start
+            status = (StepStateStatus.running
+                      if step_id == state.graph.init_id
+                      else StepStateStatus.pending)
+        elif not isinstance(status, StepStateStatus):
             status = getattr(StepStateStatus, status)
 
-        self.step = step
+        self._state = state
+        self._step_id = step_id
+        self.step = state.graph.steps[step_id]
         self.status = status
+        if status is StepStateStatus.ready:
+            state._ready_steps.add(self)
         self.input = None
         self.output = None
-        self.children = weakref.WeakSet()
-        self.parents = weakref.WeakSet()
         self.history = collections.deque()
         self.history.append(
             (status, context)
@@ -247,6 +230,18 @@ class StepState(object):
     def name(self):
         return self.step.name
 
+    @property
+    def parents(self):
+        step_states = self._state._step_states
+        return [step_states[parent_id]
+                for parent_id in self._state.graph.parents[self._step_id]]
+
+    @property
+    def children(self):
+        step_states = self._state._step_states
+        return [step_states[child_id]
+                for child_id in self._state.graph.children[self._step_id]]
+
     @property
     def is_completed(self):
         """`True` if the status is either `succeeded`, `failed` or `skipped`.
@@ -270,9 +265,9 @@ class StepState(object):
                 context.update({parent.name: parent.output})
         return context
 
-    def _record(self, output):
-        """Invoke the step rendering of the results."""
-        attrs = self.step.render(output)
+    def _record(self, output, rendered=False):
+        """Invoke the step rendering of the results (unless already done)."""
+        attrs = output if rendered else self.step.render(output)
         self.output = attrs
 
     def check_requirements(self, context):
@@ -289,21 +284,17 @@ class StepState(object):
         # Check that all our parents are completed per the step's requirements.
         _LOGGER.info('Step %r requirements %r', self, self.step.requires)
 
+        step_states = self._state._step_states
+        completed = StepStateStatus.completed.value
         ready = True
-        for parent in self.parents:
-            if parent.name is INIT_STEP:
-                continue
-            assert parent.name in self.step.requires
-
-            if not parent.is_completed:
+        for (parent_id, req_mask) in \
+                self._state.graph.requirements[self._step_id]:
+            parent_status = step_states[parent_id].status.value
+            if parent_status & completed != completed:
                 ready = False
                 continue
 
-            req_status = self.step.requires[parent.name]
-            _LOGGER.info('Checking parent %r meets requirement %r',
-                          parent, req_status)
-
-            if not parent.status.means(req_status):
+            if parent_status & req_mask != req_mask:
                 self.update('skipped', context)
                 break
 
@@ -311,20 +302,26 @@ class StepState(object):
             if ready:
                 self.update('ready', context)
 
-    def update(self, new_status, context, new_output=None):
+    def update(self, new_status, context, new_output=None, rendered=False):
         if not isinstance(new_status, StepStateStatus):
             new_status = getattr(StepStateStatus, new_status)
 
         _LOGGER.info('Updating step %r status: %s -> %s',
                      self.name, self.status.name, new_status.name)
         self.status = new_status
+        if new_status is StepStateStatus.ready:
+            self._state._ready_steps.add(self)
+        else:
+            self._state._ready_steps.discard(self)
 
         if self.status is StepStateStatus.ready:
-            self.input = self._prepare()
+            # The input is only prepared when the step is run: steps already
+            # scheduled in SWF go straight to `running` without needing it.
+            self.input = _UNPREPARED
         elif self.status is StepStateStatus.running:
             pass
         elif self.is_completed:
-            self._record(new_output)
+            self._record(new_output, rendered)
             for child in self.children:
                 child.check_requirements(context)
         elif self.status is StepStateStatus.aborted:
@@ -338,4 +335,18 @@ class StepState(object):
         self.history.append((self.status, context))
 
     def run(self):
+        if self.input is _UNPREPARED:
+            self.input = self._prepare()
         return self.step.run(self.input)
+
+
+# `DeciderStep`, `DeciderStepResult`, `INIT_STEP` and `END_STEP` moved to
+# `pydecider.plan_graph`, they are still exported from here.
+__all__ = [
+    'DeciderStep',
+    'DeciderStepResult',
+    'END_STEP',
+    'INIT_STEP',
+    'State',
+    'StepState',
+]
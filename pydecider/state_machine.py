@@ -4,10 +4,18 @@ from __future__ import (
     print_function
 )
 
+import collections
 import json
 import logging
 
+from .cache import LRUCache
+from .compact_state import CompactState
 from .schema import ValidationError
+from .snapshot import (
+    SnapshotError,
+    dump_snapshot,
+    load_snapshot,
+)
 from .state import State
 from .step_results import (
     ActivityStepResult,
@@ -17,14 +25,56 @@ from .step_results import (
 _LOGGER = logging.getLogger(__name__)
 
 
+class HistoryGapError(StandardError):
+    """The events cannot be replayed: the start of the history is missing."""
+    pass
+
+
+class _RunState(object):
+    """Replayed state of a workflow run, kept between decision tasks."""
+
+    __slots__ = ('state', 'event_ids', 'last_event_id')
+
+    def __init__(self, state, event_ids, last_event_id):
+        self.state = state
+        self.event_ids = event_ids
+        self.last_event_id = last_event_id
+
+
 class StateMachine(object):
+    """Replay SWF history events into a `State` of the plan.
+
+    :param int state_cache_size:
+        Number of workflow runs whose `State` is kept between calls to
+        :meth:`eval`. With a non-zero size, evaluating a run that is already
+        cached only applies the events newer than the last one seen.
+    :param bool compact_state:
+        Replay the events into array-backed
+        :class:`~pydecider.compact_state.CompactState` objects, which use
+        less memory in the state cache.
+    :param snapshot_store:
+        :class:`~pydecider.snapshot.SnapshotStore` where the replayed runs
+        are saved after each call to :meth:`eval`. Runs missing from the
+        state cache are restored from it.
+    """
 
-    __slots__ = ('plan', 'state', '_event_ids')
+    __slots__ = ('plan', 'state', 'counters', 'snapshot_store',
+                 '_event_ids', '_last_event_id', '_runs', '_state_class',
+                 '_pending')
 
-    def __init__(self, plan):
+    def __init__(self, plan, state_cache_size=0, compact_state=False,
+                 snapshot_store=None):
         self.plan = plan
         self.state = None
+        self.counters = collections.Counter()
+        self.snapshot_store = snapshot_store
         self._event_ids = {}
+        self._last_event_id = None
+        self._runs = LRUCache(maxsize=state_cache_size)
+        self._state_class = CompactState if compact_state else State
+        # Run restored by `last_event_id` but not kept by the state cache,
+        # handed to the next `eval` instead of restoring it again
+        self._pending = None
 
     ###########################################################################
     # Accessors
@@ -36,25 +86,194 @@ class StateMachine(object):
     def is_succeeded(self):
         return self.state.is_in_state('succeeded')
 
+    def last_event_id(self, run_id):
+        """Return the last eventId applied to the cached state of `run_id`.
+
+        Returns `None` if that run is not in the state cache (or the
+        snapshot store).
+        """
+        run = self._runs.get(run_id)
+        if run is None:
+            run = self._restore(run_id)
+            if run is None:
+                return None
+            self._runs.put(run_id, run)
+            if self._runs.maxsize <= 0:
+                self._pending = (run_id, run)
+        return run.last_event_id
+
+    def snapshot(self):
+        """Serialize the last evaluated run.
+
+        :raises SnapshotError:
+            If no events were evaluated or the state cannot be serialized.
+        """
+        if self._last_event_id is None:
+            raise SnapshotError('No events evaluated')
+        return dump_snapshot(self.plan, self.state, self._event_ids,
+                             self._last_event_id)
+
+    def restore(self, data):
+        """Restore a run from a snapshot made by :meth:`snapshot`.
+
+        :returns:
+            The run, to be used in place of a cached one.
+        :raises SnapshotError:
+            If the snapshot is invalid or was made from another plan.
+        """
+        (state, event_ids, last_event_id) = load_snapshot(
+            self.plan, data, self._state_class
+        )
+        return _RunState(state, event_ids, last_event_id)
+
     ###########################################################################
-    def eval(self, events):
-        # First clear the state
-        self.state = State()
-        self._event_ids.clear()
+    def eval(self, events, run_id=None, checkpoint=None):
+        """Replay `events` and return the results of the ready steps.
+
+        :param list events:
+            The workflow history, sorted by eventId. For a cached run, it only
+            needs to contain the events not applied yet; otherwise it must
+            start at the first event of the history.
+        :param str run_id:
+            SWF `runId` of the workflow execution. When given, and the state
+            cache is enabled, the replayed state is kept and the next call for
+            this run only applies new events.
+        :param bytes checkpoint:
+            Snapshot of the run (see :meth:`snapshot`) to resume from, if the
+            run is neither cached nor in the snapshot store.
+
+        :raises HistoryGapError:
+            If the history must be replayed but `events` do not start at the
+            beginning of the workflow.
+        """
+        # Take the run out of the cache while we work on it, so that a failure
+        # half way through the events cannot leave a corrupted state behind.
+        run = None
+        (pending, self._pending) = (self._pending, None)
+        if run_id is not None:
+            run = self._runs.pop(run_id)
+            if run is None and pending is not None and pending[0] == run_id:
+                run = pending[1]
+            if run is None:
+                run = self._restore(run_id)
+        if run is None and checkpoint is not None:
+            run = self._load(checkpoint, run_id, 'checkpoints')
+        new_events = self._new_events(run, events)
+
+        if new_events is None:
+            # Cache miss or gap in the events, replay the whole history
+            if events and events[0]['eventId'] != 1:
+                raise HistoryGapError(
+                    'Cannot replay run %r from eventId %r' %
+                    (run_id, events[0]['eventId'])
+                )
+            self.counters['replay_full'] += 1
+            # The steps come from the plan's precompiled graph
+            self.state = self._state_class(self.plan.graph)
+            self._event_ids = {}
+            new_events = events
+            last_event_id = None
 
-        # Inject a load plan event
-        self._run_event({'eventId': 0, 'eventType': 'PlanLoad'})
+        else:
+            self.counters['replay_incremental'] += 1
+            self.state = run.state
+            self._event_ids = run.event_ids
+            last_event_id = run.last_event_id
 
         # Then, replay the state from the events
-        for event in events:
-            results = self._run_event(event)
+        for event in new_events:
+            self._run_event(event)
+        self.counters['events_applied'] += len(new_events)
 
-        _LOGGER.info('State replayed from events: %r', self.state)
+        # Only the ready steps after the last event matter
+        results = self._next_results()
+        self.counters['decision_passes'] += 1
+        self.counters['decision_passes_saved'] += len(new_events)
+
+        if new_events:
+            last_event_id = new_events[-1]['eventId']
+        self._last_event_id = last_event_id
+        if run_id is not None and last_event_id is not None:
+            self._runs.put(
+                run_id,
+                _RunState(self.state, self._event_ids, last_event_id)
+            )
+            if new_events and self.snapshot_store is not None:
+                if self.state.is_in_state('completed'):
+                    # Nothing left to decide for this run
+                    self.snapshot_store.delete(run_id)
+                else:
+                    self._save(run_id)
+
+        _LOGGER.info('State replayed from %d events: %r',
+                     len(new_events), self.state)
         return results
 
+    def _restore(self, run_id):
+        """Restore a run from the snapshot store, if possible.
+        """
+        if self.snapshot_store is None:
+            return None
+
+        data = self.snapshot_store.get(run_id)
+        if data is None:
+            return None
+        return self._load(data, run_id, 'snapshots')
+
+    def _load(self, data, run_id, source):
+        """Restore a run from a snapshot, returning `None` if it is invalid.
+
+        Counted as `<source>_restored` or `<source>_invalid`.
+        """
+        try:
+            run = self.restore(data)
+        except SnapshotError:
+            _LOGGER.warning('Ignoring %s of run %r', source, run_id,
+                            exc_info=True)
+            self.counters[source + '_invalid'] += 1
+            return None
+
+        self.counters[source + '_restored'] += 1
+        return run
+
+    def _save(self, run_id):
+        try:
+            self.snapshot_store.put(run_id, self.snapshot())
+        except Exception:
+            # The run can always be replayed from the whole history
+            _LOGGER.exception('Failed to save the snapshot of run %r',
+                              run_id)
+            self.counters['snapshots_failed'] += 1
+        else:
+            self.counters['snapshots_saved'] += 1
+
+    def _new_events(self, run, events):
+        """Return the events not yet applied to a cached `run`.
+
+        Returns `None` when `run` is missing or the events are not contiguous
+        with the ones already applied, meaning a full replay is needed.
+        """
+        if run is None:
+            return None
+
+        for idx, event in enumerate(events):
+            if event['eventId'] > run.last_event_id:
+                break
+        else:
+            return []
+
+        if event['eventId'] != run.last_event_id + 1:
+            _LOGGER.warning('Gap in events after eventId %r (next is %r), '
+                            'replaying the whole history',
+                            run.last_event_id, event['eventId'])
+            self.counters['replay_gap'] += 1
+            return None
+
+        return events[idx:]
+
     ###########################################################################
     def _run_event(self, event):
-        """Process a given event and return a list of results.
+        """Apply a given event to the state.
         """
         _LOGGER.info('Processing event %r', event['eventType'])
 
@@ -65,6 +284,9 @@ class StateMachine(object):
         )
         handler_fun(event)
 
+    def _next_results(self):
+        """Run all the ready steps and return their results.
+        """
         # If there is nothing left to do, stop here
         if self.state.is_in_state('completed'):
             return []
@@ -89,13 +311,6 @@ class StateMachine(object):
 
     ###########################################################################
     # Events and handlers
-    def __ev_load(self, event):
-        # Create loading time steps from the plan
-        with self.state(event['eventId']):
-            # Import all predefined steps from the plan
-            for step in self.plan.steps:
-                self.state.step_insert(step)
-
     def __ev_skip(self, event):
         _LOGGER.info('Skipping event: %r', event['eventType'])
 
@@ -143,13 +358,15 @@ class StateMachine(object):
         _LOGGER.info('%r', event)
         completed_event = event['activityTaskCompletedEventAttributes']
         output_json = completed_event.get('result', 'null')
-        output = json.loads(output_json)
         sched_event_id = completed_event['scheduledEventId']
         step_name = self._event_ids[sched_event_id]
+        # Parsing and rendering of results is memoized by the steps
+        step = self.state.step_state(step_name).step
+        output = step.render_result(output_json)
         with self.state(event['eventId']):
-            self.state.step_update(step_name, 'succeeded', output)
+            self.state.step_update(step_name, 'succeeded', output,
+                                   rendered=True)
 
-    EVENT_PlanLoad = __ev_load
     EVENT_WorkflowExecutionStarted = __ev_start
     EVENT_DecisionTaskScheduled = __ev_skip
     EVENT_DecisionTaskStarted = __ev_skip
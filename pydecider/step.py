@@ -5,12 +5,24 @@ from __future__ import (
 )
 
 import abc
+import hashlib
 import json
 import logging
+import marshal
+import threading
 
 import jinja2
 import jinja2.meta
 
+from . import metrics
+from .cache import LRUCache
+from .json_template import (
+    UndefinedValue,
+    analyze_template,
+    build_template,
+    resolve_lookup,
+    template_lookups,
+)
 from .state_status import StepStateStatus
 from .step_results import (
     ActivityStepResult,
@@ -19,6 +31,20 @@ from .step_results import (
 
 _LOGGER = logging.getLogger(__name__)
 
+#: Validated activity inputs of the steps, shared by all the steps and keyed
+#: by step and fingerprint of the template variables.
+INPUTS_CACHE = LRUCache(maxsize=1024)
+
+#: Precompiled input templates, see :func:`precompile_template`, keyed by
+#: digest of their source.
+TEMPLATES_CACHE = LRUCache(maxsize=4096)
+
+
+_MISSING = object()
+
+# Serializes the compilation of lazy templates, see `ActivityStep.__jsonify`
+_COMPILE_LOCK = threading.Lock()
+
 
 class StepError(StandardError):
     pass
@@ -60,8 +86,12 @@ class Step(object):
                                           parent_def)
 
     @classmethod
-    def from_data(cls, step_data, activities):
-        """Create a new Step object from a step definition"""
+    def from_data(cls, step_data, activities, lazy=False):
+        """Create a new Step object from a step definition
+
+        With `lazy`, the input template of an activity step is only compiled
+        (and its variables checked) when the step is first prepared.
+        """
         # FIXME: pass data through JSONSchema
         if 'activity' in step_data:
             activity_name = step_data['activity']
@@ -72,6 +102,7 @@ class Step(object):
                 requires=step_data.get('requires', ()),
                 activity=activity,
                 input_template=step_data.get('input', None),
+                lazy=lazy,
             )
 
         elif 'eval' in step_data:
@@ -113,6 +144,14 @@ class Step(object):
         """
         pass
 
+    def render_result(self, result):
+        """Renders the Step's output from its JSON serialized form.
+
+        :returns:
+            A dictionary of 'key: value' pairs.
+        """
+        return self.render(json.loads(result))
+
     def __repr__(self):
         return '{ctype}(name={name})'.format(ctype=self.__class__.__name__,
                                              name=self.name)
@@ -120,19 +159,37 @@ class Step(object):
 
 class ActivityStep(Step):
 
-    __slots__ = ('activity', 'input_template', '__env')
+    __slots__ = ('activity', 'input_template', 'compiled_input', '__env',
+                 '_lookups', '_template_source')
 
-    def __init__(self, name, activity, input_template, requires=()):
+    def __init__(self, name, activity, input_template, requires=(),
+                 lazy=False):
         super(ActivityStep, self).__init__(name, requires)
         self.activity = activity
         self.input_template = None
+        self.compiled_input = None
+        self._lookups = ()
+        # Template not compiled yet
+        self._template_source = input_template
 
         # Define the Jinga2 environment
         self.__env = jinja2.Environment(finalize=self.__jsonify)
 
-        if input_template is not None:
-            tp_required = self._check_template_dependencies(input_template)
-            for tp_var in tp_required:
+        if not lazy:
+            self._compile()
+
+    def _compile(self):
+        """Check the variables of the input template and compile it.
+        """
+        with _COMPILE_LOCK:
+            input_template = self._template_source
+            if input_template is None:
+                # Compiled by another thread
+                return
+
+            (variables, lookups, code, json_spec) = \
+                precompile_template(input_template)
+            for tp_var in variables:
                 # `__input__` is a "magic" step referencing the workflow input
                 if tp_var == '__input__':
                     continue
@@ -142,7 +199,16 @@ class ActivityStep(Step):
                         (self.name, tp_var,)
                     )
 
-            self.input_template = self.__env.from_string(input_template)
+            self._lookups = lookups
+            # Same as `from_string`, from the precompiled code
+            self.input_template = self.__env.template_class.from_code(
+                self.__env, marshal.loads(code), self.__env.make_globals(None),
+                None
+            )
+            # Plain JSON templates skip the JSON text round-trip
+            if json_spec is not None:
+                self.compiled_input = build_template(self.__env, json_spec)
+            self._template_source = None
 
     def __jsonify(self, obj):
         # Note: This method is called by Jinja2 to "finalize" its variables.
@@ -157,21 +223,69 @@ class ActivityStep(Step):
             return obj
 
     def prepare(self, context):
-        if self.input_template is not None:
-            activity_input_json = self.input_template.render(context)
-            # FIXME: We are assuming JSON activity input here
-            try:
-                activity_input = json.loads(activity_input_json)
-            except ValueError:
-                _LOGGER.exception('Invalid template result: %r',
-                                  activity_input_json)
-                raise
-        else:
-            activity_input = None
+        """Render and validate the activity input from the `context`.
+
+        Inputs are memoized in `INPUTS_CACHE`, keyed by a fingerprint of the
+        values read by the template, so steps whose inputs are unchanged
+        skip the templating, parsing and validation. The returned input is
+        shared and must not be modified.
+        """
+        if self._template_source is not None:
+            self._compile()
+        fingerprint = self._fingerprint(context)
+        if fingerprint is not None:
+            key = (self, fingerprint)
+            activity_input = INPUTS_CACHE.get(key, _MISSING)
+            if activity_input is not _MISSING:
+                return activity_input
+
+        activity_input = self._render(context)
+        if fingerprint is not None:
+            INPUTS_CACHE.put(key, activity_input)
+        return activity_input
+
+    def _fingerprint(self, context):
+        """Digest of the values read by the template in `context`.
+
+        Only the looked up values are serialized, not the whole outputs they
+        are part of. Returns `None` if the values cannot be serialized.
+        """
+        try:
+            values = [resolve_lookup(self.__env, context, lookup)
+                      for lookup in self._lookups]
+            dump = json.dumps(values, sort_keys=True, separators=(',', ':'))
+        except (TypeError, ValueError):
+            return None
+        return hashlib.sha1(dump).hexdigest()
+
+    def _render(self, context):
+        with metrics.timed('template_render'):
+            if self.compiled_input is not None:
+                try:
+                    activity_input = self.compiled_input.render(context)
+                except UndefinedValue:
+                    # Let Jinja2 report the error
+                    activity_input = self._render_template(context)
+
+            elif self.input_template is not None:
+                activity_input = self._render_template(context)
+
+            else:
+                activity_input = None
 
         self.activity.check_input(activity_input)
         return activity_input
 
+    def _render_template(self, context):
+        activity_input_json = self.input_template.render(context)
+        # FIXME: We are assuming JSON activity input here
+        try:
+            return json.loads(activity_input_json)
+        except ValueError:
+            _LOGGER.exception('Invalid template result: %r',
+                              activity_input_json)
+            raise
+
     def run(self, step_input):
         return ActivityStepResult(
             name=self.name,
@@ -182,11 +296,59 @@ class ActivityStep(Step):
     def render(self, output):
         return self.activity.render_outputs(output)
 
-    def _check_template_dependencies(self, input_template):
-        """Return the list of used external variable in the template.
-        """
-        parsed_template = self.__env.parse(input_template)
-        return jinja2.meta.find_undeclared_variables(parsed_template)
+    def render_result(self, result):
+        return self.activity.render_result(result)
+
+
+def precompile_template(source):
+    """Parse and compile an activity input template, once per distinct
+    source.
+
+    The result is picklable, so that templates can be compiled in other
+    processes and cached on disk, see :mod:`pydecider.plan_loader`.
+
+    :returns:
+        A `(variables, lookups, code, json_spec)` tuple: the sorted variables
+        used by the template, their lookups (see
+        :func:`~pydecider.json_template.template_lookups`), its `marshal`
+        dumped Jinja2 code and the specification of its JSON builder (see
+        :func:`~pydecider.json_template.analyze_template`), or `None`.
+    :raises jinja2.TemplateSyntaxError:
+        If the template is invalid.
+    """
+    key = template_key(source)
+    precompiled = TEMPLATES_CACHE.get(key)
+    if precompiled is None:
+        template = _PRECOMPILE_ENV.parse(source)
+        variables = tuple(sorted(
+            jinja2.meta.find_undeclared_variables(template)
+        ))
+        # Without the template's own variables (loops, `set`, ...)
+        lookups = tuple(lookup for lookup in template_lookups(template)
+                        if lookup[0] in variables)
+        json_spec = analyze_template(template)
+        # Last, compiling optimizes the template in place
+        code = marshal.dumps(_PRECOMPILE_ENV.compile(template))
+        precompiled = (variables, lookups, code, json_spec)
+        TEMPLATES_CACHE.put(key, precompiled)
+    return precompiled
+
+
+def template_key(source):
+    """Return the key of a template source in `TEMPLATES_CACHE`.
+    """
+    if isinstance(source, unicode):
+        source = source.encode('utf-8')
+    return hashlib.sha1(source).hexdigest()
+
+
+def _identity(obj):
+    return obj
+
+
+# The code generated by Jinja2 only depends on the kind of `finalize`
+# function, and `ActivityStep.__jsonify` is the identity while compiling.
+_PRECOMPILE_ENV = jinja2.Environment(finalize=_identity)
 
 
 class TemplatedStep(Step):
@@ -0,0 +1,160 @@
+"""Pre-forking supervisor running deciders in several processes.
+"""
+
+from __future__ import (
+    absolute_import,
+    division,
+    print_function
+)
+
+import errno
+import logging
+import os
+import signal
+import time
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class Supervisor(object):
+    """Fork worker processes and restart them when they die.
+
+    Anything built before :meth:`run` is called (typically the compiled
+    `Plan`) is shared with the workers through `fork()`. Connections should
+    be opened by `worker` itself, in the worker process.
+
+    :param callable worker:
+        Called without arguments in each worker process. The process exits
+        when it returns.
+    :param int processes:
+        Number of worker processes to keep running.
+    :param float restart_delay:
+        Seconds to wait before replacing a worker that died, to avoid forking
+        in a tight loop when workers crash on startup.
+    :param float shutdown_timeout:
+        Seconds given to the workers to exit after a SIGTERM before they are
+        killed. It should be longer than the SWF long poll (60 seconds).
+    """
+
+    __slots__ = ('worker', 'processes', 'restart_delay', 'shutdown_timeout',
+                 'poll_interval', '_workers', '_stopping')
+
+    def __init__(self, worker, processes,
+                 restart_delay=1.0, shutdown_timeout=75.0, poll_interval=0.5):
+        self.worker = worker
+        self.processes = processes
+        self.restart_delay = restart_delay
+        self.shutdown_timeout = shutdown_timeout
+        self.poll_interval = poll_interval
+        self._workers = {}
+        self._stopping = False
+
+    def __repr__(self):
+        return '{ctype}(processes={processes},pids={pids})'.format(
+            ctype=self.__class__.__name__,
+            processes=self.processes,
+            pids=sorted(self._workers),
+        )
+
+    def run(self):
+        """Start the workers and supervise them until stopped by a signal.
+        """
+        self._install_signal_handlers()
+        for slot in range(self.processes):
+            self._spawn(slot)
+        _LOGGER.info('Started %r', self)
+
+        while not self._stopping:
+            pid, status = self._reap()
+            if pid is None:
+                time.sleep(self.poll_interval)
+                continue
+
+            slot = self._workers.pop(pid)
+            _LOGGER.error('Worker %d (pid %d) exited with status %d, '
+                          'restarting it', slot, pid, status)
+            time.sleep(self.restart_delay)
+            if not self._stopping:
+                self._spawn(slot)
+
+        self._shutdown()
+
+    def stop(self):
+        """Stop supervising and shut the workers down.
+        """
+        self._stopping = True
+
+    def _install_signal_handlers(self):
+        for signum in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(signum, lambda _signum, _frame: self.stop())
+
+    def _spawn(self, slot):
+        pid = os.fork()
+        if pid:
+            self._workers[pid] = slot
+            return pid
+
+        # In the worker process: let the worker handle SIGTERM itself and
+        # leave Ctrl-C to the supervisor.
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        exit_code = 0
+        try:
+            self.worker()
+
+        except BaseException:
+            _LOGGER.exception('Worker %d failed', slot)
+            exit_code = 1
+
+        finally:
+            logging.shutdown()
+            os._exit(exit_code)
+
+    def _reap(self):
+        """Collect an exited worker, without blocking.
+
+        :returns:
+            The (pid, exit status) of the worker, or (None, None).
+        """
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except OSError as err:
+            if err.errno in (errno.ECHILD, errno.EINTR):
+                return (None, None)
+            raise
+
+        if not pid:
+            return (None, None)
+        return (pid, status)
+
+    def _shutdown(self):
+        _LOGGER.info('Shutting down %r', self)
+        for pid in self._workers:
+            self._kill(pid, signal.SIGTERM)
+
+        deadline = time.time() + self.shutdown_timeout
+        while self._workers and time.time() < deadline:
+            pid, _status = self._reap()
+            if pid is None:
+                time.sleep(self.poll_interval)
+            else:
+                self._workers.pop(pid, None)
+
+        for pid in list(self._workers):
+            _LOGGER.warning('Killing worker (pid %d)', pid)
+            self._kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+            self._workers.pop(pid)
+
+    @staticmethod
+    def _kill(pid, signum):
+        try:
+            os.kill(pid, signum)
+        except OSError as err:
+            if err.errno != errno.ESRCH:
+                raise
+
+
+__all__ = [
+    'Supervisor',
+]
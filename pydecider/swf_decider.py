@@ -4,58 +4,333 @@ from __future__ import (
     print_function
 )
 
+import collections
 import json
 import logging
 import time
 
 import boto.swf.layer2 as swf
-import boto.sqs.connection as sqs
-import boto.sqs.queue as sqs_queue
 
-from .state_machine import StateMachine
+from . import metrics
+from .notifications import (
+    NullSink,
+    SQSSink,
+)
+from .snapshot import (
+    SnapshotError,
+    decode_checkpoint,
+    encode_checkpoint,
+    snapshot_event_id,
+)
+from .state_machine import (
+    HistoryGapError,
+    StateMachine,
+)
 
 _LOGGER = logging.getLogger(__name__)
 
+#: Number of events per page of history returned by SWF by default.
+HISTORY_PAGE_SIZE = 1000
+
 
 class SWFDecider(swf.Decider):
 
     name = 'generic'
     version = '1.0'
 
-    def __init__(self, domain, task_list, output_queue, plan=None):
+    def __init__(self, domain, task_list, output_queue=None, plan=None,
+                 state_cache_size=0, incremental_history=False, sink=None,
+                 compact_state=False, snapshot_store=None, checkpoints=False,
+                 profiler=None, plans=None):
         self.domain = domain
         self.task_list = task_list
         super(SWFDecider, self).__init__()
 
-        self.statemachine = StateMachine(plan)
-        self.sqs = sqs.SQSConnection()
-        
-        self.output_queue = sqs_queue.Queue(self.sqs, output_queue)
+        self._statemachine_options = {
+            'state_cache_size': state_cache_size,
+            'compact_state': compact_state,
+            'snapshot_store': snapshot_store,
+        }
+        #: `PlanRegistry` of the workflow types served, instead of `plan`
+        self.plans = plans
+        #: State machine of each served workflow type
+        self.statemachines = {}
+        if plans is None:
+            self.statemachine = StateMachine(plan,
+                                             **self._statemachine_options)
+        else:
+            # Selected for each decision task
+            self.statemachine = None
+        self.incremental_history = incremental_history
+        # Carry the replayed state in the decisions' executionContext
+        self.checkpoints = checkpoints
+        # Optional `DecisionProfiler` capturing slow decisions
+        self.profiler = profiler
+        self.counters = collections.Counter()
+
+        if sink is None:
+            if output_queue:
+                sink = SQSSink(output_queue)
+            else:
+                _LOGGER.warning('No output queue, notifications are disabled')
+                sink = NullSink()
+        self.sink = sink
+
+    def close(self):
+        """Send the pending notifications and release the decider resources.
+        """
+        self.sink.close()
 
     def run(self):
-        decision_task = self.poll()
-        _LOGGER.info('Received decision task: %r', decision_task)
-        if 'events' in decision_task:
-            # Collect the entire history if there are enough events to become
-            # paginated
-            events = decision_task['events']
-            while 'nextPageToken' in decision_task:
-                decision_task = self.poll(
-                    next_page_token=decision_task['nextPageToken']
-                )
-                if 'events' in decision_task:
-                    events.extend(decision_task['events'])
+        if self.incremental_history:
+            decision_task, events = self._poll_new_history()
+        else:
+            decision_task, events = self._poll_history()
 
+        if events is not None:
+            workflow_execution = decision_task['workflowExecution']
             # Compute decision based on events
-            decisions = self._run(events, decision_task['workflowExecution'])
-            self.complete(decisions=decisions)
+            try:
+                decisions, notifications = self._decide(events,
+                                                        workflow_execution)
+
+            except HistoryGapError:
+                _LOGGER.warning('Cached state of %r is gone, fetching the '
+                                'whole history', workflow_execution)
+                decision_task, events = self._poll_older_history(
+                    decision_task, events
+                )
+                decisions, notifications = self._decide(events,
+                                                        workflow_execution)
+
+            execution_context = self._checkpoint()
+            with metrics.timed('swf_respond_decision'):
+                self.complete(decisions=decisions,
+                              execution_context=execution_context)
+            metrics.increment('decisions')
+            # Notifications are only emitted once SWF has the decisions
+            self.sink.publish(notifications)
 
         _LOGGER.debug('Tic')
         return True
 
+    def _select_statemachine(self, decision_task):
+        """Use the state machine of the workflow type of `decision_task`.
+
+        :returns:
+            `False` if the decider has no plan for the workflow type.
+        """
+        if self.plans is None:
+            return True
+
+        workflow_type = decision_task['workflowType']
+        key = (workflow_type['name'], workflow_type['version'])
+        plan = self.plans.get(*key)
+        if plan is None:
+            # Leave it to a decider knowing the plan, or to the decision
+            # task timeout
+            _LOGGER.error('No plan for workflow type %r, ignoring the '
+                          'decision task', workflow_type)
+            self.counters['unknown_workflow_types'] += 1
+            return False
+
+        statemachine = self.statemachines.get(key)
+        if statemachine is None or statemachine.plan is not plan:
+            statemachine = StateMachine(plan, **self._statemachine_options)
+            self.statemachines[key] = statemachine
+        self.statemachine = statemachine
+        return True
+
+    def _poll(self, **kwargs):
+        """Poll for a decision task (or a page of its history).
+        """
+        with metrics.timed('swf_poll'):
+            return self.poll(**kwargs)
+
+    def _poll_history(self):
+        """Poll for a decision task and collect its entire history.
+
+        :returns:
+            The (last page of the) decision task and its events, or `None` if
+            no decision task was received or its workflow type is unknown.
+        """
+        decision_task = self._poll()
+        _LOGGER.info('Received decision task: %r', decision_task)
+        if ('events' not in decision_task or
+                not self._select_statemachine(decision_task)):
+            return (decision_task, None)
+
+        # Collect the entire history if there are enough events to become
+        # paginated
+        events = decision_task['events']
+        pages = 1
+        while 'nextPageToken' in decision_task:
+            decision_task = self._poll(
+                next_page_token=decision_task['nextPageToken']
+            )
+            pages += 1
+            if 'events' in decision_task:
+                events.extend(decision_task['events'])
+
+        self.counters['history_pages'] += pages
+        self.counters['history_events'] += len(events)
+        metrics.record_value('history_pages', pages)
+        return (decision_task, events)
+
+    def _poll_new_history(self):
+        """Poll for a decision task and collect the events of its history not
+        yet applied to the cached state of the workflow run.
+
+        The history is fetched newest first, paging stops as soon as it
+        reaches the last event applied by the state machine. Without a cached
+        state the entire history is fetched.
+
+        :returns:
+            The (last page of the) decision task and its events, sorted by
+            eventId, or `None` if no decision task was received or its
+            workflow type is unknown.
+        """
+        decision_task = self._poll(reverse_order=True)
+        _LOGGER.info('Received decision task: %r', decision_task)
+        if ('events' not in decision_task or
+                not self._select_statemachine(decision_task)):
+            return (decision_task, None)
+
+        run_id = decision_task['workflowExecution']['runId']
+        previous_started_id = decision_task.get('previousStartedEventId', 0)
+        last_event_id = self.statemachine.last_event_id(run_id)
+        if last_event_id is None:
+            last_event_id = self._checkpoint_event_id(decision_task['events'])
+
+        events = list(decision_task['events'])
+        pages = 1
+        while ('nextPageToken' in decision_task and
+               (last_event_id is None or
+                events[-1]['eventId'] > last_event_id + 1)):
+            decision_task = self._poll(
+                reverse_order=True,
+                next_page_token=decision_task['nextPageToken']
+            )
+            pages += 1
+            page_events = decision_task.get('events', ())
+            events.extend(page_events)
+            if last_event_id is None:
+                last_event_id = self._checkpoint_event_id(page_events)
+        events.reverse()
+
+        # Events before the oldest one we fetched were all applied already
+        events_skipped = events[0]['eventId'] - 1
+        pages_skipped = -(-events_skipped // HISTORY_PAGE_SIZE)
+        _LOGGER.info('Fetched %d events in %d pages (%d new since the '
+                     'previous decision), skipped %d events in about %d '
+                     'pages',
+                     len(events), pages,
+                     events[-1]['eventId'] - previous_started_id,
+                     events_skipped, pages_skipped)
+
+        self.counters['history_pages'] += pages
+        self.counters['history_events'] += len(events)
+        self.counters['history_pages_skipped'] += pages_skipped
+        self.counters['history_events_skipped'] += events_skipped
+        metrics.record_value('history_pages', pages)
+        return (decision_task, events)
+
+    def _poll_older_history(self, decision_task, events):
+        """Fetch the rest of a history collected by :meth:`_poll_new_history`.
+
+        :returns:
+            The last page of the decision task and the entire history, sorted
+            by eventId.
+        """
+        older_events = []
+        while 'nextPageToken' in decision_task:
+            decision_task = self._poll(
+                reverse_order=True,
+                next_page_token=decision_task['nextPageToken']
+            )
+            self.counters['history_pages'] += 1
+            older_events.extend(decision_task.get('events', ()))
+        older_events.reverse()
+
+        self.counters['history_events'] += len(older_events)
+        return (decision_task, older_events + events)
+
+    def _find_checkpoint(self, events):
+        """Return the snapshot of the first checkpoint in `events`, if any.
+        """
+        if not self.checkpoints:
+            return None
+
+        for event in events:
+            if event['eventType'] != 'DecisionTaskCompleted':
+                continue
+            attributes = event['decisionTaskCompletedEventAttributes']
+            data = decode_checkpoint(attributes.get('executionContext'))
+            if data is not None:
+                return data
+        return None
+
+    def _checkpoint_event_id(self, events):
+        """Return the last eventId of the first checkpoint in `events`.
+        """
+        data = self._find_checkpoint(events)
+        if data is None:
+            return None
+        try:
+            return snapshot_event_id(data)
+        except SnapshotError:
+            return None
+
+    def _checkpoint(self):
+        """Return the checkpoint of the state machine's run as an
+        `executionContext`, if checkpoints are enabled.
+        """
+        if not self.checkpoints or self.statemachine.state.is_in_state(
+                'completed'):
+            return None
+
+        try:
+            context = encode_checkpoint(self.statemachine.snapshot())
+        except SnapshotError:
+            _LOGGER.exception('Failed to checkpoint the state')
+            self.counters['checkpoints_failed'] += 1
+            return None
+
+        if context is None:
+            _LOGGER.warning('State checkpoint too big for the execution '
+                            'context, the next decision will replay it')
+            self.counters['checkpoints_too_big'] += 1
+            return None
+
+        self.counters['checkpoints_written'] += 1
+        self.counters['checkpoints_bytes'] += len(context)
+        return context
+
+    def _decide(self, events, workflow_execution):
+        """Run :meth:`_run`, through the profiler if any.
+        """
+        if self.profiler is None:
+            return self._run(events, workflow_execution)
+        return self.profiler.run(self._run, events, workflow_execution)
+
     def _run(self, events, workflowExecution):
-        # Run the statemachine on the events
-        results = self.statemachine.eval(events)
+        """Compute the decisions for a workflow execution from its events.
+
+        :returns:
+            A tuple of the decisions and the list of notifications to publish.
+        """
+        # Run the statemachine on the events, resuming from the latest
+        # checkpoint if the run is not cached.
+        plan = self.statemachine.plan
+        with metrics.timed('replay'):
+            # Also per workflow type, whether the replay succeeds or not
+            with metrics.timed('replay:{0}:{1}'.format(plan.name,
+                                                       plan.version)):
+                results = self.statemachine.eval(
+                    events,
+                    run_id=workflowExecution['runId'],
+                    checkpoint=self._find_checkpoint(reversed(events))
+                )
 
         # Now we can do 4 things:
         #  - Complete the workflow
@@ -63,29 +338,30 @@ class SWFDecider(swf.Decider):
         #  - Schedule more activities
         #  - Nothing
         decisions = swf.Layer1Decisions()
+        notifications = []
 
         if self.statemachine.is_succeeded:
-            self.sqs.send_message(self.output_queue, json.dumps({
+            notifications.append({
                 'time': time.time(),
                 'type': 'WORKFLOW_COMPLETED',
                 'data': {
                     'workflow': workflowExecution
                 }
-            }))
+            })
             decisions.complete_workflow_execution(result=None)
-            return decisions
+            return (decisions, notifications)
 
         elif self.statemachine.is_failed:
             # FIXME: Improve error reporting
-            self.sqs.send_message(self.output_queue, json.dumps({
+            notifications.append({
                 'time': time.time(),
                 'type': 'WORKFLOW_FAILED',
                 'data': {
                     'workflow': workflowExecution
                 }
-            }))
+            })
             decisions.fail_workflow_execution(reason='State machine aborted')
-            return decisions
+            return (decisions, notifications)
 
         # We are still going, start any ready activity
         for next_step in results:
@@ -98,7 +374,7 @@ class SWFDecider(swf.Decider):
                 else None
             )
 
-            self.sqs.send_message(self.output_queue, json.dumps({
+            notifications.append({
                 'time': time.time(),
                 'type': 'ACTIVITY_SCHEDULED',
                 'data': {
@@ -109,13 +385,14 @@ class SWFDecider(swf.Decider):
                         'activityVersion': activity.version
                     }
                 }
-            }))
+            })
             decisions.schedule_activity_task(
                 activity_id=next_step.name,
                 activity_type_name=activity.name,
                 activity_type_version=activity.version,
                 task_list=activity.task_list,
-                control=None,  # FIXME: Do we want to pass context data?
+                # The state is checkpointed in the executionContext instead
+                control=None,
                 heartbeat_timeout=activity.heartbeat_timeout,
                 schedule_to_close_timeout=activity.schedule_to_close_timeout,
                 schedule_to_start_timeout=activity.schedule_to_start_timeout,
@@ -123,4 +400,4 @@ class SWFDecider(swf.Decider):
                 input=activity_input,
             )
 
-        return decisions
+        return (decisions, notifications)
@@ -0,0 +1,199 @@
+"""Synthetic plans and SWF histories, for scaling tests and benchmarks.
+
+Plans are dictionaries for :meth:`~pydecider.plan.Plan.from_data`, of a given
+shape and size:
+
+`chain`
+    `size` sequential steps.
+`fanout`
+    A first step, `size` parallel steps requiring it and a last step
+    requiring all of them.
+`diamond`
+    `size` diamonds in sequence: a step, two parallel steps requiring it and a
+    step requiring both.
+`random`
+    `size` steps, each requiring up to 3 random previous steps.
+
+Every step passes the `value` output of its requirements to its activity.
+Histories are produced by simulating SWF and a decider scheduling all the
+ready steps, with activities completing in a random order.
+"""
+
+from __future__ import (
+    absolute_import,
+    division,
+    print_function
+)
+
+import json
+import logging
+import random
+
+_LOGGER = logging.getLogger(__name__)
+
+SHAPES = ('chain', 'fanout', 'diamond', 'random')
+
+ACTIVITY_NAME = 'Synthetic'
+
+
+def generate_plan(shape, size, seed=0):
+    """Return the data of a synthetic plan.
+
+    :param str shape:
+        One of :data:`SHAPES`.
+    :param int size:
+        Size of the shape (see the module documentation).
+    :param seed:
+        Seed of the `random` shape.
+    """
+    if shape == 'chain':
+        requires = [[] if idx == 0 else [idx - 1] for idx in range(size)]
+
+    elif shape == 'fanout':
+        requires = ([[]] + [[0]] * size + [list(range(1, size + 1))])
+
+    elif shape == 'diamond':
+        requires = []
+        for idx in range(size):
+            top = len(requires)
+            requires.append([top - 1] if idx else [])
+            requires.append([top])
+            requires.append([top])
+            requires.append([top + 1, top + 2])
+
+    elif shape == 'random':
+        rand = random.Random(seed)
+        requires = [
+            sorted(rand.sample(range(idx), min(idx, rand.randint(0, 3))))
+            for idx in range(size)
+        ]
+
+    else:
+        raise ValueError('Unknown plan shape %r' % shape)
+
+    steps = []
+    for (idx, parents) in enumerate(requires):
+        names = ['step_%d' % parent for parent in parents]
+        step_input = '{"step": %d, "parents": [%s]}' % (
+            idx,
+            ', '.join('{{%s.value}}' % name for name in names)
+        )
+        steps.append({
+            'name': 'step_%d' % idx,
+            'activity': ACTIVITY_NAME,
+            'requires': names,
+            'input': step_input,
+        })
+
+    return {
+        'name': 'Synthetic-%s-%d' % (shape, size),
+        'version': '1.0',
+        'default_execution_start_to_close_timeout': '3600',
+        'default_task_start_to_close_timeout': '300',
+        'input_spec': {'type': 'object'},
+        'activities': [{
+            'name': ACTIVITY_NAME,
+            'version': '1.0',
+            'outputs_spec': {'value': '$.value'},
+        }],
+        'steps': steps,
+    }
+
+
+class _History(object):
+    """Events being generated.
+    """
+
+    __slots__ = ('events',)
+
+    def __init__(self):
+        self.events = []
+
+    def add(self, event_type, **attributes):
+        event = {
+            'eventId': len(self.events) + 1,
+            'eventType': event_type,
+        }
+        if attributes:
+            key = event_type[0].lower() + event_type[1:] + 'EventAttributes'
+            event[key] = attributes
+        self.events.append(event)
+        return event['eventId']
+
+
+def generate_history(plan_data, seed=0, progress=1.0, decision_timeouts=0):
+    """Return the events of a run of a synthetic plan.
+
+    The history stops at the last `DecisionTaskStarted` of the run (the
+    decision completing the workflow) or, with `progress` below 1, at the
+    first one after that fraction of the steps completed.
+
+    :param dict plan_data:
+        Data of the plan, from :func:`generate_plan`.
+    :param seed:
+        Seed of the order the activities complete in, and of their results.
+    :param float progress:
+        Fraction of the steps completed when the history stops.
+    :param int decision_timeouts:
+        Number of decision tasks timing out before each decision, to pad the
+        history.
+    """
+    rand = random.Random(seed)
+    history = _History()
+    steps = dict((step['name'], set(step.get('requires', ())))
+                 for step in plan_data['steps'])
+    stop_after = int(progress * len(steps))
+    pending = set(steps)
+    running = {}
+    completed = set()
+
+    history.add('WorkflowExecutionStarted',
+                input=json.dumps({'seed': seed}))
+    while True:
+        for _ in range(decision_timeouts):
+            scheduled = history.add('DecisionTaskScheduled')
+            started = history.add('DecisionTaskStarted',
+                                  scheduledEventId=scheduled)
+            history.add('DecisionTaskTimedOut', scheduledEventId=scheduled,
+                        startedEventId=started)
+        scheduled = history.add('DecisionTaskScheduled')
+        started = history.add('DecisionTaskStarted',
+                              scheduledEventId=scheduled)
+        if len(completed) >= stop_after or not (pending or running):
+            break
+        decision = history.add('DecisionTaskCompleted',
+                               scheduledEventId=scheduled,
+                               startedEventId=started)
+
+        # The decider schedules all the ready steps
+        ready = sorted(name for name in pending
+                       if steps[name] <= completed)
+        for name in ready:
+            pending.discard(name)
+            running[name] = history.add(
+                'ActivityTaskScheduled',
+                activityId=name,
+                activityType={'name': ACTIVITY_NAME, 'version': '1.0'},
+                decisionTaskCompletedEventId=decision,
+            )
+
+        # Some of the running activities complete before the next decision
+        names = sorted(running)
+        for name in rand.sample(names, rand.randint(1, len(names))):
+            scheduled_id = running.pop(name)
+            started_id = history.add('ActivityTaskStarted',
+                                     scheduledEventId=scheduled_id)
+            history.add('ActivityTaskCompleted',
+                        scheduledEventId=scheduled_id,
+                        startedEventId=started_id,
+                        result=json.dumps({'value': rand.randint(0, 1000)}))
+            completed.add(name)
+
+    return history.events
+
+
+__all__ = [
+    'SHAPES',
+    'generate_history',
+    'generate_plan',
+]
@@ -110,6 +110,66 @@ class StepStateTest(unittest.TestCase):
             }
         )
 
+    def test_outputs_spec_generator(self):
+        my_act = pydecider.activity.Activity.from_data(
+            {
+                'name': 'MyActivity',
+                'version': '1.0',
+                'outputs_spec': {
+                    'big': '$.numbers.where($ > 1)',
+                }
+            }
+        )
+
+        self.assertEquals(
+            my_act.render_outputs({'numbers': [1, 2, 3]}),
+            {'big': [2, 3]}
+        )
+
+    def test_lazy(self):
+        data = {
+            'name': 'MyActivity',
+            'version': '1.0',
+            'input_spec': {'type': 'object'},
+            'outputs_spec': {
+                'b': '$.hello',
+                'bad': '$.(',
+            }
+        }
+        self.assertRaises(Exception,
+                          pydecider.activity.Activity.from_data, data)
+
+        # Errors are only reported on use
+        my_act = pydecider.activity.Activity.from_data(data, lazy=True)
+        self.assertRaises(Exception, my_act.check_input, {})
+
+        del data['outputs_spec']['bad']
+        my_act = pydecider.activity.Activity.from_data(data, lazy=True)
+        self.assertEquals(my_act.render_outputs({'hello': 'world'}),
+                          {'b': 'world'})
+        self.assertRaises(pydecider.schema.ValidationError,
+                          my_act.check_input, [])
+
+    def test_render_result(self):
+        my_act = pydecider.activity.Activity.from_data(
+            {
+                'name': 'MyActivity',
+                'version': '1.0',
+                'outputs_spec': {
+                    'b': '$.hello',
+                }
+            }
+        )
+        cache = pydecider.activity.RESULTS_CACHE
+        cache.clear()
+
+        rendered = my_act.render_result('{"hello": "world"}')
+        self.assertEquals(rendered, {'b': 'world'})
+        self.assertTrue(my_act.render_result(u'{"hello": "world"}') is rendered)
+        self.assertEquals(my_act.render_result('{"hello": "you"}'),
+                          {'b': 'you'})
+        self.assertEquals((cache.hits, cache.misses), (1, 2))
+
     def test_invalid_outputs_spec(self):
         self.assertRaises(
             pydecider.schema.ValidationError,
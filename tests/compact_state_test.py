@@ -0,0 +1,97 @@
+"""Unit tests for pydecider.compact_state
+"""
+
+import os
+import sys
+import unittest
+
+sys.path.append(
+    os.path.realpath(
+        os.path.join(
+            os.path.dirname(__file__),
+            '..'
+        )
+    )
+)
+
+import yaml
+
+import pydecider
+import pydecider.plan
+import pydecider.state_machine
+from pydecider.compact_state import CompactState
+from pydecider.plan_graph import DeciderStep, PlanGraph
+from pydecider.state_status import StepStateStatus
+
+
+class CompactStateTest(unittest.TestCase):
+    MY_DIR = os.path.realpath(os.path.dirname(__file__))
+
+    def setUp(self):
+        graph = PlanGraph([
+            DeciderStep('foo'),
+            DeciderStep('bar', requires=['foo']),
+            DeciderStep('baz', requires=[('foo', 'failed')]),
+        ])
+        self.state = CompactState(graph)
+
+    def _ready_names(self):
+        return sorted(step.name for step in self.state.step_next())
+
+    def test_step_updates(self):
+        with self.state(1):
+            self.state.set_input({'a': 1})
+        self.assertEqual(self._ready_names(), ['foo'])
+
+        with self.state(2):
+            self.state.step_update('foo', 'running')
+        self.assertEqual(self._ready_names(), [])
+
+        with self.state(3):
+            self.state.step_update('foo', 'succeeded', {'b': 2},
+                                   rendered=True)
+        self.assertEqual(self._ready_names(), ['bar'])
+        self.assertEqual(self.state.step_state('baz').status,
+                         StepStateStatus.skipped)
+        self.assertEqual(self.state.step_state('foo').output, {'b': 2})
+        self.assertEqual(
+            self.state.history('foo'),
+            [
+                (StepStateStatus.ready, 1),
+                (StepStateStatus.running, 2),
+                (StepStateStatus.succeeded, 3),
+            ]
+        )
+
+        with self.state(4):
+            self.state.step_update('bar', 'succeeded', None, rendered=True)
+        self.assertTrue(self.state.is_in_state('succeeded'))
+
+    def test_state_machine(self):
+        """Replays give the same results with both State backends."""
+        with open(os.path.join(self.MY_DIR, 'plan_hello.yml')) as f:
+            plan = pydecider.plan.Plan.from_data(yaml.load(f))
+        with open(os.path.join(self.MY_DIR, 'plan_hello_events.yml')) as f:
+            events = yaml.load(f)['events']
+
+        for count in (3, 13, len(events)):
+            replays = []
+            for compact_state in (False, True):
+                statemachine = pydecider.state_machine.StateMachine(
+                    plan, compact_state=compact_state
+                )
+                results = statemachine.eval(events[:count])
+                replays.append((
+                    statemachine.state.status,
+                    [(result.name, result.activity_input)
+                     for result in results],
+                ))
+            self.assertEqual(replays[0], replays[1])
+        self.assertTrue(isinstance(statemachine.state, CompactState))
+        self.assertTrue(statemachine.is_succeeded)
+
+
+if __name__ == '__main__':
+    import logging
+    logging.basicConfig(level=logging.DEBUG)
+    unittest.main()
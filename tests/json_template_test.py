@@ -0,0 +1,82 @@
+"""Unit tests for pydecider.json_template
+"""
+
+import os
+import sys
+import unittest
+
+sys.path.append(
+    os.path.realpath(
+        os.path.join(
+            os.path.dirname(__file__),
+            '..'
+        )
+    )
+)
+
+import jinja2
+
+import pydecider
+import pickle
+
+from pydecider.json_template import (
+    UndefinedValue,
+    analyze_template,
+    build_template,
+    compile_template,
+)
+
+
+class JSONTemplateTest(unittest.TestCase):
+    def setUp(self):
+        self.env = jinja2.Environment()
+
+    def test_compile(self):
+        compiled = compile_template(
+            self.env,
+            '{"a": {{foo}}, "b": [1, {{bar.x["y"]}}], "c": {"d": null}}'
+        )
+        self.assertEquals(compiled.variables, ('bar', 'foo'))
+        self.assertEquals(
+            compiled.render({'foo': 'hello', 'bar': {'x': {'y': [2]}}}),
+            {'a': 'hello', 'b': [1, [2]], 'c': {'d': None}}
+        )
+
+    def test_analyze(self):
+        spec = analyze_template(self.env.parse('{"a": {{foo.b[0]}}}'))
+        compiled = build_template(self.env, pickle.loads(pickle.dumps(spec)))
+        self.assertEquals(compiled.variables, ('foo',))
+        self.assertEquals(compiled.render({'foo': {'b': [3]}}), {'a': 3})
+        self.assertIsNone(
+            analyze_template(self.env.parse('{"a": "x{{foo}}"}'))
+        )
+
+    def test_compile_fresh_structure(self):
+        compiled = compile_template(self.env, '{"a": [{{foo}}]}')
+        first = compiled.render({'foo': 1})
+        first['a'].append(2)
+        self.assertEquals(compiled.render({'foo': 1}), {'a': [1]})
+
+    def test_not_compilable(self):
+        for source in [
+                '{% if foo %}{"a": 1}{% endif %}',
+                '{"a": {{foo|upper}}}',
+                '{"a": "hello {{foo}}"}',
+                '{ {{foo}}: 1}',
+                '{"a": {{foo[bar]}}}',
+        ]:
+            self.assertTrue(compile_template(self.env, source) is None,
+                            source)
+
+    def test_undefined(self):
+        compiled = compile_template(self.env, '{"a": {{foo.b.c}}}')
+        self.assertRaises(UndefinedValue, compiled.render, {})
+        self.assertRaises(UndefinedValue, compiled.render, {'foo': {}})
+        self.assertRaises(UndefinedValue, compiled.render,
+                          {'foo': {'b': object()}})
+
+
+if __name__ == '__main__':
+    import logging
+    logging.basicConfig(level=logging.DEBUG)
+    unittest.main()
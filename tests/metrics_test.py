@@ -0,0 +1,111 @@
+"""Unit tests for pydecider.metrics
+"""
+
+import os
+import sys
+import unittest
+
+sys.path.append(
+    os.path.realpath(
+        os.path.join(
+            os.path.dirname(__file__),
+            '..'
+        )
+    )
+)
+
+import json
+import subprocess
+import textwrap
+import time
+import urllib2
+
+import pydecider
+import pydecider.metrics
+import pydecider.schema
+
+
+class MetricsTest(unittest.TestCase):
+
+    def test_timed(self):
+        timer = pydecider.metrics.REGISTRY.timer('test_timed')
+        count = timer.get_count()
+
+        with pydecider.metrics.timed('test_timed'):
+            pass
+        with self.assertRaises(KeyError):
+            with pydecider.metrics.timed('test_timed'):
+                raise KeyError('failed')
+
+        self.assertEqual(timer.get_count(), count + 2)
+        metrics = pydecider.metrics.dump_metrics()
+        self.assertIn('test_timed_99_percentile', metrics)
+        self.assertGreaterEqual(metrics['test_timed_max'], 0)
+
+    def test_counters(self):
+        pydecider.metrics.increment('test_counter')
+        pydecider.metrics.increment('test_counter', 2)
+        pydecider.metrics.record_value('test_histogram', 4)
+
+        metrics = pydecider.metrics.dump_metrics()
+        self.assertEqual(metrics['test_counter_count'], 3)
+        self.assertEqual(metrics['test_histogram_max'], 4)
+
+    def test_instrumented(self):
+        timer = pydecider.metrics.REGISTRY.timer('schema_validation')
+        count = timer.get_count()
+
+        validator = pydecider.schema.SchemaValidator({'type': 'object'})
+        validator.validate({})
+        pydecider.schema.SchemaValidator(None).validate({})
+
+        self.assertEqual(timer.get_count(), count + 1)
+
+    def test_dump_handler_locked(self):
+        """The dump signal does not deadlock a thread recording metrics."""
+        script = textwrap.dedent("""
+            import os, signal, sys, threading
+            sys.path.insert(0, %r)
+            import pydecider.metrics as metrics
+
+            dumped = threading.Event()
+            log_metrics = metrics.log_metrics
+            def logged():
+                log_metrics()
+                dumped.set()
+            metrics.log_metrics = logged
+
+            metrics.install_dump_handler()
+            with metrics._LOCK:
+                os.kill(os.getpid(), signal.SIGUSR1)
+                sum(range(1000))
+            print('dumped' if dumped.wait(5) else 'not dumped')
+        """) % os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+        child = subprocess.Popen([sys.executable, '-c', script],
+                                 stdout=subprocess.PIPE)
+        deadline = time.time() + 10
+        while child.poll() is None and time.time() < deadline:
+            time.sleep(0.05)
+        if child.poll() is None:
+            child.kill()
+            child.wait()
+            self.fail('Deadlocked on SIGUSR1')
+        self.assertEqual(child.stdout.read().strip(), 'dumped')
+
+    def test_server(self):
+        pydecider.metrics.increment('test_served')
+        server = pydecider.metrics.MetricsServer(0)
+        server.start()
+        self.addCleanup(server.stop)
+
+        response = urllib2.urlopen('http://%s:%d/' % server.address)
+        self.assertEqual(response.info()['Content-Type'], 'application/json')
+        metrics = json.load(response)
+        self.assertEqual(metrics['test_served_count'], 1)
+
+
+if __name__ == '__main__':
+    import logging
+    logging.basicConfig(level=logging.DEBUG)
+    unittest.main()
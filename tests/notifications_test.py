@@ -0,0 +1,93 @@
+"""Unit tests for pydecider.notifications
+"""
+
+import os
+import sys
+import unittest
+
+sys.path.append(
+    os.path.realpath(
+        os.path.join(
+            os.path.dirname(__file__),
+            '..'
+        )
+    )
+)
+
+import json
+import shutil
+import tempfile
+import threading
+
+import pydecider
+import pydecider.notifications
+
+
+class NotificationSinkTest(unittest.TestCase):
+
+    NOTIFICATIONS = [
+        {'type': 'ACTIVITY_SCHEDULED', 'data': {'n': 1}},
+        {'type': 'WORKFLOW_COMPLETED', 'data': {'n': 2}},
+    ]
+
+    def test_file_sink(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        path = os.path.join(tmpdir, 'notifications.json')
+
+        sink = pydecider.notifications.FileSink(path)
+        sink.publish(self.NOTIFICATIONS[:1])
+        sink.publish([])
+        sink.publish(self.NOTIFICATIONS[1:])
+        sink.close()
+
+        with open(path) as f:
+            self.assertEqual([json.loads(line) for line in f],
+                             self.NOTIFICATIONS)
+
+    def test_file_sink_shared(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        path = os.path.join(tmpdir, 'notifications.json')
+
+        sinks = [pydecider.notifications.FileSink(path) for _ in range(4)]
+        # One lock serializes the writes of all the deciders
+        self.assertEqual(len(set(id(sink._lock) for sink in sinks)), 1)
+
+        notifications = [{'n': n, 'data': 'x' * 10000} for n in range(50)]
+        threads = [threading.Thread(target=sink.publish,
+                                    args=(notifications,))
+                   for sink in sinks]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # Closing a sink keeps the stream of the others open
+        sinks[0].close()
+        sinks[0].close()
+        sinks[1].publish(notifications[:1])
+        for sink in sinks[1:]:
+            sink.close()
+
+        with open(path) as f:
+            lines = [json.loads(line) for line in f]
+        self.assertEqual(len(lines), 201)
+        self.assertEqual(pydecider.notifications._FILE_STREAMS, {})
+
+    def test_memory_sink(self):
+        sink = pydecider.notifications.MemorySink()
+        sink.publish(self.NOTIFICATIONS)
+        sink.close()
+        self.assertEqual(sink.notifications, self.NOTIFICATIONS)
+
+    def test_null_sink(self):
+        sink = pydecider.notifications.NullSink()
+        sink.publish(self.NOTIFICATIONS)
+        sink.close()
+
+
+if __name__ == '__main__':
+    import logging
+    logging.basicConfig(level=logging.DEBUG)
+    unittest.main()
@@ -0,0 +1,79 @@
+"""Unit tests for pydecider.plan_graph
+"""
+
+import os
+import sys
+import unittest
+
+sys.path.append(
+    os.path.realpath(
+        os.path.join(
+            os.path.dirname(__file__),
+            '..'
+        )
+    )
+)
+
+import pydecider
+from pydecider.plan_graph import (
+    END_STEP,
+    INIT_STEP,
+    DeciderStep,
+    PlanGraph,
+)
+from pydecider.state_status import StepStateStatus
+from pydecider.step import StepDefinitionError
+
+
+class PlanGraphTest(unittest.TestCase):
+
+    def test_graph(self):
+        graph = PlanGraph([
+            DeciderStep('c', requires=['a', ('b', 'failed')]),
+            DeciderStep('a'),
+            DeciderStep('b', requires=['a']),
+        ])
+
+        self.assertEqual(graph.names, (INIT_STEP, 'a', 'b', 'c', END_STEP))
+        self.assertEqual(graph.ids['c'], 3)
+        self.assertEqual(graph.parents[3], (0, 1, 2))
+        self.assertEqual(graph.children[1], (2, 3, 4))
+        self.assertEqual(graph.children[0], (1, 2, 3, 4))
+        self.assertEqual(graph.parents[graph.end_id], (0, 1, 2, 3))
+        self.assertEqual(
+            graph.requirements[3],
+            ((1, StepStateStatus.completed.value),
+             (2, StepStateStatus.failed.value))
+        )
+
+    def test_graph_unknown_requires(self):
+        self.assertRaises(
+            StepDefinitionError,
+            PlanGraph,
+            [DeciderStep('a', requires=['b'])]
+        )
+
+    def test_graph_duplicate(self):
+        self.assertRaises(
+            StepDefinitionError,
+            PlanGraph,
+            [DeciderStep('a'), DeciderStep('a')]
+        )
+
+    def test_graph_cycle(self):
+        self.assertRaises(
+            StepDefinitionError,
+            PlanGraph,
+            [
+                DeciderStep('a'),
+                DeciderStep('b', requires=['a', 'd']),
+                DeciderStep('c', requires=['b']),
+                DeciderStep('d', requires=['c']),
+            ]
+        )
+
+
+if __name__ == '__main__':
+    import logging
+    logging.basicConfig(level=logging.DEBUG)
+    unittest.main()
@@ -0,0 +1,124 @@
+"""Unit tests for pydecider.plan_loader
+"""
+
+import os
+import sys
+import unittest
+
+sys.path.append(
+    os.path.realpath(
+        os.path.join(
+            os.path.dirname(__file__),
+            '..'
+        )
+    )
+)
+
+import json
+import multiprocessing
+import shutil
+import tempfile
+
+import mock
+
+import pydecider
+import pydecider.plan_loader
+import pydecider.plan_registry
+import pydecider.synthetic
+
+
+class PlanLoaderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.cache_path = os.path.join(self.tmpdir, 'cache')
+
+    def _write_plans(self, *shapes):
+        paths = []
+        for shape in shapes:
+            path = os.path.join(self.tmpdir, shape + '.json')
+            with open(path, 'w') as plan_file:
+                json.dump(pydecider.synthetic.generate_plan(shape, 10),
+                          plan_file)
+            paths.append(path)
+        return paths
+
+    def test_load(self):
+        paths = self._write_plans('chain', 'fanout', 'diamond')
+        loader = pydecider.plan_loader.PlanLoader(processes=2)
+
+        plans = loader.load(paths)
+
+        self.assertEqual([plan.name for plan in plans],
+                         ['Synthetic-chain-10', 'Synthetic-fanout-10',
+                          'Synthetic-diamond-10'])
+        self.assertEqual(loader.counters['compiled'], 3)
+        step = plans[0].steps[1]
+        self.assertEqual(step.prepare({'step_0': {'value': 'v'}}),
+                         {'step': 1, 'parents': ['v']})
+
+    def test_cache(self):
+        paths = self._write_plans('chain', 'fanout')
+        loader = pydecider.plan_loader.PlanLoader(cache_path=self.cache_path)
+        loader.load(paths)
+        self.assertEqual(loader.counters['cache_misses'], 2)
+        self.assertEqual(len(os.listdir(self.cache_path)), 2)
+
+        loader = pydecider.plan_loader.PlanLoader(cache_path=self.cache_path)
+        plans = loader.load(paths, overrides={'version': '2.0'})
+        self.assertEqual(loader.counters['cache_hits'], 2)
+        self.assertEqual(loader.counters['compiled'], 0)
+        self.assertEqual([(plan.name, plan.version) for plan in plans],
+                         [('Synthetic-chain-10', '2.0'),
+                          ('Synthetic-fanout-10', '2.0')])
+
+        # Corrupted cache files are recompiled
+        for filename in os.listdir(self.cache_path):
+            with open(os.path.join(self.cache_path, filename), 'w') as f:
+                f.write('garbage')
+        loader = pydecider.plan_loader.PlanLoader(cache_path=self.cache_path)
+        self.assertEqual(len(loader.load(paths)), 2)
+        self.assertEqual(loader.counters['cache_errors'], 2)
+        self.assertEqual(loader.counters['compiled'], 2)
+
+    def test_invalid(self):
+        paths = self._write_plans('chain')
+        invalid = os.path.join(self.tmpdir, 'invalid.yml')
+        with open(invalid, 'w') as plan_file:
+            plan_file.write('steps: [{"name": "a", "activity": "b", '
+                            '"input": "{{"}]\n')
+        loader = pydecider.plan_loader.PlanLoader(processes=2,
+                                                  cache_path=self.cache_path)
+
+        precompiled = loader.precompile(paths + [invalid])
+
+        self.assertEqual(list(precompiled), paths)
+        self.assertEqual(loader.counters['failed'], 1)
+        self.assertRaises(Exception, loader.load, [invalid])
+
+    def test_registry(self):
+        self._write_plans('chain', 'fanout')
+        loader = pydecider.plan_loader.PlanLoader(processes=2)
+        with mock.patch('multiprocessing.Pool',
+                        wraps=multiprocessing.Pool) as pool:
+            registry = pydecider.plan_registry.PlanRegistry.from_paths(
+                [self.tmpdir], loader=loader
+            )
+        self.assertEqual(pool.call_count, 1)
+        self.assertEqual([plan.name for plan in registry],
+                         ['Synthetic-chain-10', 'Synthetic-fanout-10'])
+
+        # Reloads run next to the decider threads, without forking
+        self._write_plans('diamond', 'random')
+        with mock.patch('multiprocessing.Pool') as pool:
+            self.assertEqual(len(registry.reload()), 2)
+        self.assertFalse(pool.called)
+        self.assertEqual(len(registry), 4)
+        self.assertEqual(loader.counters['compiled'], 4)
+
+
+if __name__ == '__main__':
+    import logging
+    logging.basicConfig(level=logging.DEBUG)
+    unittest.main()
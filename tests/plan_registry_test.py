@@ -0,0 +1,191 @@
+"""Unit tests for pydecider.plan_registry
+"""
+
+import os
+import sys
+import unittest
+
+sys.path.append(
+    os.path.realpath(
+        os.path.join(
+            os.path.dirname(__file__),
+            '..'
+        )
+    )
+)
+
+import json
+import shutil
+import tempfile
+import threading
+
+import pydecider
+import pydecider.plan_registry
+import pydecider.synthetic
+
+
+class PlanRegistryTest(unittest.TestCase):
+    MY_DIR = os.path.realpath(os.path.dirname(__file__))
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+
+    def _write_plan(self, filename, plan_data, mtime=None):
+        path = os.path.join(self.tmpdir, filename)
+        with open(path, 'w') as plan_file:
+            json.dump(plan_data, plan_file)
+        if mtime is not None:
+            # Changes within the resolution of mtime go unnoticed
+            os.utime(path, (mtime, mtime))
+
+    def _chain(self, size, version='1.0'):
+        plan_data = pydecider.synthetic.generate_plan('chain', size)
+        plan_data['name'] = 'Chain'
+        plan_data['version'] = version
+        return plan_data
+
+    def test_from_directory(self):
+        shutil.copy(os.path.join(self.MY_DIR, 'plan_hello.yml'), self.tmpdir)
+        plan_data = pydecider.synthetic.generate_plan('chain', 3)
+        self._write_plan('chain.json', plan_data)
+        plan_data['version'] = '2.0'
+        self._write_plan('chain-2.json', plan_data)
+        self._write_plan('README', {})
+
+        registry = pydecider.plan_registry.PlanRegistry.from_directory(
+            self.tmpdir
+        )
+
+        self.assertEqual(len(registry), 3)
+        self.assertEqual(
+            [(plan.name, plan.version) for plan in registry],
+            [('HelloWorkFlow', '1.0'),
+             ('Synthetic-chain-3', '1.0'),
+             ('Synthetic-chain-3', '2.0')]
+        )
+        self.assertEqual(registry.get('Synthetic-chain-3', '2.0').version,
+                         '2.0')
+        self.assertIsNone(registry.get('Synthetic-chain-3', '3.0'))
+
+    def test_duplicate(self):
+        plan_data = pydecider.synthetic.generate_plan('chain', 3)
+        self._write_plan('a.json', plan_data)
+        self._write_plan('b.json', plan_data)
+
+        self.assertRaises(
+            pydecider.plan_registry.PlanRegistryError,
+            pydecider.plan_registry.PlanRegistry.from_directory,
+            self.tmpdir
+        )
+
+    def test_reload(self):
+        self._write_plan('chain.json', self._chain(3), mtime=1000)
+        registry = pydecider.plan_registry.PlanRegistry.from_paths(
+            [self.tmpdir]
+        )
+        plan_1 = registry.get('Chain', '1.0')
+        self.assertEqual(len(plan_1.steps), 3)
+
+        # Nothing changed
+        self.assertEqual(registry.reload(), [])
+        self.assertIs(registry.get('Chain', '1.0'), plan_1)
+
+        # Changed file, same version
+        self._write_plan('chain.json', self._chain(4), mtime=2000)
+        self.assertEqual(len(registry.reload()), 1)
+        self.assertEqual(len(registry.get('Chain', '1.0').steps), 4)
+
+        # New version, the previous one is kept
+        self._write_plan('chain-2.json', self._chain(5, '2.0'), mtime=2000)
+        self.assertEqual(
+            [(plan.name, plan.version) for plan in registry.reload()],
+            [('Chain', '2.0')]
+        )
+        self.assertEqual(len(registry), 2)
+        self.assertEqual(len(registry.get('Chain', '1.0').steps), 4)
+        self.assertEqual(registry.counters['loaded'], 3)
+
+    def test_reload_rejected(self):
+        self._write_plan('chain.json', self._chain(3), mtime=1000)
+        registry = pydecider.plan_registry.PlanRegistry.from_paths(
+            [self.tmpdir]
+        )
+        plan_1 = registry.get('Chain', '1.0')
+
+        # Invalid plan
+        with open(os.path.join(self.tmpdir, 'chain.json'), 'w') as plan_file:
+            plan_file.write('{"name": "Chain", "version": "1.0", "steps": [')
+        self.assertEqual(registry.reload(), [])
+        self.assertIs(registry.get('Chain', '1.0'), plan_1)
+        self.assertEqual(registry.counters['rejected'], 1)
+        # Not retried until it changes
+        self.assertEqual(registry.reload(), [])
+        self.assertEqual(registry.counters['rejected'], 1)
+
+        # Same version in another file
+        self._write_plan('copy.json', self._chain(4), mtime=1000)
+        self.assertEqual(registry.reload(), [])
+        self.assertIs(registry.get('Chain', '1.0'), plan_1)
+        self.assertEqual(registry.counters['rejected'], 2)
+
+        # Fixed
+        self._write_plan('chain.json', self._chain(5), mtime=2000)
+        self.assertEqual(len(registry.reload()), 1)
+        self.assertEqual(len(registry.get('Chain', '1.0').steps), 5)
+
+    def test_reload_renamed(self):
+        self._write_plan('a.json', self._chain(3), mtime=1000)
+        registry = pydecider.plan_registry.PlanRegistry.from_paths(
+            [self.tmpdir]
+        )
+        plan_1 = registry.get('Chain', '1.0')
+
+        os.rename(os.path.join(self.tmpdir, 'a.json'),
+                  os.path.join(self.tmpdir, 'b.json'))
+        self.assertEqual(len(registry.reload()), 1)
+        self.assertEqual(registry.counters['rejected'], 0)
+        self.assertIsNot(registry.get('Chain', '1.0'), plan_1)
+
+        # Edited under its new name
+        self._write_plan('b.json', self._chain(4), mtime=2000)
+        self.assertEqual(len(registry.reload()), 1)
+        self.assertEqual(len(registry.get('Chain', '1.0').steps), 4)
+
+        # Removed, the plan is kept
+        os.unlink(os.path.join(self.tmpdir, 'b.json'))
+        self.assertEqual(registry.reload(), [])
+        self.assertEqual(len(registry.get('Chain', '1.0').steps), 4)
+        self.assertEqual(registry.counters['rejected'], 0)
+
+    def test_overrides(self):
+        self._write_plan('chain.json', self._chain(3))
+        registry = pydecider.plan_registry.PlanRegistry.from_paths(
+            [os.path.join(self.tmpdir, 'chain.json')],
+            overrides={'version': '3.0'}
+        )
+        self.assertEqual([(plan.name, plan.version) for plan in registry],
+                         [('Chain', '3.0')])
+
+    def test_watcher(self):
+        self._write_plan('chain.json', self._chain(3), mtime=1000)
+        registry = pydecider.plan_registry.PlanRegistry.from_paths(
+            [self.tmpdir]
+        )
+        reloaded = threading.Event()
+        watcher = pydecider.plan_registry.PlanWatcher(
+            registry, interval=0.01,
+            on_reload=lambda plans: reloaded.set()
+        )
+        watcher.start()
+        self.addCleanup(watcher.stop)
+
+        self._write_plan('chain.json', self._chain(4), mtime=2000)
+        self.assertTrue(reloaded.wait(5))
+        self.assertEqual(len(registry.get('Chain', '1.0').steps), 4)
+
+
+if __name__ == '__main__':
+    import logging
+    logging.basicConfig(level=logging.DEBUG)
+    unittest.main()
@@ -0,0 +1,83 @@
+"""Unit tests for pydecider.pool
+"""
+
+import os
+import sys
+import threading
+import unittest
+
+sys.path.append(
+    os.path.realpath(
+        os.path.join(
+            os.path.dirname(__file__),
+            '..'
+        )
+    )
+)
+
+import pydecider
+import pydecider.pool
+
+
+class FakeDecider(object):
+
+    def __init__(self, plan, runs=3, fail_on=None):
+        self.plan = plan
+        self.runs = runs
+        self.fail_on = fail_on
+        self.threads = set()
+        self.count = 0
+
+    def run(self):
+        self.threads.add(threading.current_thread().name)
+        self.count += 1
+        if self.count == self.fail_on:
+            raise Exception('Boom')
+        return self.count < self.runs
+
+
+class DeciderPoolTest(unittest.TestCase):
+
+    def test_pool_run(self):
+        """Each worker runs its own decider sharing the same plan."""
+        plan = object()
+        deciders = []
+
+        def factory(idx):
+            decider = FakeDecider(plan, fail_on=2)
+            deciders.append(decider)
+            return decider
+
+        pool = pydecider.pool.DeciderPool(factory, concurrency=4)
+        pool.run()
+
+        self.assertEqual(len(deciders), 4)
+        self.assertEqual(len(set(id(d) for d in deciders)), 4)
+        for decider in deciders:
+            self.assertTrue(decider.plan is plan)
+            # The failed run did not stop the worker
+            self.assertEqual(decider.count, 3)
+            self.assertEqual(len(decider.threads), 1)
+        self.assertEqual(pool.alive_workers, [])
+
+    def test_pool_stop(self):
+        started = threading.Event()
+
+        class BlockingDecider(object):
+            def run(self):
+                started.set()
+                return True
+
+        pool = pydecider.pool.DeciderPool(lambda idx: BlockingDecider(),
+                                          concurrency=2)
+        pool.start()
+        started.wait(5)
+        pool.stop()
+        pool.join(5)
+        self.assertEqual(pool.alive_workers, [])
+
+
+if __name__ == '__main__':
+    import logging
+    logging.basicConfig(level=logging.DEBUG)
+    unittest.main()
@@ -0,0 +1,90 @@
+"""Unit tests for pydecider.profiling
+"""
+
+import os
+import sys
+import unittest
+
+sys.path.append(
+    os.path.realpath(
+        os.path.join(
+            os.path.dirname(__file__),
+            '..'
+        )
+    )
+)
+
+import pstats
+import shutil
+import tempfile
+
+import pydecider
+import pydecider.profiling
+import pydecider.replay
+
+
+def decide(events, _workflow_execution):
+    return len(events)
+
+
+def fail(_events, _workflow_execution):
+    raise KeyError('failed')
+
+
+class DecisionProfilerTest(unittest.TestCase):
+    EXECUTION = {'workflowId': 'job/1', 'runId': 'run1'}
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        self.events = [{'eventId': 1, 'eventType': 'DecisionTaskStarted'}]
+
+    def _captured(self):
+        return sorted(os.listdir(self.tmpdir))
+
+    def test_every(self):
+        profiler = pydecider.profiling.DecisionProfiler(self.tmpdir, every=2)
+
+        for _ in range(3):
+            self.assertEqual(
+                profiler.run(decide, self.events, self.EXECUTION), 1
+            )
+
+        captured = self._captured()
+        self.assertEqual(len(captured), 2)
+        self.assertTrue(captured[0].endswith('-job_1-run1-1.json'))
+        self.assertTrue(captured[1].endswith('-job_1-run1-1.prof'))
+        self.assertEqual(profiler.counters['saved'], 1)
+
+        # The captured history can be replayed and the stats loaded
+        self.assertEqual(
+            pydecider.replay.load_history(
+                os.path.join(self.tmpdir, captured[0])
+            ),
+            self.events
+        )
+        stats = pstats.Stats(os.path.join(self.tmpdir, captured[1]))
+        self.assertTrue(any(func[2] == 'decide' for func in stats.stats))
+
+    def test_slower_than(self):
+        profiler = pydecider.profiling.DecisionProfiler(self.tmpdir,
+                                                        slower_than=60)
+        profiler.run(decide, self.events, self.EXECUTION)
+        self.assertEqual(self._captured(), [])
+
+        profiler.slower_than = 0
+        profiler.run(decide, self.events, self.EXECUTION)
+        self.assertEqual(len(self._captured()), 2)
+
+    def test_failed_decision(self):
+        profiler = pydecider.profiling.DecisionProfiler(self.tmpdir, every=1)
+
+        self.assertRaises(KeyError,
+                          profiler.run, fail, self.events, self.EXECUTION)
+        self.assertEqual(profiler.counters['saved'], 1)
+
+
+if __name__ == '__main__':
+    import logging
+    logging.basicConfig(level=logging.DEBUG)
+    unittest.main()
@@ -0,0 +1,140 @@
+"""Unit tests for pydecider.publisher
+"""
+
+import os
+import sys
+import unittest
+
+sys.path.append(
+    os.path.realpath(
+        os.path.join(
+            os.path.dirname(__file__),
+            '..'
+        )
+    )
+)
+
+import json
+import threading
+
+import mock
+
+import pydecider
+import pydecider.publisher
+
+
+class FakeBatchResults(object):
+
+    def __init__(self, results, errors):
+        self.results = results
+        self.errors = errors
+
+
+class FakeQueue(object):
+    """In-memory stand-in for `boto.sqs.queue.Queue`."""
+
+    def __init__(self, failures=()):
+        # List of message ids to fail, or exceptions to raise, one per call
+        self.failures = list(failures)
+        self.batches = []
+        self.messages = []
+
+    def write_batch(self, messages):
+        assert len(messages) <= pydecider.publisher.SQS_MAX_BATCH
+        self.batches.append(messages)
+        failure = self.failures.pop(0) if self.failures else ()
+        if isinstance(failure, Exception):
+            raise failure
+
+        results, errors = [], []
+        for (msg_id, body, _delay) in messages:
+            if msg_id in failure:
+                errors.append({'id': msg_id, 'sender_fault': 'false'})
+            else:
+                results.append({'id': msg_id})
+                self.messages.append(json.loads(body))
+        return FakeBatchResults(results, errors)
+
+
+class BatchPublisherTest(unittest.TestCase):
+
+    def _publisher(self, queue):
+        return pydecider.publisher.BatchPublisher(queue, retry_delay=0)
+
+    def test_publish_batches(self):
+        queue = FakeQueue()
+        publisher = self._publisher(queue)
+        publisher.publish([{'n': n} for n in range(25)])
+        publisher.close()
+
+        self.assertEqual(queue.messages, [{'n': n} for n in range(25)])
+        self.assertTrue(len(queue.batches) >= 3)
+        self.assertEqual(publisher.counters['published'], 25)
+
+    def test_publish_retry(self):
+        queue = mock.Mock()
+        queue.write_batch.side_effect = [
+            Exception('Network down'),
+            FakeBatchResults([{'id': '1'}], []),
+        ]
+        publisher = self._publisher(queue)
+        publisher.publish([{'n': 1}])
+        publisher.flush()
+
+        self.assertEqual(queue.write_batch.call_count, 2)
+        self.assertEqual(publisher.counters['published'], 1)
+        self.assertEqual(publisher.counters['retries'], 1)
+        self.assertEqual(publisher.counters['failed'], 0)
+        publisher.close()
+
+    def test_publish_partial_retry(self):
+        started = threading.Event()
+        release = threading.Event()
+        batches = []
+
+        def write_batch(messages):
+            batches.append([msg_id for (msg_id, _, _) in messages])
+            if len(batches) == 1:
+                # Hold the sender until the next messages are all queued
+                started.set()
+                release.wait(5)
+            failed = ['2'] if len(batches) == 2 else []
+            return FakeBatchResults(
+                [{'id': msg_id} for msg_id in batches[-1]
+                 if msg_id not in failed],
+                [{'id': msg_id, 'sender_fault': 'false'}
+                 for msg_id in failed]
+            )
+
+        queue = mock.Mock()
+        queue.write_batch.side_effect = write_batch
+        publisher = self._publisher(queue)
+        publisher.publish([{'n': 0}])
+        self.assertTrue(started.wait(5))
+        publisher.publish([{'n': 1}, {'n': 2}])
+        release.set()
+        publisher.flush()
+
+        # Only the message that failed is resent
+        self.assertEqual(queue.write_batch.call_count, 3)
+        self.assertEqual(batches, [['1'], ['2', '3'], ['2']])
+        self.assertEqual(publisher.counters['published'], 3)
+        self.assertEqual(publisher.counters['retries'], 1)
+        self.assertEqual(publisher.counters['failed'], 0)
+        publisher.close()
+
+    def test_publish_give_up(self):
+        queue = FakeQueue(failures=[['1']] * 4)
+        publisher = self._publisher(queue)
+        publisher.publish([{'n': 1}])
+        publisher.close()
+
+        self.assertEqual(queue.messages, [])
+        self.assertEqual(len(queue.batches), 4)
+        self.assertEqual(publisher.counters['failed'], 1)
+
+
+if __name__ == '__main__':
+    import logging
+    logging.basicConfig(level=logging.DEBUG)
+    unittest.main()
@@ -0,0 +1,72 @@
+"""Unit tests for pydecider.replay
+"""
+
+import os
+import sys
+import unittest
+
+sys.path.append(
+    os.path.realpath(
+        os.path.join(
+            os.path.dirname(__file__),
+            '..'
+        )
+    )
+)
+
+import json
+import shutil
+import tempfile
+
+import yaml
+
+import pydecider
+import pydecider.plan
+import pydecider.replay
+
+
+class ReplayTest(unittest.TestCase):
+    MY_DIR = os.path.realpath(os.path.dirname(__file__))
+
+    def setUp(self):
+        with open(os.path.join(self.MY_DIR, 'plan_hello.yml')) as f:
+            self.plan = pydecider.plan.Plan.from_data(yaml.load(f))
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+
+    def test_load_histories(self):
+        events = pydecider.replay.load_history(
+            os.path.join(self.MY_DIR, 'plan_hello_events.yml')
+        )
+        with open(os.path.join(self.tmpdir, 'run.json'), 'w') as f:
+            json.dump(list(reversed(events)), f)
+        with open(os.path.join(self.tmpdir, 'README'), 'w') as f:
+            f.write('Not a history')
+
+        histories = pydecider.replay.load_histories([self.tmpdir])
+        self.assertEqual([name for (name, _) in histories], ['run.json'])
+        self.assertEqual(histories[0][1], events)
+        self.assertEqual(pydecider.replay.decision_points(events),
+                         [3, 6, 9, 15, 21])
+
+    def test_replay(self):
+        events = pydecider.replay.load_history(
+            os.path.join(self.MY_DIR, 'plan_hello_events.yml')
+        )
+        full = pydecider.replay.replay(self.plan, [('run', events)])
+        self.assertEqual(full.decisions, 5)
+        self.assertEqual(full.events, 3 + 6 + 9 + 15 + 21)
+
+        incremental = pydecider.replay.replay(self.plan, [('run', events)],
+                                              state_cache_size=1)
+        self.assertEqual(incremental.decisions, 5)
+        self.assertEqual(incremental.events, 21)
+        summary = incremental.summary()
+        self.assertTrue(summary['latency_p50'] <= summary['latency_p99'])
+        self.assertEqual(summary['counters']['replay_incremental'], 4)
+
+
+if __name__ == '__main__':
+    import logging
+    logging.basicConfig(level=logging.DEBUG)
+    unittest.main()
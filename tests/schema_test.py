@@ -0,0 +1,113 @@
+"""Unit tests for pydecider.schema
+"""
+
+import os
+import sys
+import unittest
+
+sys.path.append(
+    os.path.realpath(
+        os.path.join(
+            os.path.dirname(__file__),
+            '..'
+        )
+    )
+)
+
+import jsonschema
+
+import pydecider
+import pydecider.schema
+
+
+class SchemaValidatorTest(unittest.TestCase):
+    SPEC = {
+        'type': 'object',
+        'properties': {
+            'name': {'type': 'string', 'minLength': 1, 'pattern': '^[a-z]'},
+            'count': {'type': 'integer', 'minimum': 0,
+                      'exclusiveMinimum': True},
+            'ratio': {'type': ['number', 'null'], 'maximum': 1},
+            'mode': {'enum': ['fast', 'slow', True]},
+            'tags': {'type': 'array', 'items': {'type': 'string'},
+                     'maxItems': 2},
+        },
+        'required': ['name'],
+        'additionalProperties': False,
+    }
+
+    VALUES = [
+        {'name': 'a'},
+        {'name': 'abc', 'count': 3, 'ratio': 0.5, 'mode': 'fast',
+         'tags': ['x', 'y']},
+        {'name': u'unicode', 'ratio': None, 'mode': True},
+        {},
+        {'name': ''},
+        {'name': 'Abc'},
+        {'name': 'a', 'count': 0},
+        {'name': 'a', 'count': 1.5},
+        {'name': 'a', 'count': True},
+        {'name': 'a', 'ratio': 2},
+        {'name': 'a', 'mode': 'other'},
+        {'name': 'a', 'mode': 1},
+        {'name': 'a', 'tags': ['x', 1]},
+        {'name': 'a', 'tags': ['x', 'y', 'z']},
+        {'name': 'a', 'other': 1},
+        ['name'],
+        None,
+    ]
+
+    def test_cached(self):
+        validator = pydecider.schema.compile_schema(self.SPEC)
+        self.assertIs(
+            pydecider.schema.compile_schema(dict(self.SPEC)),
+            validator
+        )
+
+    def test_invalid_schema(self):
+        self.assertRaises(pydecider.schema.SchemaError,
+                          pydecider.schema.SchemaValidator,
+                          {'type': 'unknown'})
+
+    def test_fast_validator(self):
+        (reference, fast) = pydecider.schema.compile_schema(self.SPEC)
+        self.assertIsNotNone(fast)
+
+        validator = pydecider.schema.SchemaValidator(self.SPEC)
+        for value in self.VALUES:
+            if reference.is_valid(value):
+                self.assertTrue(validator.validate(value))
+            else:
+                # The fast path never accepts invalid values
+                self.assertFalse(fast(value), value)
+                self.assertRaises(pydecider.schema.ValidationError,
+                                  validator.validate, value)
+
+        self.assertEqual(
+            [value for value in self.VALUES if fast(value)],
+            self.VALUES[:3]
+        )
+        # Stricter than jsonschema, which matches `1` with `True`
+        self.assertTrue(validator.validate({'name': 'a', 'mode': 1}))
+
+    def test_not_compilable(self):
+        spec = {
+            'type': 'object',
+            'properties': {
+                'value': {'oneOf': [{'type': 'string'}, {'type': 'null'}]},
+            },
+        }
+        (reference, fast) = pydecider.schema.compile_schema(spec)
+        self.assertIsInstance(reference, jsonschema.Draft4Validator)
+        self.assertIsNone(fast)
+
+        validator = pydecider.schema.SchemaValidator(spec)
+        self.assertTrue(validator.validate({'value': None}))
+        self.assertRaises(pydecider.schema.ValidationError,
+                          validator.validate, {'value': 1})
+
+
+if __name__ == '__main__':
+    import logging
+    logging.basicConfig(level=logging.DEBUG)
+    unittest.main()
@@ -0,0 +1,202 @@
+"""Unit tests for pydecider.snapshot
+"""
+
+import os
+import sys
+import unittest
+
+sys.path.append(
+    os.path.realpath(
+        os.path.join(
+            os.path.dirname(__file__),
+            '..'
+        )
+    )
+)
+
+import json
+import shutil
+import tempfile
+
+import yaml
+
+import pydecider
+import pydecider.plan
+import pydecider.plan_registry
+import pydecider.snapshot
+import pydecider.state_machine
+from pydecider.compact_state import CompactState
+from pydecider.state import State
+
+
+class SnapshotTest(unittest.TestCase):
+    MY_DIR = os.path.realpath(os.path.dirname(__file__))
+
+    def setUp(self):
+        with open(os.path.join(self.MY_DIR, 'plan_hello.yml')) as f:
+            self.plan = pydecider.plan.Plan.from_data(yaml.load(f))
+        with open(os.path.join(self.MY_DIR, 'plan_hello_events.yml')) as f:
+            self.events = yaml.load(f)['events']
+
+    def test_snapshot_roundtrip(self):
+        for state_class in (State, CompactState):
+            statemachine = pydecider.state_machine.StateMachine(
+                self.plan, compact_state=state_class is CompactState
+            )
+            statemachine.eval(self.events[:13])
+            data = statemachine.snapshot()
+            run = statemachine.restore(data)
+
+            self.assertTrue(isinstance(run.state, state_class))
+            self.assertEqual(run.last_event_id, 13)
+            self.assertEqual(run.event_ids, {11: 'saying_hi'})
+            self.assertEqual(run.state.dump(), statemachine.state.dump())
+
+    def test_snapshot_invalid(self):
+        statemachine = pydecider.state_machine.StateMachine(self.plan)
+        self.assertRaises(pydecider.snapshot.SnapshotError,
+                          statemachine.snapshot)
+        statemachine.eval(self.events[:3])
+        data = statemachine.snapshot()
+
+        for bad_data in ['', data[:-4], 'XXXX' + data[4:]]:
+            self.assertRaises(pydecider.snapshot.SnapshotError,
+                              statemachine.restore, bad_data)
+
+        other_plan = pydecider.plan.Plan(
+            name='other', version='1.0',
+            default_execution_start_to_close_timeout='60',
+            default_task_start_to_close_timeout='60',
+        )
+        self.assertRaises(pydecider.snapshot.SnapshotError,
+                          pydecider.snapshot.load_snapshot,
+                          other_plan, data, State)
+
+    def test_snapshot_changed_plan(self):
+        """Snapshots of a reloaded plan with the same graph are refused."""
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        with open(os.path.join(self.MY_DIR, 'plan_hello.yml')) as f:
+            plan_data = yaml.load(f)
+        plan_path = os.path.join(tmpdir, 'plan_hello.json')
+        with open(plan_path, 'w') as plan_file:
+            json.dump(plan_data, plan_file)
+        os.utime(plan_path, (1000, 1000))
+        registry = pydecider.plan_registry.PlanRegistry.from_paths(
+            [plan_path]
+        )
+        statemachine = pydecider.state_machine.StateMachine(
+            registry.get('HelloWorkFlow', '1.0')
+        )
+        statemachine.eval(self.events[:13])
+        data = statemachine.snapshot()
+
+        # Same name, version and graph, other outputs
+        plan_data['activities'][0]['outputs_spec'] = {'raw': '$'}
+        with open(plan_path, 'w') as plan_file:
+            json.dump(plan_data, plan_file)
+        os.utime(plan_path, (2000, 2000))
+        self.assertEqual(len(registry.reload()), 1)
+        new_plan = registry.get('HelloWorkFlow', '1.0')
+        self.assertEqual(new_plan.graph.fingerprint,
+                         statemachine.plan.graph.fingerprint)
+
+        statemachine = pydecider.state_machine.StateMachine(new_plan)
+        self.assertRaises(pydecider.snapshot.SnapshotError,
+                          statemachine.restore, data)
+        # Full replay, with the new outputs
+        statemachine.eval(self.events[:13])
+        run = statemachine.restore(statemachine.snapshot())
+        self.assertEqual(run.last_event_id, 13)
+
+    def test_snapshot_resume(self):
+        """A new state machine only applies the events after the snapshot."""
+        store = pydecider.snapshot.MemoryStore()
+        statemachine = pydecider.state_machine.StateMachine(
+            self.plan, snapshot_store=store
+        )
+        statemachine.eval(self.events[:13], run_id='run1')
+        self.assertEqual(statemachine.counters['snapshots_saved'], 1)
+
+        statemachine = pydecider.state_machine.StateMachine(
+            self.plan, snapshot_store=store
+        )
+        self.assertEqual(statemachine.last_event_id('run1'), 13)
+        results = statemachine.eval(self.events[:13], run_id='run1')
+        self.assertEqual(statemachine.counters['replay_incremental'], 1)
+        # Without a state cache, the run is only restored once
+        self.assertEqual(statemachine.counters['snapshots_restored'], 1)
+        self.assertEqual(statemachine.counters['events_applied'], 0)
+        self.assertEqual([result.name for result in results],
+                         ['saying_hi_again'])
+
+        statemachine.eval(self.events, run_id='run1')
+        self.assertTrue(statemachine.is_succeeded)
+        self.assertEqual(statemachine.counters['replay_full'], 0)
+        # Completed runs are removed from the store
+        self.assertEqual(store.snapshots, {})
+
+    def test_checkpoint_encoding(self):
+        statemachine = pydecider.state_machine.StateMachine(self.plan)
+        statemachine.eval(self.events[:13])
+        data = statemachine.snapshot()
+
+        context = pydecider.snapshot.encode_checkpoint(data)
+        self.assertEqual(pydecider.snapshot.decode_checkpoint(context), data)
+        self.assertEqual(pydecider.snapshot.snapshot_event_id(data), 13)
+        for other_context in [None, '', 'user context']:
+            self.assertTrue(
+                pydecider.snapshot.decode_checkpoint(other_context) is None
+            )
+        # Checkpoints must fit in the executionContext
+        self.assertTrue(
+            pydecider.snapshot.encode_checkpoint(
+                data * pydecider.snapshot.EXECUTION_CONTEXT_MAX_SIZE
+            ) is None
+        )
+
+
+class SnapshotStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+
+    def _check_store(self, store):
+        self.assertTrue(store.get(u'run/1+') is None)
+        store.put(u'run/1+', b'data1')
+        store.put('run2', b'data2')
+        self.assertEqual(store.get(u'run/1+'), b'data1')
+        store.put(u'run/1+', b'new data1')
+        self.assertEqual(store.get(u'run/1+'), b'new data1')
+        store.delete(u'run/1+')
+        store.delete(u'run/1+')
+        self.assertTrue(store.get(u'run/1+') is None)
+        self.assertEqual(store.get('run2'), b'data2')
+
+    def test_memory_store(self):
+        self._check_store(pydecider.snapshot.MemoryStore())
+
+    def test_directory_store(self):
+        path = os.path.join(self.tmpdir, 'snapshots')
+        self._check_store(pydecider.snapshot.DirectoryStore(path))
+        # Readers only see complete snapshots
+        self.assertEqual(len(os.listdir(path)), 1)
+
+    def test_mmap_store(self):
+        path = os.path.join(self.tmpdir, 'snapshots.mmap')
+        store = pydecider.snapshot.MmapStore(path, slots=64, slot_size=64)
+        self._check_store(store)
+        store.put('big', b'x' * 64)
+        self.assertTrue(store.get('big') is None)
+        store.close()
+
+        store = pydecider.snapshot.MmapStore(path, slots=64, slot_size=64)
+        self.assertEqual(store.get('run2'), b'data2')
+        store.close()
+
+
+if __name__ == '__main__':
+    import logging
+    logging.basicConfig(level=logging.DEBUG)
+    unittest.main()
@@ -21,6 +21,7 @@ import yaml
 import pydecider
 import pydecider.plan
 import pydecider.state_machine
+import pydecider.step
 
 
 class StateMachineTest(unittest.TestCase):
@@ -86,6 +87,57 @@ class StateMachineTest(unittest.TestCase):
             ]
         )
 
+    def test_workflow_scheduled_not_prepared(self):
+        """Steps already scheduled in the events do not prepare their input."""
+        with mock.patch.object(pydecider.step.ActivityStep, 'prepare',
+                               autospec=True,
+                               side_effect=lambda step, context: {}) as prep:
+            self.statemachine.eval(self.events[:13])
+        self.assertEquals(
+            [call[0][0].name for call in prep.call_args_list],
+            ['saying_hi_again']
+        )
+        # Results are derived once, after the last event
+        self.assertEquals(self.statemachine.counters['decision_passes'], 1)
+        self.assertEquals(
+            self.statemachine.counters['decision_passes_saved'], 13
+        )
+
+    def test_workflow_incremental(self):
+        """Cached runs only apply new events and give the same results."""
+        statemachine = pydecider.state_machine.StateMachine(
+            self.plan, state_cache_size=2
+        )
+        statemachine.eval(self.events[:3], run_id='run1')
+        results = statemachine.eval(self.events[:13], run_id='run1')
+        self.assertEquals(statemachine.last_event_id('run1'), 13)
+        self.assertEquals(statemachine.counters['replay_incremental'], 1)
+        self.assertEquals(statemachine.counters['events_applied'], 13)
+        self.assertEquals(
+            [(result.name, result.activity_input) for result in results],
+            [('saying_hi_again', {'who': 'world'})]
+        )
+
+        # Only the new events are needed for a cached run
+        statemachine.eval(self.events[13:], run_id='run1')
+        self.assertTrue(statemachine.is_succeeded)
+        self.assertEquals(statemachine.counters['replay_full'], 1)
+
+    def test_workflow_incremental_gap(self):
+        """A gap in the events falls back to a full replay."""
+        statemachine = pydecider.state_machine.StateMachine(
+            self.plan, state_cache_size=2
+        )
+        statemachine.eval(self.events[:3], run_id='run1')
+        results = statemachine.eval(self.events[:2] + self.events[5:13],
+                                    run_id='run1')
+        self.assertEquals(statemachine.counters['replay_gap'], 1)
+        self.assertEquals(statemachine.counters['replay_full'], 2)
+        self.assertEquals(
+            [result.name for result in results],
+            ['saying_hi_again']
+        )
+
 
 if __name__ == '__main__':
     import logging
@@ -14,61 +14,65 @@ sys.path.append(
     )
 )
 
-import collections
 import mock
 import yaml
 
 import pydecider
+import pydecider.plan_graph
 import pydecider.state
 
 
-TestParent = collections.namedtuple('TestParent', ['name', 'output'])
+def mock_step(name, requires=()):
+    step = mock.Mock()
+    step.name = name
+    step.requires = dict(
+        (parent, pydecider.state.StepStateStatus.completed)
+        for parent in requires
+    )
+    return step
 
 
 class StepStateTest(unittest.TestCase):
     def setUp(self):
-        self.mock_step = mock.Mock()
-        self.step_state = pydecider.state.StepState(step=self.mock_step,
-                                                    status='running',
-                                                    context='__test__')
+        self.mock_step = mock_step('test', requires=['foo', 'bar', 'baz'])
+        self.mock_parents = [mock_step(name) for name in ['foo', 'bar', 'baz']]
+
+    def _run_step(self, workflow_input, outputs, steps=None):
+        """Complete the parent steps with `outputs` and run the test step.
+        """
+        if steps is None:
+            steps = self.mock_parents + [self.mock_step]
+        graph = pydecider.plan_graph.PlanGraph(steps)
+        state = pydecider.state.State(graph)
+        with state('__test_update__'):
+            state.set_input(workflow_input)
+            for (name, output) in outputs:
+                state.step_update(name, 'succeeded', output, rendered=True)
+        step_state = state.step_state('test')
+        self.assertEqual(step_state.status,
+                         pydecider.state.StepStateStatus.ready)
+        step_state.run()
 
     def test_step_prepare_no_parents(self):
-        """No parents, `step.prepare` called with an empty dict."""
-        self.step_state.update('ready', '__test_update__')
-        self.mock_step.prepare.assert_called_with({})
+        """No parents, `step.prepare` called with only the workflow input."""
+        self.mock_step = mock_step('test')
+        self._run_step(None, [], steps=[self.mock_step])
+        self.mock_step.prepare.assert_called_with({'__input__': None})
 
     def test_step_prepare_parents(self):
-        """Make sure `step.prepare` is called with a dict of all the parents
-        attributes.
-        """
-        self.step_state.parents = [
-            TestParent('foo', {'a': 1}),
-            TestParent('bar', {'b': 1}),
-            TestParent('baz', {'c': 1}),
-        ]
-        self.step_state.update('ready', '__test_update__')
-        self.mock_step.prepare.assert_called_with(
-            {
-                'foo': {'a': 1},
-                'bar': {'b': 1},
-                'baz': {'c': 1},
-            }
-        )
-
-    def test_step_prepare_parents_with_input(self):
         """Make sure `step.prepare` is called with a dict of all the parents
         attributes and that the special input step in properly named.
         """
-        self.step_state.parents = [
-            TestParent('foo', {'a': 1}),
-            TestParent(pydecider.state.INIT_STEP, {'b': 1}),
-            TestParent('baz', {'c': 1}),
-        ]
-        self.step_state.update('ready', '__test_update__')
+        self._run_step({'i': 1}, [
+            ('foo', {'a': 1}),
+            ('bar', {'b': 1}),
+            ('baz', {'c': 1}),
+        ])
         self.mock_step.prepare.assert_called_with(
             {
                 'foo': {'a': 1},
-                '__input__': {'b': 1},
+                '__input__': {'i': 1},
+                'bar': {'b': 1},
                 'baz': {'c': 1},
             }
         )
@@ -77,20 +81,61 @@ class StepStateTest(unittest.TestCase):
         """Make sure `step.prepare` is called with a dict of all the parents
         attributes and parents with None as output are properly handled.
         """
-        self.step_state.parents = [
-            TestParent('foo', {'a': 1}),
-            TestParent('bar', None),
-            TestParent('baz', {'c': 1}),
-        ]
-        self.step_state.update('ready', '__test_update__')
+        self._run_step(None, [
+            ('foo', {'a': 1}),
+            ('bar', None),
+            ('baz', {'c': 1}),
+        ])
         self.mock_step.prepare.assert_called_with(
             {
                 'foo': {'a': 1},
+                '__input__': None,
                 'bar': None,
                 'baz': {'c': 1},
             }
         )
 
+    def test_step_prepare_lazy(self):
+        """`step.prepare` is not called for steps that are never run."""
+        self.mock_step = mock_step('test')
+        graph = pydecider.plan_graph.PlanGraph([self.mock_step])
+        state = pydecider.state.State(graph)
+        with state('__test_update__'):
+            state.set_input(None)
+            state.step_update('test', 'running')
+        self.assertFalse(self.mock_step.prepare.called)
+
+
+class StateTest(unittest.TestCase):
+    def setUp(self):
+        graph = pydecider.plan_graph.PlanGraph([
+            pydecider.state.DeciderStep('bar', requires=['foo']),
+            pydecider.state.DeciderStep('foo'),
+        ])
+        self.state = pydecider.state.State(graph)
+
+    def _ready_names(self):
+        return sorted(step.name for step in self.state.step_next())
+
+    def test_step_next_frontier(self):
+        """`step_next` follows the status updates of the steps."""
+        self.assertEqual(self._ready_names(), [])
+        with self.state('__test_input__'):
+            self.state.set_input({})
+        self.assertEqual(self._ready_names(), ['foo'])
+
+        with self.state('__test_running__'):
+            self.state.step_update('foo', 'running')
+        self.assertEqual(self._ready_names(), [])
+
+        with self.state('__test_completed__'):
+            self.state.step_update('foo', 'succeeded')
+        self.assertEqual(self._ready_names(), ['bar'])
+        self.assertEqual(
+            [step.name for step in self.state.step_next('foo')],
+            ['bar']
+        )
+
 
 if __name__ == '__main__':
     import logging
@@ -14,9 +14,18 @@ sys.path.append(
     )
 )
 
+import pickle
+
 import mock
 
-from pydecider.step import Step, StepDefinitionError
+from pydecider.step import (
+    INPUTS_CACHE,
+    TEMPLATES_CACHE,
+    Step,
+    StepDefinitionError,
+    precompile_template,
+    template_key,
+)
 from pydecider.state import StepStateStatus
 
 
@@ -125,6 +134,131 @@ class StepTest(unittest.TestCase):
             }
         )
 
+    def test_activity_step_precompiled(self):
+        source = ('{% if foo %}{"a": {{foo}}, "n": {{n}}}'
+                  '{% else %}null{% endif %}')
+        precompiled = precompile_template(source)
+        self.assertEquals(precompiled[0], ('foo', 'n'))
+        self.assertEquals(precompiled[1], (('foo', ()), ('n', ())))
+        self.assertIsNone(precompiled[3])
+
+        # As loaded from another process
+        TEMPLATES_CACHE.put(template_key(source),
+                            pickle.loads(pickle.dumps(precompiled)))
+        step = Step.from_data(
+            {
+                "name": "test",
+                "activity": "test1",
+                "requires": ["foo", "n"],
+                "input": source,
+            },
+            self.activities
+        )
+        self.assertEquals(step.prepare({"foo": ["x"], "n": 1}),
+                          {'a': ['x'], 'n': 1})
+        self.assertIsNone(step.prepare({"foo": None, "n": 1}))
+
+    def test_activity_step_lazy(self):
+        step_data = {
+            "name": "test",
+            "activity": "test1",
+            "requires": ["foo"],
+            "input": '{"a": {{foo}}, "b": {{bar}}}',
+        }
+        # Eager steps check the template variables when defined
+        self.assertRaises(
+            StepDefinitionError,
+            Step.from_data,
+            step_data,
+            self.activities
+        )
+
+        step = Step.from_data(step_data, self.activities, lazy=True)
+        self.assertTrue(step.input_template is None)
+        self.assertRaises(StepDefinitionError, step.prepare, {'foo': 1})
+
+        step_data['requires'].append('bar')
+        step = Step.from_data(step_data, self.activities, lazy=True)
+        self.assertEquals(step.prepare({'foo': 1, 'bar': 2}),
+                          {'a': 1, 'b': 2})
+        self.assertTrue(step.input_template is not None)
+
+    def test_activity_step_input_fallback(self):
+        step_data = {
+            "name": "test",
+            "activity": "test1",
+            "requires": ["foo"],
+            "input": ('{'
+                '"a": [{% for x in foo %}{{x}}{% if not loop.last %},'
+                '{% endif %}{% endfor %}]'
+            '}')
+        }
+
+        step = Step.from_data(step_data, self.activities)
+
+        self.assertTrue(step.compiled_input is None)
+        self.assertEquals(step.prepare({"foo": [1, 2]}), {'a': [1, 2]})
+
+    def test_activity_step_input_undefined(self):
+        step_data = {
+            "name": "test",
+            "activity": "test1",
+            "requires": ["foo"],
+            "input": '{"a": {{foo.missing}}}',
+        }
+
+        step = Step.from_data(step_data, self.activities)
+
+        self.assertTrue(step.compiled_input is not None)
+        # Jinja2 reports the undefined value
+        self.assertRaises(TypeError, step.prepare, {"foo": {}})
+
+    def test_activity_step_input_cache(self):
+        step_data = {
+            "name": "test",
+            "activity": "test1",
+            "requires": ["foo", "bar"],
+            "input": '{"a": {{foo.a}}}',
+        }
+        step = Step.from_data(step_data, self.activities)
+        check_input = self.activities['test1'].check_input
+
+        first = step.prepare({"foo": {"a": 1}, "bar": {"b": 1}})
+        self.assertEquals(first, {"a": 1})
+        self.assertEquals(check_input.call_count, 1)
+
+        # Only the variables used by the template matter
+        self.assertTrue(
+            step.prepare({"foo": {"a": 1}, "bar": {"b": 2}}) is first
+        )
+        self.assertEquals(check_input.call_count, 1)
+
+        self.assertEquals(step.prepare({"foo": {"a": 2}, "bar": {"b": 2}}),
+                          {"a": 2})
+        self.assertEquals(check_input.call_count, 2)
+
+        # Nor the parts of the outputs it does not read
+        self.assertEquals(
+            step.prepare({"foo": {"a": 2, "big": ["x"] * 1000}}), {"a": 2}
+        )
+        self.assertEquals(check_input.call_count, 2)
+
+    def test_activity_step_input_cache_disabled(self):
+        step_data = {
+            "name": "test",
+            "activity": "test1",
+            "requires": ["foo"],
+            "input": '{"a": {{foo}}}',
+        }
+        step = Step.from_data(step_data, self.activities)
+        check_input = self.activities['test1'].check_input
+
+        self.addCleanup(INPUTS_CACHE.resize, INPUTS_CACHE.maxsize)
+        INPUTS_CACHE.resize(0)
+        step.prepare({"foo": 1})
+        step.prepare({"foo": 1})
+        self.assertEquals(check_input.call_count, 2)
+
 if __name__ == '__main__':
     import logging
     logging.basicConfig(level=logging.DEBUG)
@@ -0,0 +1,66 @@
+"""Unit tests for pydecider.supervisor
+"""
+
+import os
+import sys
+import unittest
+
+sys.path.append(
+    os.path.realpath(
+        os.path.join(
+            os.path.dirname(__file__),
+            '..'
+        )
+    )
+)
+
+import shutil
+import tempfile
+import threading
+import time
+
+import mock
+
+import pydecider
+import pydecider.supervisor
+
+
+class SupervisorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+
+    def _worker(self):
+        # Record this worker and die shortly after
+        open(os.path.join(self.tmpdir, str(os.getpid())), 'w').close()
+        time.sleep(0.05)
+
+    def test_supervisor_restart(self):
+        """Dead workers are replaced until the supervisor is stopped."""
+        supervisor = pydecider.supervisor.Supervisor(
+            self._worker, processes=2,
+            restart_delay=0.01, poll_interval=0.01, shutdown_timeout=5
+        )
+
+        def stop_when_restarted():
+            deadline = time.time() + 10
+            while len(os.listdir(self.tmpdir)) < 4 and time.time() < deadline:
+                time.sleep(0.01)
+            supervisor.stop()
+
+        stopper = threading.Thread(target=stop_when_restarted)
+        stopper.start()
+        with mock.patch.object(pydecider.supervisor.Supervisor,
+                               '_install_signal_handlers'):
+            supervisor.run()
+        stopper.join()
+
+        self.assertTrue(len(os.listdir(self.tmpdir)) >= 4)
+        self.assertEqual(supervisor._workers, {})
+
+
+if __name__ == '__main__':
+    import logging
+    logging.basicConfig(level=logging.DEBUG)
+    unittest.main()
@@ -0,0 +1,255 @@
+"""Unit tests for pydecider.swf_decider
+"""
+
+import os
+import sys
+import unittest
+
+sys.path.append(
+    os.path.realpath(
+        os.path.join(
+            os.path.dirname(__file__),
+            '..'
+        )
+    )
+)
+
+import copy
+import shutil
+import tempfile
+
+import mock
+import yaml
+
+import pydecider
+import pydecider.metrics
+import pydecider.notifications
+import pydecider.plan
+import pydecider.plan_registry
+import pydecider.profiling
+import pydecider.snapshot
+import pydecider.state_machine
+import pydecider.swf_decider
+
+
+class FakeHistory(object):
+    """Serve a workflow history in pages, like `PollForDecisionTask`."""
+
+    def __init__(self, events, page_size=5, workflow_type=None):
+        self.events = events
+        self.page_size = page_size
+        self.workflow_type = workflow_type
+        self.polls = []
+
+    def poll(self, next_page_token=None, reverse_order=False):
+        self.polls.append((next_page_token, reverse_order))
+        events = list(reversed(self.events)) if reverse_order else self.events
+        start = next_page_token or 0
+        end = start + self.page_size
+        decision_task = {
+            'taskToken': 'token',
+            'previousStartedEventId': 3,
+            'workflowExecution': {'workflowId': 'wf1', 'runId': 'run1'},
+            'events': events[start:end],
+        }
+        if end < len(events):
+            decision_task['nextPageToken'] = end
+        if self.workflow_type is not None:
+            decision_task['workflowType'] = self.workflow_type
+        return decision_task
+
+
+class SWFDeciderTest(unittest.TestCase):
+    MY_DIR = os.path.realpath(os.path.dirname(__file__))
+
+    def setUp(self):
+        with open(os.path.join(self.MY_DIR, 'plan_hello.yml')) as f:
+            self.plan = pydecider.plan.Plan.from_data(yaml.load(f))
+        with open(os.path.join(self.MY_DIR, 'plan_hello_events.yml')) as f:
+            self.events = yaml.load(f)['events']
+
+        patcher = mock.patch('boto.swf.layer2.Layer1')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _decider(self, history, **kwargs):
+        if 'plans' not in kwargs:
+            kwargs['plan'] = self.plan
+        decider = pydecider.swf_decider.SWFDecider(
+            domain='test', task_list='default',
+            sink=pydecider.notifications.MemorySink(), **kwargs
+        )
+        decider.poll = history.poll
+        decider.complete = mock.Mock()
+        self.addCleanup(decider.close)
+        return decider
+
+    def test_full_history(self):
+        history = FakeHistory(self.events[:13])
+        decider = self._decider(history)
+        decider.run()
+        self.assertEqual(len(history.polls), 3)
+        self.assertEqual(decider.counters['history_events'], 13)
+        decisions = decider.complete.call_args[1]['decisions']
+        self.assertEqual(
+            [d['scheduleActivityTaskDecisionAttributes']['activityId']
+             for d in decisions._data],
+            ['saying_hi_again']
+        )
+
+        self.assertEqual(
+            [(notification['type'],
+              notification['data']['activity']['activityId'])
+             for notification in decider.sink.notifications],
+            [('ACTIVITY_SCHEDULED', 'saying_hi_again')]
+        )
+
+    def test_incremental_history(self):
+        decider = self._decider(FakeHistory(self.events[:3]),
+                                state_cache_size=10,
+                                incremental_history=True)
+        decider.run()
+
+        history = FakeHistory(self.events[:13])
+        decider.poll = history.poll
+        decider.run()
+        # Events 4 to 13 are new: 2 pages are enough
+        self.assertEqual(len(history.polls), 2)
+        self.assertTrue(all(reverse for (_, reverse) in history.polls))
+        self.assertEqual(decider.counters['history_events_skipped'], 3)
+        self.assertEqual(decider.counters['history_pages_skipped'], 1)
+        decisions = decider.complete.call_args[1]['decisions']
+        self.assertEqual(
+            [d['scheduleActivityTaskDecisionAttributes']['activityId']
+             for d in decisions._data],
+            ['saying_hi_again']
+        )
+
+    def test_incremental_history_lost_state(self):
+        decider = self._decider(FakeHistory(self.events[:3]),
+                                state_cache_size=10,
+                                incremental_history=True)
+        decider.run()
+
+        history = FakeHistory(self.events[:13])
+        decider.poll = history.poll
+        # Evict the run between the history fetch and the replay
+        decider.statemachine._runs.clear()
+        with mock.patch.object(pydecider.state_machine.StateMachine,
+                               'last_event_id', return_value=3):
+            decider.run()
+        self.assertEqual(len(history.polls), 3)
+        self.assertEqual(decider.statemachine.counters['replay_full'], 2)
+        decisions = decider.complete.call_args[1]['decisions']
+        self.assertEqual(
+            [d['scheduleActivityTaskDecisionAttributes']['activityId']
+             for d in decisions._data],
+            ['saying_hi_again']
+        )
+
+    def test_checkpoints(self):
+        """A decider without the run resumes from the executionContext."""
+        decider = self._decider(FakeHistory(self.events[:9]),
+                                checkpoints=True)
+        decider.run()
+        context = decider.complete.call_args[1]['execution_context']
+        self.assertTrue(
+            context.startswith(pydecider.snapshot.CHECKPOINT_PREFIX)
+        )
+        self.assertEqual(decider.counters['checkpoints_written'], 1)
+
+        events = copy.deepcopy(self.events[:15])
+        events[9]['decisionTaskCompletedEventAttributes'][
+            'executionContext'] = context
+        history = FakeHistory(events)
+        decider = self._decider(history, checkpoints=True,
+                                incremental_history=True)
+        decider.run()
+        # The checkpoint of eventId 9 is in the second page
+        self.assertEqual(len(history.polls), 2)
+        self.assertEqual(decider.statemachine.counters['checkpoints_restored'],
+                         1)
+        self.assertEqual(decider.statemachine.counters['replay_full'], 0)
+        self.assertEqual(decider.statemachine.counters['events_applied'], 6)
+        decisions = decider.complete.call_args[1]['decisions']
+        self.assertEqual(
+            [d['scheduleActivityTaskDecisionAttributes']['activityId']
+             for d in decisions._data],
+            ['saying_hi_again']
+        )
+
+    def test_profiler(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        profiler = pydecider.profiling.DecisionProfiler(tmpdir, every=1)
+        decider = self._decider(FakeHistory(self.events[:13]),
+                                profiler=profiler)
+
+        decider.run()
+
+        self.assertEqual(profiler.counters['saved'], 1)
+        self.assertEqual(
+            sorted(os.path.splitext(filename)[1]
+                   for filename in os.listdir(tmpdir)),
+            ['.json', '.prof']
+        )
+        self.assertTrue(decider.complete.called)
+
+    def test_plans(self):
+        with open(os.path.join(self.MY_DIR, 'plan_hello.yml')) as f:
+            plan_data = yaml.load(f)
+        plan_data['version'] = '2.0'
+        other_plan = pydecider.plan.Plan.from_data(plan_data)
+        plans = pydecider.plan_registry.PlanRegistry([self.plan, other_plan])
+        history = FakeHistory(self.events[:13], workflow_type={
+            'name': 'HelloWorkFlow', 'version': '1.0'
+        })
+        decider = self._decider(history, plans=plans, state_cache_size=10)
+
+        decider.run()
+        self.assertIs(decider.statemachine.plan, self.plan)
+        decisions = decider.complete.call_args[1]['decisions']
+        self.assertEqual(
+            [d['scheduleActivityTaskDecisionAttributes']['activityId']
+             for d in decisions._data],
+            ['saying_hi_again']
+        )
+
+        # Each workflow type has its own state machine
+        history.workflow_type = {'name': 'HelloWorkFlow', 'version': '2.0'}
+        decider.run()
+        self.assertIs(decider.statemachine.plan, other_plan)
+        self.assertEqual(sorted(decider.statemachines),
+                         [('HelloWorkFlow', '1.0'), ('HelloWorkFlow', '2.0')])
+
+        # Unknown workflow types are left to other deciders
+        decider.complete.reset_mock()
+        history.workflow_type = {'name': 'HelloWorkFlow', 'version': '3.0'}
+        decider.run()
+        self.assertFalse(decider.complete.called)
+        self.assertEqual(decider.counters['unknown_workflow_types'], 1)
+
+    def test_replay_timers(self):
+        timers = [pydecider.metrics.REGISTRY.timer(name)
+                  for name in ('replay', 'replay:HelloWorkFlow:1.0')]
+        counts = [timer.get_count() for timer in timers]
+        decider = self._decider(FakeHistory(self.events[:13]))
+        decider.run()
+        self.assertEqual([timer.get_count() for timer in timers],
+                         [count + 1 for count in counts])
+
+        # Failed replays are timed too
+        with mock.patch.object(pydecider.state_machine.StateMachine, 'eval',
+                               side_effect=KeyError('step')):
+            try:
+                decider.run()
+            except KeyError:
+                pass
+        self.assertEqual([timer.get_count() for timer in timers],
+                         [count + 2 for count in counts])
+
+
+if __name__ == '__main__':
+    import logging
+    logging.basicConfig(level=logging.DEBUG)
+    unittest.main()
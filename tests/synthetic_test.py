@@ -0,0 +1,105 @@
+"""Unit tests for pydecider.synthetic
+"""
+
+import os
+import sys
+import unittest
+
+sys.path.append(
+    os.path.realpath(
+        os.path.join(
+            os.path.dirname(__file__),
+            '..'
+        )
+    )
+)
+
+import pydecider
+import pydecider.plan
+import pydecider.replay
+import pydecider.state_machine
+import pydecider.synthetic
+
+
+class SyntheticTest(unittest.TestCase):
+
+    def test_plan_shapes(self):
+        sizes = {}
+        for shape in pydecider.synthetic.SHAPES:
+            data = pydecider.synthetic.generate_plan(shape, 10, seed=1)
+            plan = pydecider.plan.Plan.from_data(data)
+            sizes[shape] = len(plan.steps)
+
+        self.assertEqual(
+            sizes,
+            {'chain': 10, 'fanout': 12, 'diamond': 40, 'random': 10}
+        )
+        self.assertRaises(ValueError,
+                          pydecider.synthetic.generate_plan, 'star', 10)
+
+    def test_deterministic(self):
+        data = pydecider.synthetic.generate_plan('random', 20, seed=7)
+        self.assertEqual(
+            data, pydecider.synthetic.generate_plan('random', 20, seed=7)
+        )
+        self.assertEqual(
+            pydecider.synthetic.generate_history(data, seed=3),
+            pydecider.synthetic.generate_history(data, seed=3)
+        )
+        self.assertNotEqual(
+            pydecider.synthetic.generate_history(data, seed=3),
+            pydecider.synthetic.generate_history(data, seed=4)
+        )
+
+    def test_replay_decisions(self):
+        """Every completed decision of the state machine schedules the
+        activities that follow it in the synthetic history.
+        """
+        for shape in pydecider.synthetic.SHAPES:
+            for seed in range(3):
+                data = pydecider.synthetic.generate_plan(shape, 6, seed=seed)
+                plan = pydecider.plan.Plan.from_data(data)
+                events = pydecider.synthetic.generate_history(
+                    data, seed=seed, decision_timeouts=1
+                )
+                statemachine = pydecider.state_machine.StateMachine(plan)
+
+                for count in pydecider.replay.decision_points(events):
+                    results = statemachine.eval(events[:count])
+                    if (count < len(events) and
+                            events[count]['eventType'] ==
+                            'DecisionTaskTimedOut'):
+                        # The decision was lost
+                        continue
+                    scheduled = set(
+                        event['activityTaskScheduledEventAttributes']
+                        ['activityId']
+                        for event in events[count:]
+                        if event['eventType'] == 'ActivityTaskScheduled' and
+                        event['activityTaskScheduledEventAttributes']
+                        ['decisionTaskCompletedEventId'] == count + 1
+                    )
+                    self.assertEqual(
+                        set(result.name for result in results),
+                        scheduled,
+                        (shape, seed, count)
+                    )
+
+                self.assertTrue(statemachine.state.is_in_state('succeeded'),
+                                (shape, seed))
+
+    def test_progress(self):
+        data = pydecider.synthetic.generate_plan('chain', 10)
+        plan = pydecider.plan.Plan.from_data(data)
+        events = pydecider.synthetic.generate_history(data, progress=0.5)
+        self.assertEqual(events[-1]['eventType'], 'DecisionTaskStarted')
+
+        statemachine = pydecider.state_machine.StateMachine(plan)
+        statemachine.eval(events)
+        self.assertTrue(statemachine.state.is_in_state('running'))
+
+
+if __name__ == '__main__':
+    import logging
+    logging.basicConfig(level=logging.DEBUG)
+    unittest.main()